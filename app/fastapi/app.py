@@ -20,6 +20,7 @@ from config.database import (
 )
 from errors.handlers import register_exception_handlers
 from routes import api_router
+from routes.v1.ensemble import close_ensemble
 from services.db.connector import close_connections
 from sqlmodel import SQLModel
 
@@ -69,6 +70,7 @@ async def lifespan(app: FastAPI):
         except asyncio.CancelledError:
             logger.info("Database health check task cancelled successfully")
         await stop_token_refresh()
+    await close_ensemble()
     logger.info("Application shutdown complete")
     close_connections()
 
@@ -30,6 +30,22 @@ class Settings(BaseSettings):
         description="Maximum number of records that can be returned in a single request",
     )
 
+    # Stacked-ensemble inference
+    ensemble_run_id: Optional[str] = Field(
+        default=None,
+        description="MLflow run ID of the stacking task whose ensemble is served",
+    )
+
+    ensemble_max_batch_size: int = Field(
+        default=256,
+        description="Maximum number of rows gathered into one prediction batch",
+    )
+
+    ensemble_max_batch_delay_ms: float = Field(
+        default=5.0,
+        description="Maximum time a request waits for others to join its batch",
+    )
+
     # Use model_config instead of class Config
     model_config = {
         "env_file": ".env",
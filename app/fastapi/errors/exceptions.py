@@ -54,3 +54,14 @@ class ValidationError(BaseAppException):
         details: Optional[Dict[str, Any]] = None,
     ):
         super().__init__(message=message, status_code=400, details=details)
+
+
+class PredictionError(BaseAppException):
+    """Exception raised when a model fails to load or predict."""
+
+    def __init__(
+        self,
+        message: str = "Prediction failed",
+        details: Optional[Dict[str, Any]] = None,
+    ):
+        super().__init__(message=message, status_code=500, details=details)
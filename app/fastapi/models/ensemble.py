@@ -0,0 +1,50 @@
+"""
+Data models for stacked-ensemble inference.
+
+This module defines Pydantic models for prediction requests, responses and
+serving metrics.
+"""
+
+from typing import Any, Dict, Optional
+from pydantic import BaseModel, Field
+
+
+class PredictionRequest(BaseModel):
+    """Request model for a single-row prediction."""
+
+    features: Dict[str, Any] = Field(..., description="Feature values keyed by column name")
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {"features": {"age": 42, "income": 55000.0, "segment": "b"}}
+        }
+    }
+
+
+class PredictionResponse(BaseModel):
+    """Response model for a single-row prediction."""
+
+    prediction: Any = Field(..., description="The meta-learner's prediction")
+    probability: Optional[float] = Field(
+        None, description="Positive-class probability (classification only)"
+    )
+    batch_size: int = Field(..., description="Number of rows in the micro-batch")
+    run_id: str = Field(..., description="MLflow run ID of the served stack")
+
+
+class EnsembleMetricsResponse(BaseModel):
+    """Response model for serving metrics of the current worker."""
+
+    run_id: Optional[str] = Field(None, description="MLflow run ID of the served stack")
+    loaded: bool = Field(..., description="Whether the stack is loaded in this worker")
+    requests: int = Field(..., description="Predictions served")
+    batches: int = Field(..., description="Batches predicted")
+    latency_p50_ms: float = Field(..., description="Median request latency")
+    latency_p99_ms: float = Field(..., description="99th percentile request latency")
+    mean_batch_size: float = Field(..., description="Mean rows per batch")
+    rows_per_predict_second: float = Field(
+        ..., description="Rows predicted per second spent in model calls"
+    )
+    batch_size_histogram: Dict[str, int] = Field(
+        ..., description="Batch counts by power-of-two size bucket"
+    )
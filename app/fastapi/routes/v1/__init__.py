@@ -3,6 +3,7 @@
 import logging
 from fastapi import APIRouter
 
+from .ensemble import router as ensemble_router
 from .healthcheck import router as healthcheck_router
 from .lakebase import router as lakebase_router
 
@@ -16,6 +17,7 @@ def create_router(database_exists: bool = False) -> APIRouter:
     # Always include these endpoints
     router.include_router(healthcheck_router)
     router.include_router(lakebase_router)
+    router.include_router(ensemble_router)
     
     # Conditionally include database-dependent endpoints
     if database_exists:
@@ -0,0 +1,148 @@
+"""
+Endpoints for stacked-ensemble inference.
+
+This module serves the stacked ensemble logged by the stacking microservice.
+The base models and meta-learner are loaded once per worker, and concurrent
+single-row requests are gathered into micro-batches that are predicted with
+one vectorized call per model.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+
+from config.settings import Settings, get_settings
+from errors.exceptions import ConfigurationError, PredictionError
+from models.ensemble import (
+    EnsembleMetricsResponse,
+    PredictionRequest,
+    PredictionResponse,
+)
+from services.ensemble.batcher import LatencyStats, MicroBatcher
+from services.ensemble.stack import StackedEnsemble, load_stack
+
+logger = logging.getLogger(__name__)
+router = APIRouter(tags=["ensemble"])
+
+
+class _WorkerState:
+    """The stack and batcher loaded in this worker process."""
+
+    def __init__(self):
+        self.run_id: Optional[str] = None
+        self.stack: Optional[StackedEnsemble] = None
+        self.batcher: Optional[MicroBatcher] = None
+        self.stats = LatencyStats()
+        self.lock: Optional[asyncio.Lock] = None
+
+
+_state = _WorkerState()
+
+
+async def get_batcher(settings: Settings = Depends(get_settings)) -> MicroBatcher:
+    """
+    Get the micro-batcher of this worker, loading the stack on first use.
+
+    Args:
+        settings: Application settings
+
+    Returns:
+        The worker's MicroBatcher
+
+    Raises:
+        ConfigurationError: If no ensemble run ID is configured
+        PredictionError: If the stack cannot be loaded
+    """
+    run_id = settings.ensemble_run_id
+    if not run_id:
+        raise ConfigurationError(
+            message="Ensemble run ID not configured",
+            details={"setting": "ensemble_run_id"},
+        )
+
+    if _state.batcher is not None and _state.run_id == run_id:
+        return _state.batcher
+
+    if _state.lock is None:
+        _state.lock = asyncio.Lock()
+
+    async with _state.lock:
+        # Another request may have loaded the stack while we waited
+        if _state.batcher is not None and _state.run_id == run_id:
+            return _state.batcher
+
+        try:
+            stack = await asyncio.to_thread(load_stack, run_id)
+        except Exception as e:
+            raise PredictionError(
+                message=f"Failed to load stacked ensemble: {str(e)}",
+                details={"run_id": run_id},
+            )
+
+        if _state.batcher is not None:
+            await _state.batcher.stop()
+        _state.stats = LatencyStats()
+        _state.stack = stack
+        _state.run_id = run_id
+        _state.batcher = MicroBatcher(
+            stack.predict,
+            max_batch_size=settings.ensemble_max_batch_size,
+            max_delay_ms=settings.ensemble_max_batch_delay_ms,
+            stats=_state.stats,
+        )
+        logger.info(f"Serving stacked ensemble {run_id}")
+
+    return _state.batcher
+
+
+async def close_ensemble() -> None:
+    """Stop the batcher of this worker. Called on application shutdown."""
+    if _state.batcher is not None:
+        await _state.batcher.stop()
+        _state.batcher = None
+
+
+@router.post("/ensemble/predict", response_model=PredictionResponse)
+async def predict(
+    request: PredictionRequest,
+    batcher: MicroBatcher = Depends(get_batcher),
+) -> PredictionResponse:
+    """
+    Predict a single row with the stacked ensemble.
+
+    Args:
+        request: The request containing the row's features
+        batcher: The worker's micro-batcher
+
+    Returns:
+        PredictionResponse with the prediction and the size of its batch
+
+    Raises:
+        PredictionError: If the batch the row ran in failed to predict
+    """
+    try:
+        result = await batcher.predict(request.features)
+    except Exception as e:
+        raise PredictionError(
+            message=f"Failed to predict: {str(e)}",
+            details={"run_id": _state.run_id},
+        )
+
+    return PredictionResponse(run_id=_state.run_id, **result)
+
+
+@router.get("/ensemble/metrics", response_model=EnsembleMetricsResponse)
+async def metrics() -> EnsembleMetricsResponse:
+    """
+    Report latency percentiles and the batch-size histogram of this worker.
+
+    Returns:
+        EnsembleMetricsResponse with the worker's serving metrics
+    """
+    return EnsembleMetricsResponse(
+        run_id=_state.run_id,
+        loaded=_state.stack is not None,
+        **_state.stats.summary(),
+    )
@@ -0,0 +1 @@
+"""Ensemble services for serving stacked models."""
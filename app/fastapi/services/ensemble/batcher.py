@@ -0,0 +1,181 @@
+"""
+Micro-batching of concurrent prediction requests.
+
+Single-row requests are queued and gathered into batches of up to
+`max_batch_size` rows, waiting at most `max_delay_ms` after the first row
+of a batch arrives. Each batch is predicted with one vectorized call in a
+worker thread; rows arriving meanwhile form the next batch.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyStats:
+    """Rolling request latencies and a histogram of batch sizes."""
+
+    def __init__(self, window: int = 10000):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.batch_sizes: Dict[int, int] = {}
+        self.requests = 0
+        self.batches = 0
+        self.rows_predicted = 0
+        self.predict_seconds = 0.0
+
+    @staticmethod
+    def _bucket(size: int) -> int:
+        """Power-of-two bucket a batch size falls into"""
+        return 1 << (size.bit_length() - 1)
+
+    def record_request(self, seconds: float) -> None:
+        self.latencies.append(seconds)
+        self.requests += 1
+
+    def record_batch(self, size: int, seconds: float) -> None:
+        bucket = self._bucket(size)
+        self.batch_sizes[bucket] = self.batch_sizes.get(bucket, 0) + 1
+        self.batches += 1
+        self.rows_predicted += size
+        self.predict_seconds += seconds
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarize latencies and batch sizes.
+
+        Returns:
+            Dictionary with p50/p99 latency in milliseconds over the rolling
+            window, counters, and the batch-size histogram keyed by bucket
+            ("1", "2-3", "4-7", ...)
+        """
+        if self.latencies:
+            p50, p99 = np.percentile(np.fromiter(self.latencies, dtype=float), [50, 99])
+        else:
+            p50 = p99 = 0.0
+
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "latency_p50_ms": round(float(p50) * 1000, 3),
+            "latency_p99_ms": round(float(p99) * 1000, 3),
+            "mean_batch_size": round(self.rows_predicted / self.batches, 2) if self.batches else 0.0,
+            "rows_per_predict_second": (
+                round(self.rows_predicted / self.predict_seconds, 1) if self.predict_seconds else 0.0
+            ),
+            "batch_size_histogram": {
+                (str(bucket) if bucket == 1 else f"{bucket}-{2 * bucket - 1}"): count
+                for bucket, count in sorted(self.batch_sizes.items())
+            },
+        }
+
+
+class MicroBatcher:
+    """Gathers concurrent single-row predictions into vectorized batches."""
+
+    def __init__(
+        self,
+        predict_fn: Callable[[pd.DataFrame], pd.DataFrame],
+        max_batch_size: int = 256,
+        max_delay_ms: float = 5.0,
+        stats: Optional[LatencyStats] = None,
+    ):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay_ms / 1000
+        self.stats = stats or LatencyStats()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start the batching loop on the running event loop"""
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the batching loop and fail requests still queued"""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Batcher stopped"))
+        self._worker = None
+
+    async def predict(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Predict a single row as part of the next micro-batch.
+
+        Args:
+            row: Feature values keyed by column name
+
+        Returns:
+            The row's prediction, plus the size of the batch it ran in
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        await self._queue.put((row, future))
+        result = await future
+        self.stats.record_request(time.perf_counter() - started)
+        return result
+
+    async def _next_batch(self) -> List[Tuple[Dict[str, Any], asyncio.Future]]:
+        """Wait for a row, then gather more until the batch is full or the delay expires"""
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_delay
+
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    def _predict_batch(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return self.predict_fn(pd.DataFrame.from_records(rows)).to_dict(orient="records")
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            # Requests cancelled by their clients while queued are dropped
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(
+                    None, self._predict_batch, [row for row, _ in batch]
+                )
+            except Exception as e:
+                logger.error(f"Batch prediction of {len(batch)} rows failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.stats.record_batch(len(batch), time.perf_counter() - started)
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result({**result, "batch_size": len(batch)})
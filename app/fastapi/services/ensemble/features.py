@@ -0,0 +1,54 @@
+"""
+Feature transforms of a stack trained on transformed data.
+
+When the workflow has `source.features` transforms, the stacking run logs the
+fitted pipeline as `feature_pipeline.json` next to its models, together with
+the workflow's `transforms.py`. The server imports that module and applies
+the pipeline with it, so it runs the workflow's own transform code rather
+than a copy of it.
+"""
+
+import importlib.util
+import sys
+from types import ModuleType
+from typing import Any
+
+TRANSFORMS_ARTIFACT = "transforms.py"
+
+
+def import_transforms(path: str) -> ModuleType:
+    """
+    Import a `transforms.py` from its file path.
+
+    The module is registered as `ensemble_transforms`, leaving any
+    `transforms` module on the server's path alone.
+
+    Args:
+        path: Local path of the module
+
+    Returns:
+        The imported module
+    """
+    spec = importlib.util.spec_from_file_location("ensemble_transforms", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_feature_pipeline(pipeline_uri: str) -> Any:
+    """
+    Load a fitted feature pipeline logged by the workflow.
+
+    Args:
+        pipeline_uri: Artifact URI of the pipeline's `feature_pipeline.json`
+            (`model_pipeline` in the run's result metadata)
+
+    Returns:
+        The workflow's `FeaturePipeline`; its `apply` transforms raw rows
+    """
+    import mlflow
+
+    code_uri = f"{pipeline_uri.rsplit('/', 1)[0]}/{TRANSFORMS_ARTIFACT}"
+    transforms = import_transforms(mlflow.artifacts.download_artifacts(code_uri))
+    return transforms.load_pipeline(mlflow.artifacts.download_artifacts(pipeline_uri))
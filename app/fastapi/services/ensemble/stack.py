@@ -0,0 +1,152 @@
+"""
+Stacked ensemble loading and vectorized prediction.
+
+This module loads a stack logged by the stacking microservice (a
+`meta_learner` model plus `base_models.json` listing the base models)
+and predicts whole batches with one call per base model. Base models are
+the selected AutoML runs' models, or the refit models logged in the
+stacking run itself (`base_model_artifacts`, stack_blend).
+
+Layouts (`stack_layout` in the run's result metadata):
+- oof: the meta-learner takes one column per base model (positive-class
+  probability or prediction)
+- classwise: the meta-learner takes every class probability of every base
+  model, model-major (stack_classwise)
+
+Stacks trained on transformed features (`model_pipeline` in the result
+metadata) take raw rows and apply the fitted pipeline first, with the
+workflow's `transforms.py` logged next to it.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from services.ensemble.features import load_feature_pipeline
+
+logger = logging.getLogger(__name__)
+
+STACK_LAYOUTS = ["oof", "classwise"]
+
+
+class StackedEnsemble:
+    """Base models and meta-learner of a stacked ensemble."""
+
+    def __init__(self, base_models: List[Any], meta_learner: Any, task_type: str, layout: str = "oof",
+                 features: Optional[Any] = None):
+        if layout not in STACK_LAYOUTS:
+            raise ValueError(f"Unknown stack layout '{layout}', expected one of {STACK_LAYOUTS}")
+        if layout == "classwise" and task_type != "classification":
+            raise ValueError("A classwise stack must be a classification stack")
+        self.base_models = base_models
+        self.meta_learner = meta_learner
+        self.task_type = task_type
+        self.layout = layout
+        self.features = features
+
+    @property
+    def is_classifier(self) -> bool:
+        return self.task_type == "classification"
+
+    def base_predictions(self, features: pd.DataFrame) -> np.ndarray:
+        """
+        Predict a batch with every base model.
+
+        The columns match the OOF matrix the meta-learner was trained on:
+        the positive-class probability for classifiers, the prediction
+        otherwise. A classwise stack takes every class probability.
+
+        Args:
+            features: Feature rows
+
+        Returns:
+            Array of shape (n_rows, n_base_models), or
+            (n_rows, n_base_models * n_classes) for a classwise stack
+        """
+        if self.layout == "classwise":
+            return np.hstack([
+                np.asarray(model.predict_proba(features), dtype=np.float64) for model in self.base_models
+            ])
+        columns = np.empty((len(features), len(self.base_models)), dtype=np.float64)
+        for idx, model in enumerate(self.base_models):
+            if self.is_classifier:
+                columns[:, idx] = model.predict_proba(features)[:, 1]
+            else:
+                columns[:, idx] = model.predict(features)
+        return columns
+
+    def predict(self, features: pd.DataFrame) -> pd.DataFrame:
+        """
+        Predict a batch with the base models followed by the meta-learner.
+
+        Args:
+            features: Feature rows, raw if the stack has a feature pipeline
+
+        Returns:
+            DataFrame with a `prediction` column and, for classifiers,
+            a `probability` column (of the positive class, or of the
+            predicted class for a classwise stack)
+        """
+        if self.features is not None:
+            features = self.features.apply(features)
+        stacked = self.base_predictions(features)
+        result = pd.DataFrame({"prediction": self.meta_learner.predict(stacked)})
+        if self.is_classifier and hasattr(self.meta_learner, "predict_proba"):
+            probabilities = self.meta_learner.predict_proba(stacked)
+            if self.layout == "classwise":
+                result["probability"] = probabilities.max(axis=1)
+            else:
+                result["probability"] = probabilities[:, 1]
+        return result
+
+
+def base_model_uris(run_id: str, manifest: Dict[str, Any]) -> List[str]:
+    """
+    Model URIs of a stack's base models from its `base_models.json`.
+
+    Stacks whose meta-learner was fit on refit base models list them as
+    `base_model_artifacts` of the stacking run; those take precedence over
+    the AutoML runs they were refit from (`base_model_runs`).
+    """
+    if manifest.get("base_model_artifacts"):
+        return [f"runs:/{run_id}/{artifact}" for artifact in manifest["base_model_artifacts"]]
+    return [f"runs:/{base_run}/model" for base_run in manifest["base_model_runs"]]
+
+
+def load_stack(run_id: str, max_workers: Optional[int] = None) -> StackedEnsemble:
+    """
+    Load a stacked ensemble from its stacking run.
+
+    Base models are downloaded in parallel threads.
+
+    Args:
+        run_id: MLflow run ID of the stacking task
+        max_workers: Maximum number of concurrent model downloads
+
+    Returns:
+        The loaded StackedEnsemble
+    """
+    import mlflow
+
+    base_uris = base_model_uris(run_id, mlflow.artifacts.load_dict(f"runs:/{run_id}/base_models.json"))
+    try:
+        metadata = mlflow.artifacts.load_dict(f"runs:/{run_id}/result_metadata.json")
+    except Exception:
+        metadata = {}
+    task_type = metadata.get("task_type", "classification")
+    layout = metadata.get("stack_layout", "oof")
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(base_uris) or 1) as pool:
+        base_models = list(pool.map(mlflow.sklearn.load_model, base_uris))
+    meta_learner = mlflow.sklearn.load_model(f"runs:/{run_id}/meta_learner")
+    # The models were trained on transformed features: serve them through the same pipeline
+    features = None
+    if metadata.get("model_pipeline"):
+        features = load_feature_pipeline(metadata["model_pipeline"])
+
+    logger.info(f"Loaded stack {run_id}: {len(base_models)} base models, {task_type}, {layout} layout"
+                f"{', feature transform' if features is not None else ''}")
+    return StackedEnsemble(base_models, meta_learner, task_type, layout, features)
@@ -0,0 +1,328 @@
+"""Tests for the stacked-ensemble inference module."""
+
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from config.settings import Settings
+from errors.exceptions import ConfigurationError, PredictionError
+from models.ensemble import PredictionRequest
+from routes.v1 import ensemble
+from routes.v1.ensemble import get_batcher, metrics, predict
+from services.ensemble.batcher import LatencyStats, MicroBatcher
+from services.ensemble.features import import_transforms
+from services.ensemble.stack import StackedEnsemble, base_model_uris, load_stack
+
+# The workflow's transform module, as logged next to a stack's feature pipeline
+TRANSFORMS_PATH = Path(__file__).parents[5] / "ml_ensemble_microservices" / "transforms.py"
+
+
+class FakeClassifier:
+    """Classifier whose positive-class probability is a scaled feature sum."""
+
+    def __init__(self, scale=1.0):
+        self.scale = scale
+        self.calls = []
+
+    def predict_proba(self, X):
+        self.calls.append(len(X))
+        values = np.asarray(X, dtype=float)
+        positive = np.clip(values.sum(axis=1) * self.scale, 0.0, 1.0)
+        return np.column_stack([1 - positive, positive])
+
+    def predict(self, X):
+        return (self.predict_proba(X)[:, 1] > 0.5).astype(int)
+
+
+@pytest.fixture
+def stack():
+    """Create a stack of two base classifiers and a meta-learner."""
+    return StackedEnsemble(
+        base_models=[FakeClassifier(0.1), FakeClassifier(0.2)],
+        meta_learner=FakeClassifier(0.5),
+        task_type="classification",
+    )
+
+
+@pytest.fixture
+def mock_settings():
+    """Create settings with a test ensemble run ID."""
+    settings = Settings()
+    settings.ensemble_run_id = "test-run-123"
+    settings.ensemble_max_batch_size = 64
+    settings.ensemble_max_batch_delay_ms = 20.0
+    return settings
+
+
+@pytest.fixture
+def worker_state(mocker):
+    """Give each test a fresh per-worker ensemble state."""
+    state = ensemble._WorkerState()
+    mocker.patch("routes.v1.ensemble._state", state)
+    return state
+
+
+class TestStackedEnsemble:
+    """Test suite for vectorized stack prediction."""
+
+    def test_base_predictions_one_column_per_model(self, stack):
+        """Test base predictions form the meta-learner's input matrix."""
+        features = pd.DataFrame({"a": [1.0, 2.0], "b": [0.0, 1.0]})
+
+        stacked = stack.base_predictions(features)
+
+        assert stacked.shape == (2, 2)
+        np.testing.assert_allclose(stacked[:, 0], [0.1, 0.3])
+        np.testing.assert_allclose(stacked[:, 1], [0.2, 0.6])
+
+    def test_predict_calls_each_model_once_per_batch(self, stack):
+        """Test a batch runs one call per base model, then the meta-learner."""
+        features = pd.DataFrame({"a": np.ones(50), "b": np.zeros(50)})
+
+        result = stack.predict(features)
+
+        assert list(result.columns) == ["prediction", "probability"]
+        assert len(result) == 50
+        for model in stack.base_models:
+            assert model.calls == [50]
+
+    def test_predict_regression_has_no_probability(self):
+        """Test regression stacks return predictions only."""
+
+        class FakeRegressor:
+            def predict(self, X):
+                return np.asarray(X, dtype=float).sum(axis=1)
+
+        stack = StackedEnsemble([FakeRegressor(), FakeRegressor()], FakeRegressor(), "regression")
+
+        result = stack.predict(pd.DataFrame({"a": [1.0, 2.0]}))
+
+        assert list(result.columns) == ["prediction"]
+        np.testing.assert_allclose(result["prediction"], [2.0, 4.0])
+
+    def test_classwise_layout_feeds_every_class_probability(self):
+        """Test a classwise stack passes (rows, models * classes) probabilities to its meta-learner."""
+
+        class FakeClasswiseMeta:
+            def __init__(self):
+                self.inputs = []
+
+            def predict_proba(self, X):
+                self.inputs.append(np.asarray(X).shape)
+                return np.tile([0.2, 0.5, 0.3], (len(X), 1))
+
+            def predict(self, X):
+                return np.argmax(self.predict_proba(X), axis=1)
+
+        meta = FakeClasswiseMeta()
+        stack = StackedEnsemble([FakeClassifier(0.1), FakeClassifier(0.2)], meta, "classification", "classwise")
+
+        result = stack.predict(pd.DataFrame({"a": [1.0, 2.0], "b": [0.0, 1.0]}))
+
+        assert meta.inputs[0] == (2, 4)
+        assert list(result["prediction"]) == [1, 1]
+        np.testing.assert_allclose(result["probability"], [0.5, 0.5])
+
+    def test_feature_transform_runs_before_base_models(self):
+        """Test a stack trained on transformed features applies the fitted pipeline to raw rows."""
+        transforms = import_transforms(str(TRANSFORMS_PATH))
+        transform = transforms.FeaturePipeline.from_dict({
+            "columns": ["a"],
+            "specs": {"a": {"pre_scale": ["log1p", None], "scale": ["standard", None], "post_scale": ["clip", 1.0]}},
+            "center": [1.0],
+            "scale": [2.0],
+        })
+        stack = StackedEnsemble([FakeClassifier(1.0)], FakeClassifier(1.0), "classification", features=transform)
+
+        # log1p, then (x - 1) / 2, clipped to 1: `a` becomes [0, 1]
+        raw = pd.DataFrame({"a": [np.e - 1, 100.0], "b": [0.25, 0.25]})
+        result = stack.predict(raw)
+
+        np.testing.assert_allclose(result["probability"], [0.25, 1.0], atol=1e-6)
+        assert raw["a"].iloc[1] == 100.0
+
+    def test_feature_transform_rejects_missing_columns(self):
+        """Test requests without a transformed feature fail with a clear error."""
+        transforms = import_transforms(str(TRANSFORMS_PATH))
+        transform = transforms.FeaturePipeline.from_dict({"columns": ["a"], "specs": {"a": {}}, "center": [0.0], "scale": [1.0]})
+        with pytest.raises(ValueError, match="not in the data"):
+            transform.apply(pd.DataFrame({"b": [1.0]}))
+
+    def test_oof_stack_serves_the_selected_runs(self):
+        """Test an OOF stack loads the base models of the AutoML runs it selected."""
+        uris = base_model_uris("stack-run", {"base_model_runs": ["run-a", "run-b"]})
+
+        assert uris == ["runs:/run-a/model", "runs:/run-b/model"]
+
+    def test_blend_stack_serves_its_refit_base_models(self, mocker):
+        """Test a blend stack loads the refit base models its meta-learner was fit on, not the AutoML runs."""
+        artifacts = {
+            "runs:/blend-run/base_models.json": {
+                "base_model_runs": ["automl-a", "automl-b"],
+                "base_model_artifacts": ["base_model_0", "base_model_1"],
+            },
+            "runs:/blend-run/result_metadata.json": {"task_type": "classification"},
+        }
+        loaded = []
+
+        def load_model(uri):
+            loaded.append(uri)
+            return FakeClassifier()
+
+        fake_mlflow = SimpleNamespace(
+            artifacts=SimpleNamespace(load_dict=lambda uri: artifacts[uri]),
+            sklearn=SimpleNamespace(load_model=load_model),
+        )
+        mocker.patch.dict("sys.modules", {"mlflow": fake_mlflow})
+
+        stack = load_stack("blend-run")
+
+        assert sorted(loaded) == [
+            "runs:/blend-run/base_model_0", "runs:/blend-run/base_model_1", "runs:/blend-run/meta_learner"
+        ]
+        assert len(stack.base_models) == 2
+        assert stack.layout == "oof"
+
+    def test_unknown_layout_is_rejected(self):
+        """Test stacks with an unknown layout fail at load time."""
+        with pytest.raises(ValueError, match="Unknown stack layout"):
+            StackedEnsemble([FakeClassifier()], FakeClassifier(), "classification", "nested")
+
+
+class TestLatencyStats:
+    """Test suite for latency and batch-size statistics."""
+
+    def test_summary_empty(self):
+        """Test the summary of a worker that served nothing."""
+        summary = LatencyStats().summary()
+
+        assert summary["requests"] == 0
+        assert summary["latency_p50_ms"] == 0.0
+        assert summary["batch_size_histogram"] == {}
+
+    def test_summary_percentiles_and_histogram(self):
+        """Test latency percentiles and power-of-two batch buckets."""
+        stats = LatencyStats()
+        for ms in range(1, 101):
+            stats.record_request(ms / 1000)
+        for size in [1, 2, 3, 4, 7, 8, 200]:
+            stats.record_batch(size, 0.001)
+
+        summary = stats.summary()
+
+        assert summary["requests"] == 100
+        assert summary["latency_p50_ms"] == pytest.approx(50.5)
+        assert summary["latency_p99_ms"] == pytest.approx(99.01)
+        assert summary["batch_size_histogram"] == {
+            "1": 1, "2-3": 2, "4-7": 2, "8-15": 1, "128-255": 1,
+        }
+
+
+@pytest.mark.asyncio
+class TestMicroBatcher:
+    """Test suite for micro-batching of concurrent requests."""
+
+    async def test_concurrent_requests_share_a_batch(self, stack):
+        """Test concurrent single-row requests are predicted together."""
+        batcher = MicroBatcher(stack.predict, max_batch_size=64, max_delay_ms=50)
+        rows = [{"a": float(i), "b": 0.0} for i in range(10)]
+
+        results = await asyncio.gather(*(batcher.predict(row) for row in rows))
+        await batcher.stop()
+
+        assert [r["batch_size"] for r in results] == [10] * 10
+        assert stack.base_models[0].calls == [10]
+        assert results[3]["probability"] == pytest.approx(stack.predict(pd.DataFrame([rows[3]]))["probability"][0])
+
+    async def test_batches_split_at_max_batch_size(self, stack):
+        """Test batches never exceed the configured size."""
+        batcher = MicroBatcher(stack.predict, max_batch_size=4, max_delay_ms=50)
+
+        results = await asyncio.gather(*(batcher.predict({"a": 0.1, "b": 0.0}) for _ in range(10)))
+        await batcher.stop()
+
+        assert max(r["batch_size"] for r in results) == 4
+        assert sum(stack.base_models[0].calls) == 10
+        assert batcher.stats.summary()["requests"] == 10
+
+    async def test_single_request_waits_at_most_max_delay(self, stack):
+        """Test a lone request is predicted once the delay expires."""
+        batcher = MicroBatcher(stack.predict, max_batch_size=64, max_delay_ms=10)
+
+        result = await asyncio.wait_for(batcher.predict({"a": 1.0, "b": 1.0}), timeout=1.0)
+        await batcher.stop()
+
+        assert result["batch_size"] == 1
+
+    async def test_batch_failure_fails_every_request(self):
+        """Test a failing batch raises in every request it contained."""
+
+        def failing_predict(features):
+            raise ValueError("bad features")
+
+        batcher = MicroBatcher(failing_predict, max_batch_size=8, max_delay_ms=20)
+
+        results = await asyncio.gather(
+            *(batcher.predict({"a": 1.0}) for _ in range(3)), return_exceptions=True
+        )
+        await batcher.stop()
+
+        assert all(isinstance(r, ValueError) for r in results)
+
+
+@pytest.mark.asyncio
+class TestEnsembleEndpoints:
+    """Test suite for the ensemble endpoint functions."""
+
+    async def test_get_batcher_missing_run_id(self, worker_state):
+        """Test the batcher requires a configured run ID."""
+        settings = Settings()
+        settings.ensemble_run_id = None
+
+        with pytest.raises(ConfigurationError) as exc_info:
+            await get_batcher(settings=settings)
+
+        assert "Ensemble run ID not configured" in str(exc_info.value)
+
+    async def test_get_batcher_loads_stack_once(self, mock_settings, worker_state, stack, mocker):
+        """Test concurrent first requests load the stack only once per worker."""
+        load_stack = mocker.patch("routes.v1.ensemble.load_stack", return_value=stack)
+
+        batchers = await asyncio.gather(*(get_batcher(settings=mock_settings) for _ in range(5)))
+        await ensemble.close_ensemble()
+
+        load_stack.assert_called_once_with("test-run-123")
+        assert all(b is batchers[0] for b in batchers)
+        assert batchers[0].max_batch_size == 64
+
+    async def test_get_batcher_load_failure(self, mock_settings, worker_state, mocker):
+        """Test load failures surface as prediction errors."""
+        mocker.patch("routes.v1.ensemble.load_stack", side_effect=Exception("artifact not found"))
+
+        with pytest.raises(PredictionError) as exc_info:
+            await get_batcher(settings=mock_settings)
+
+        assert "Failed to load stacked ensemble" in str(exc_info.value)
+
+    async def test_predict_and_metrics(self, mock_settings, worker_state, stack, mocker):
+        """Test predictions are served and reflected in the worker's metrics."""
+        mocker.patch("routes.v1.ensemble.load_stack", return_value=stack)
+        batcher = await get_batcher(settings=mock_settings)
+
+        responses = await asyncio.gather(*(
+            predict(request=PredictionRequest(features={"a": 1.0, "b": float(i)}), batcher=batcher)
+            for i in range(3)
+        ))
+        summary = await metrics()
+        await ensemble.close_ensemble()
+
+        assert all(r.run_id == "test-run-123" for r in responses)
+        assert responses[0].prediction in (0, 1)
+        assert summary.loaded is True
+        assert summary.requests == 3
+        assert summary.batches == 1
+        assert summary.batch_size_histogram == {"2-3": 1}
@@ -0,0 +1,582 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Boost Microservice
+# MAGIC Runs on Databricks Serverless, trains histogram gradient boosting (gbm, xgboost, lightgbm, catboost) on all CPU cores with early stopping
+
+# COMMAND ----------
+
+# Get parameters from orchestrator
+dbutils.widgets.text("workflow_id", "")
+dbutils.widgets.text("task_id", "")
+dbutils.widgets.text("config", "{}")
+dbutils.widgets.text("context", "{}")
+dbutils.widgets.text("catalog", "")
+dbutils.widgets.text("schema", "")
+dbutils.widgets.text("table", "")
+dbutils.widgets.text("target", "")
+dbutils.widgets.text("upstream", "{}")
+dbutils.widgets.text("upstream_runs", "{}")
+
+import hashlib
+import json
+import os
+import resource
+import time
+import mlflow
+import pandas as pd
+import numpy as np
+from mlflow.entities import Metric
+from mlflow.tracking import MlflowClient
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import LabelEncoder
+
+from snapshots import default_cache_dir, input_version, load_frame, output_transformed, read_table
+from transforms import log_pipeline, upstream_pipeline
+
+workflow_id = dbutils.widgets.get("workflow_id")
+task_id = dbutils.widgets.get("task_id")
+config = json.loads(dbutils.widgets.get("config"))
+context = json.loads(dbutils.widgets.get("context"))
+# Results of upstream tasks: passed by the orchestrator (per-task runs, cached
+# results) or resolved from task values inside a compiled workflow job
+upstream = {
+    **json.loads(dbutils.widgets.get("upstream") or "{}"),
+    **json.loads(dbutils.widgets.get("upstream_runs") or "{}"),
+}
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Configuration
+
+# COMMAND ----------
+
+catalog = dbutils.widgets.get("catalog")
+schema = dbutils.widgets.get("schema")
+table = dbutils.widgets.get("table")
+target = dbutils.widgets.get("target")
+
+SUPPORTED_METHODS = ["gbm", "xgboost", "lightgbm", "catboost"]
+
+boost_config = config.get('boost', {})
+requested = boost_config.get('method') or ["lightgbm"]
+if isinstance(requested, str):
+    requested = [requested]
+# `[gbm xgboost ...]` in YAML is one space-separated string
+requested = [m for entry in requested for m in str(entry).split()]
+
+methods = [m for m in requested if m in SUPPORTED_METHODS]
+skipped = [m for m in requested if m not in SUPPORTED_METHODS]
+if skipped:
+    print(f"Skipping methods boost_service does not train: {skipped}")
+if not methods:
+    raise ValueError(f"No supported boost.method in {requested}, expected some of {SUPPORTED_METHODS}")
+
+n_estimators = int(boost_config.get('n_estimators', 1000))
+learning_rate = float(boost_config.get('learning_rate', 0.05))
+early_stopping_rounds = int(boost_config.get('early_stopping_rounds', 50))
+max_bin = int(boost_config.get('max_bin', 255))
+validation_fraction = float(boost_config.get('validation_fraction', 0.2))
+driver_max_rows = int(boost_config.get('driver_max_rows', 5_000_000))
+cache_dir = boost_config.get('cache_dir') or default_cache_dir(catalog, schema, "boost")
+n_threads = os.cpu_count()
+
+metric_config = context.get('metric', {})
+if 'classification' in metric_config:
+    task_type = "classification"
+    primary_metric = metric_config['classification'][0]  # First metric
+else:
+    task_type = "regression"
+    primary_metric = metric_config['regression'][0]
+
+fold_type = context.get('fold_type', ['kfold'])[0]
+
+# Use routed data from an upstream task if there is one, else the workflow's
+# sample (`context.sample`), else the source table
+routed_tables = [r['output_table'] for r in upstream.values() if r and r.get('output_table')]
+sample_tables = [r['sample_table'] for r in upstream.values() if r and r.get('sample_table')]
+input_table = (routed_tables or sample_tables or [f"{catalog}.{schema}.{table}"])[0]
+
+# At the workflow's pinned source version if the input is the source
+source = read_table(spark, input_table, upstream)
+n_rows = source.count()
+
+# The workflow's fitted feature pipeline (`source.features`): driver training
+# reads the snapshot, distributed training applies it on the executors unless
+# the input is a routed table that already holds transformed features
+pipeline = upstream_pipeline(upstream)
+apply_pipeline = pipeline is not None and not output_transformed(input_table, upstream)
+distributed = bool(boost_config.get('distributed', n_rows > driver_max_rows))
+
+print(f"Training {methods} for {task_type} on {input_table} ({n_rows} rows, "
+      f"{'distributed' if distributed else f'driver, {n_threads} threads'})")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Iteration Timing
+
+# COMMAND ----------
+
+def peak_memory_mb():
+    """Peak resident memory of this process (Linux reports KB)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class IterationTimer:
+    """Wall time and peak memory after every boosting iteration"""
+
+    def __init__(self):
+        self.seconds = []
+        self.peak_mb = []
+        self._last = time.perf_counter()
+
+    def tick(self):
+        now = time.perf_counter()
+        self.seconds.append(now - self._last)
+        self.peak_mb.append(peak_memory_mb())
+        self._last = now
+
+
+def log_iterations(method, timer):
+    """Per-iteration metrics as steps, in batches of MLflow's 1000-metric limit"""
+    run_id = mlflow.active_run().info.run_id
+    timestamp = int(time.time() * 1000)
+    metrics = []
+    for step, (seconds, peak_mb) in enumerate(zip(timer.seconds, timer.peak_mb)):
+        metrics.append(Metric(f"{method}_iteration_seconds", seconds, timestamp, step))
+        metrics.append(Metric(f"{method}_peak_memory_mb", peak_mb, timestamp, step))
+    client = MlflowClient()
+    for start in range(0, len(metrics), 1000):
+        client.log_batch(run_id, metrics=metrics[start:start + 1000])
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Binned-Dataset Cache
+# MAGIC Binned (quantized) training data is cached under `boost.cache_dir`, keyed
+# MAGIC by the input table version (the workflow's pinned version for the source),
+# MAGIC the split and the binning parameters, so a repeated configuration skips
+# MAGIC rebinning.
+
+# COMMAND ----------
+
+def cache_path(method, library_version):
+    """Cache directory of this configuration, or None if the input is not versioned"""
+    version = input_version(spark, input_table, upstream)
+    if version is None:
+        return None
+    key = json.dumps({
+        "table": input_table, "version": version, "target": target, "method": method,
+        "library": library_version, "max_bin": max_bin,
+        "validation_fraction": validation_fraction, "fold_type": fold_type, "seed": 42,
+        "features": pipeline.fingerprint() if pipeline else None,
+    }, sort_keys=True)
+    path = os.path.join(cache_dir, method, hashlib.sha256(key.encode()).hexdigest()[:16])
+    os.makedirs(path, exist_ok=True)
+    return path
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Driver Training
+# MAGIC Each library trains on all cores, stops early on the validation split and
+# MAGIC reports the validation scores used to pick the best method.
+
+# COMMAND ----------
+
+def load_split():
+    """Features and labels split into train and validation"""
+    df = load_frame(spark, input_table, upstream)
+    X = df.drop(columns=[target])
+    # Categorical dtypes are understood natively by every library
+    for column in X.columns[X.dtypes == object]:
+        X[column] = X[column].astype("category")
+    y = df[target]
+
+    if fold_type == 'time_series':
+        return train_test_split(X, y, test_size=validation_fraction, shuffle=False)
+    return train_test_split(
+        X, y, test_size=validation_fraction, random_state=42,
+        stratify=y if task_type == "classification" and fold_type == 'stratified' else None
+    )
+
+
+def objective(method, n_classes):
+    """Library-specific objective for the task"""
+    names = {
+        "xgboost": ("binary:logistic", "multi:softprob", "reg:squarederror"),
+        "lightgbm": ("binary", "multiclass", "regression"),
+        "catboost": ("Logloss", "MultiClass", "RMSE"),
+    }[method]
+    if task_type == "regression":
+        return names[2]
+    return names[0] if n_classes == 2 else names[1]
+
+
+def train_gbm(X_train, y_train, X_val, y_val, n_classes, timer):
+    from sklearn.ensemble import HistGradientBoostingClassifier, HistGradientBoostingRegressor
+
+    estimator = HistGradientBoostingClassifier if task_type == "classification" else HistGradientBoostingRegressor
+    # HistGradientBoosting has no iteration callback: it is timed as a whole,
+    # and it stops early on its own fraction of the train split
+    model = estimator(
+        max_iter=n_estimators, learning_rate=learning_rate, max_bins=min(max_bin, 255),
+        early_stopping=True, n_iter_no_change=early_stopping_rounds,
+        validation_fraction=validation_fraction, categorical_features="from_dtype", random_state=42
+    ).fit(X_train, y_train)
+    return model, model.n_iter_, lambda X: model.predict_proba(X) if task_type == "classification" else model.predict(X)
+
+
+def train_xgboost(X_train, y_train, X_val, y_val, n_classes, timer):
+    import xgboost as xgb
+
+    class TimerCallback(xgb.callback.TrainingCallback):
+        def after_iteration(self, model, epoch, evals_log):
+            timer.tick()
+            return False
+
+    path = cache_path("xgboost", xgb.__version__)
+    if path and os.path.exists(os.path.join(path, "train.buffer")):
+        print(f"  xgboost: cached DMatrix from {path}")
+        dtrain = xgb.DMatrix(os.path.join(path, "train.buffer"))
+        dval = xgb.DMatrix(os.path.join(path, "valid.buffer"))
+    else:
+        dtrain = xgb.DMatrix(X_train, y_train, enable_categorical=True, nthread=n_threads)
+        dval = xgb.DMatrix(X_val, y_val, enable_categorical=True, nthread=n_threads)
+        if path:
+            dtrain.save_binary(os.path.join(path, "train.buffer"))
+            dval.save_binary(os.path.join(path, "valid.buffer"))
+
+    params = {
+        "objective": objective("xgboost", n_classes), "tree_method": "hist", "max_bin": max_bin,
+        "eta": learning_rate, "nthread": n_threads, "seed": 42,
+    }
+    if task_type == "classification" and n_classes > 2:
+        params["num_class"] = n_classes
+
+    booster = xgb.train(
+        params, dtrain, num_boost_round=n_estimators, evals=[(dval, "validation")],
+        early_stopping_rounds=early_stopping_rounds, callbacks=[TimerCallback()], verbose_eval=False
+    )
+
+    def predict(X):
+        scores = booster.predict(xgb.DMatrix(X, enable_categorical=True),
+                                 iteration_range=(0, booster.best_iteration + 1))
+        return np.column_stack([1 - scores, scores]) if scores.ndim == 1 and task_type == "classification" else scores
+
+    return booster, booster.best_iteration + 1, predict
+
+
+def train_lightgbm(X_train, y_train, X_val, y_val, n_classes, timer):
+    import lightgbm as lgb
+
+    path = cache_path("lightgbm", lgb.__version__)
+    params = {
+        "objective": objective("lightgbm", n_classes), "max_bin": max_bin, "learning_rate": learning_rate,
+        "num_threads": n_threads, "seed": 42, "verbose": -1,
+    }
+    if task_type == "classification" and n_classes > 2:
+        params["num_class"] = n_classes
+
+    if path and os.path.exists(os.path.join(path, "train.bin")):
+        print(f"  lightgbm: cached binned Dataset from {path}")
+        dtrain = lgb.Dataset(os.path.join(path, "train.bin"), params=params)
+        dval = lgb.Dataset(os.path.join(path, "valid.bin"), reference=dtrain, params=params)
+    else:
+        dtrain = lgb.Dataset(X_train, y_train, params=params, free_raw_data=False)
+        dval = lgb.Dataset(X_val, y_val, reference=dtrain, params=params, free_raw_data=False)
+        if path:
+            dtrain.save_binary(os.path.join(path, "train.bin"))
+            dval.save_binary(os.path.join(path, "valid.bin"))
+
+    booster = lgb.train(
+        params, dtrain, num_boost_round=n_estimators, valid_sets=[dval],
+        callbacks=[lgb.early_stopping(early_stopping_rounds, verbose=False), lambda env: timer.tick()]
+    )
+
+    def predict(X):
+        scores = booster.predict(X, num_iteration=booster.best_iteration)
+        return np.column_stack([1 - scores, scores]) if scores.ndim == 1 and task_type == "classification" else scores
+
+    return booster, booster.best_iteration, predict
+
+
+def train_catboost(X_train, y_train, X_val, y_val, n_classes, timer):
+    import catboost
+    from catboost import CatBoost, Pool
+
+    class TimerCallback:
+        def after_iteration(self, info):
+            timer.tick()
+            return True
+
+    cat_features = list(X_train.columns[X_train.dtypes == "category"])
+    to_catboost = lambda X: X.astype({c: str for c in cat_features})
+
+    path = cache_path("catboost", catboost.__version__)
+    if path and os.path.exists(os.path.join(path, "train.quantized")):
+        print(f"  catboost: cached quantized Pool from {path}")
+        train_pool = Pool(f"quantized://{os.path.join(path, 'train.quantized')}")
+    else:
+        train_pool = Pool(to_catboost(X_train), y_train, cat_features=cat_features)
+        train_pool.quantize(border_count=max_bin, thread_count=n_threads)
+        if path:
+            train_pool.save(os.path.join(path, "train.quantized"))
+
+    model = CatBoost({
+        "loss_function": objective("catboost", n_classes), "iterations": n_estimators,
+        "learning_rate": learning_rate, "thread_count": -1, "random_seed": 42,
+        "early_stopping_rounds": early_stopping_rounds, "verbose": False,
+    })
+    model.fit(train_pool, eval_set=Pool(to_catboost(X_val), y_val, cat_features=cat_features),
+              callbacks=[TimerCallback()])
+
+    def predict(X):
+        prediction_type = "Probability" if task_type == "classification" else "RawFormulaVal"
+        return model.predict(to_catboost(X), prediction_type=prediction_type)
+
+    return model, model.get_best_iteration() + 1, predict
+
+
+TRAINERS = {
+    "gbm": train_gbm,
+    "xgboost": train_xgboost,
+    "lightgbm": train_lightgbm,
+    "catboost": train_catboost,
+}
+
+
+def validation_scores(scores, y_val):
+    """Validation loss used to rank methods (log loss or RMSE) and the primary metric's analogue"""
+    from sklearn.metrics import accuracy_score, log_loss, mean_squared_error, r2_score
+
+    if task_type == "classification":
+        return {"log_loss": log_loss(y_val, scores, labels=np.arange(scores.shape[1])),
+                "accuracy": accuracy_score(y_val, scores.argmax(axis=1))}
+    return {"rmse": float(np.sqrt(mean_squared_error(y_val, scores))), "r2": r2_score(y_val, scores)}
+
+
+def member_column(scores, label_encoder):
+    """What a voting task consumes: P(class 1), the predicted label, or the prediction"""
+    if task_type == "regression":
+        return scores
+    if scores.shape[1] == 2:
+        return scores[:, 1]
+    return label_encoder.inverse_transform(scores.argmax(axis=1))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Distributed Training
+# MAGIC For tables larger than the driver (`boost.driver_max_rows`, or
+# MAGIC `boost.distributed: true`) the libraries' Spark integrations train on the
+# MAGIC executors: `xgboost.spark`, SynapseML LightGBM, `catboost_spark`, and Spark
+# MAGIC ML's GBT for gbm.
+
+# COMMAND ----------
+
+def spark_features(df):
+    """Assemble the feature vector and label on the executors"""
+    from pyspark.ml import Pipeline
+    from pyspark.ml.feature import StringIndexer, VectorAssembler
+
+    string_columns = [f.name for f in df.schema.fields if f.name != target and f.dataType.simpleString() == "string"]
+    feature_columns = [f"{c}_index" if c in string_columns else c for c in df.columns if c != target]
+    stages = [StringIndexer(inputCol=c, outputCol=f"{c}_index", handleInvalid="keep") for c in string_columns]
+    if task_type == "classification":
+        stages.append(StringIndexer(inputCol=target, outputCol="label"))
+    stages.append(VectorAssembler(inputCols=feature_columns, outputCol="features", handleInvalid="keep"))
+
+    prepared = Pipeline(stages=stages).fit(df).transform(df)
+    if task_type == "regression":
+        prepared = prepared.withColumn("label", prepared[target].cast("double"))
+    return prepared
+
+
+def train_distributed(method, train_df, val_df):
+    """Fit on the executors; returns the Spark model and its validation predictions"""
+    workers = spark.sparkContext.defaultParallelism
+    classification = task_type == "classification"
+    indicated = train_df.unionByName(val_df)
+
+    if method == "xgboost":
+        from xgboost.spark import SparkXGBClassifier, SparkXGBRegressor
+
+        estimator = (SparkXGBClassifier if classification else SparkXGBRegressor)(
+            features_col="features", label_col="label", validation_indicator_col="is_val",
+            n_estimators=n_estimators, learning_rate=learning_rate, max_bin=max_bin, tree_method="hist",
+            early_stopping_rounds=early_stopping_rounds, num_workers=workers, random_state=42
+        )
+        model = estimator.fit(indicated)
+    elif method == "lightgbm":
+        from synapse.ml.lightgbm import LightGBMClassifier, LightGBMRegressor
+
+        estimator = (LightGBMClassifier if classification else LightGBMRegressor)(
+            featuresCol="features", labelCol="label", validationIndicatorCol="is_val",
+            numIterations=n_estimators, learningRate=learning_rate, maxBin=max_bin,
+            earlyStoppingRound=early_stopping_rounds, seed=42
+        )
+        model = estimator.fit(indicated)
+    elif method == "catboost":
+        import catboost_spark
+
+        estimator = (catboost_spark.CatBoostClassifier if classification else catboost_spark.CatBoostRegressor)(
+            iterations=n_estimators, learningRate=learning_rate, borderCount=max_bin,
+            earlyStoppingRounds=early_stopping_rounds, randomSeed=42
+        )
+        model = estimator.fit(
+            catboost_spark.Pool(train_df.select("features", "label")),
+            evalDatasets=[catboost_spark.Pool(val_df.select("features", "label"))]
+        )
+    else:
+        from pyspark.ml.classification import GBTClassifier
+        from pyspark.ml.regression import GBTRegressor
+
+        estimator = (GBTClassifier if classification else GBTRegressor)(
+            featuresCol="features", labelCol="label", validationIndicatorCol="is_val",
+            maxIter=n_estimators, stepSize=learning_rate, maxBins=max_bin, seed=42
+        )
+        model = estimator.fit(indicated)
+
+    return model, model.transform(val_df)
+
+
+def distributed_scores(predictions):
+    """Validation metrics from Spark evaluators"""
+    from pyspark.ml.evaluation import MulticlassClassificationEvaluator, RegressionEvaluator
+
+    if task_type == "classification":
+        evaluator = MulticlassClassificationEvaluator(labelCol="label", predictionCol="prediction")
+        return {"log_loss": evaluator.setMetricName("logLoss").evaluate(predictions),
+                "accuracy": evaluator.setMetricName("accuracy").evaluate(predictions)}
+    evaluator = RegressionEvaluator(labelCol="label", predictionCol="prediction")
+    return {"rmse": evaluator.setMetricName("rmse").evaluate(predictions),
+            "r2": evaluator.setMetricName("r2").evaluate(predictions)}
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Train and Select
+
+# COMMAND ----------
+
+mlflow.set_experiment(f"/Experiments/ensemble_{workflow_id}")
+
+rank_metric = "log_loss" if task_type == "classification" else "rmse"
+results = {}
+
+with mlflow.start_run(run_name=f"{task_id}_boost") as run:
+    
+    # Log parameters
+    mlflow.log_param("task_id", task_id)
+    mlflow.log_param("workflow_id", workflow_id)
+    mlflow.log_param("methods", ",".join(methods))
+    mlflow.log_param("distributed", distributed)
+    mlflow.log_params({"n_estimators": n_estimators, "learning_rate": learning_rate,
+                       "early_stopping_rounds": early_stopping_rounds, "max_bin": max_bin})
+    
+    output_table = f"{catalog}.{schema}.boost_predictions_{workflow_id}_{task_id}"
+    
+    if distributed:
+        from pyspark.ml.functions import vector_to_array
+        from pyspark.sql import functions as F
+        
+        prepared = spark_features(pipeline.apply_spark(source) if apply_pipeline else source).withColumn("row_id", F.monotonically_increasing_id())
+        prepared = prepared.withColumn("is_val", F.rand(seed=42) < validation_fraction).cache()
+        train_df, val_df = prepared.filter(~F.col("is_val")), prepared.filter(F.col("is_val"))
+        validation = val_df.select("row_id", target)
+        
+        for method in methods:
+            print(f"Training {method} on the executors")
+            start = time.time()
+            model, predictions = train_distributed(method, train_df, val_df)
+            fit_seconds = time.time() - start
+            
+            scores = distributed_scores(predictions)
+            if task_type == "regression":
+                member = F.col("prediction")
+            elif prepared.select("label").distinct().count() == 2:
+                member = vector_to_array("probability")[1]
+            else:
+                member = F.col("prediction")
+            validation = validation.join(predictions.select("row_id", member.alias(f"model_{method}")), "row_id")
+            
+            mlflow.log_metric(f"{method}_fit_seconds", fit_seconds)
+            mlflow.log_metric(f"{method}_driver_peak_memory_mb", peak_memory_mb())
+            mlflow.log_metrics({f"{method}_{k}": v for k, v in scores.items()})
+            mlflow.spark.log_model(model, f"model_{method}")
+            results[method] = {"fit_seconds": fit_seconds, **scores}
+            print(f"  {method}: {scores} in {fit_seconds:.1f}s")
+        
+        validation.drop("row_id").write.mode("overwrite").saveAsTable(output_table)
+        prepared.unpersist()
+    
+    else:
+        X_train, X_val, y_train, y_val = load_split()
+        label_encoder = LabelEncoder()
+        if task_type == "classification":
+            label_encoder.fit(pd.concat([y_train, y_val]))
+            y_train, y_val = label_encoder.transform(y_train), label_encoder.transform(y_val)
+            n_classes = len(label_encoder.classes_)
+        else:
+            y_train, y_val = y_train.to_numpy(), y_val.to_numpy()
+            n_classes = 0
+        
+        validation = pd.DataFrame(
+            {target: label_encoder.inverse_transform(y_val) if task_type == "classification" else y_val}
+        )
+        
+        for method in methods:
+            print(f"Training {method} on {n_threads} threads")
+            timer = IterationTimer()
+            start = time.time()
+            model, n_iterations, predict = TRAINERS[method](X_train, y_train, X_val, y_val, n_classes, timer)
+            fit_seconds = time.time() - start
+            
+            scores = validation_scores(predict(X_val), y_val)
+            validation[f"model_{method}"] = member_column(predict(X_val), label_encoder)
+            
+            log_iterations(method, timer)
+            mlflow.log_metric(f"{method}_fit_seconds", fit_seconds)
+            mlflow.log_metric(f"{method}_iterations", n_iterations)
+            mlflow.log_metric(f"{method}_peak_memory_mb", peak_memory_mb())
+            mlflow.log_metrics({f"{method}_{k}": v for k, v in scores.items()})
+            
+            flavor = {"gbm": mlflow.sklearn, "xgboost": mlflow.xgboost,
+                      "lightgbm": mlflow.lightgbm, "catboost": mlflow.catboost}[method]
+            flavor.log_model(model, f"model_{method}")
+            results[method] = {"fit_seconds": fit_seconds, "iterations": n_iterations, **scores}
+            print(f"  {method}: {scores} after {n_iterations} iterations in {fit_seconds:.1f}s")
+        
+        spark.createDataFrame(validation).write.mode("overwrite").saveAsTable(output_table)
+    
+    best_method = min(results, key=lambda m: results[m][rank_metric])
+    mlflow.log_param("best_method", best_method)
+    mlflow.log_param("predictions_table", output_table)
+    mlflow.log_dict(results, "boost_results.json")
+    # The models take transformed features: keep the fitted pipeline with them
+    pipeline_uri = log_pipeline(pipeline)
+    
+    result_metadata = {
+        "best_method": best_method,
+        "best_model_uri": f"runs:/{run.info.run_id}/model_{best_method}",
+        "methods": results,
+        "predictions_table": output_table,
+        "distributed": distributed,
+        "mlflow_run_id": run.info.run_id,
+        "model_pipeline": pipeline_uri,
+        "primary_metric": primary_metric,
+        "task_type": task_type
+    }
+    
+    mlflow.log_dict(result_metadata, "result_metadata.json")
+    
+    print(f"✅ Boosting complete. Best method: {best_method} ({rank_metric} {results[best_method][rank_metric]:.4f})")
+
+# COMMAND ----------
+
+# Expose the result to downstream tasks of a compiled workflow job
+dbutils.jobs.taskValues.set(key="result", value=result_metadata)
+
+dbutils.notebook.exit(json.dumps(result_metadata))
@@ -0,0 +1,653 @@
+"""
+Executor backends for the Streamlit orchestrator.
+
+An executor launches microservice notebooks and reports run status in the
+shape of the Databricks Jobs API (see `run_status`), so the orchestrator,
+poller and state store do not depend on where tasks run.
+
+Backends:
+- DatabricksExecutor: serverless job runs through the Jobs API (default)
+- LocalExecutor: runs the `*_service.py` notebooks as plain Python in a local
+  process pool, with `dbutils` shims, a local Spark session and a file-based
+  MLflow tracking URI
+"""
+
+import glob
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import runpy
+import signal
+import threading
+import time
+import traceback
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_LIFE_CYCLE_STATES = ['TERMINATED', 'SKIPPED', 'INTERNAL_ERROR']
+
+
+def run_status(run: Any) -> Dict[str, Any]:
+    """Summarize a Databricks run (and its task runs) as a plain dict"""
+    return {
+        "state": run.state.life_cycle_state.value,
+        "result_state": run.state.result_state.value if run.state.result_state else None,
+        "start_time": run.start_time,
+        "end_time": run.end_time,
+        "tasks": {
+            task_run.task_key: {
+                "run_id": task_run.run_id,
+                "state": task_run.state.life_cycle_state.value,
+                "result_state": task_run.state.result_state.value
+                if task_run.state.result_state else None,
+                "start_time": task_run.start_time,
+                "end_time": task_run.end_time,
+            }
+            for task_run in run.tasks or []
+        },
+    }
+
+
+class Executor(ABC):
+    """
+    Runs microservice notebooks for the orchestrator.
+
+    A task spec (see `StreamlitOrchestrator._task_spec`) holds the notebook
+    path, compute, timeout and upstream task keys; `params` are the widget
+    values of one run.
+    """
+
+    # Whether a whole DAG can be submitted as one run
+    supports_compiled = False
+
+    @abstractmethod
+    def run_task(self, task_key: str, spec: Dict[str, Any], params: Dict[str, str]) -> Tuple[int, int]:
+        """Start one microservice run, returning (job_id, run_id)"""
+
+    def run_workflow(
+        self,
+        tasks: List[Tuple[str, Dict[str, Any], Dict[str, str]]],
+        params: Dict[str, str],
+        timeout_seconds: int
+    ) -> Tuple[int, int]:
+        """Start a whole DAG of (task_key, spec, base_parameters) as one run"""
+        raise NotImplementedError(f"{type(self).__name__} cannot run compiled workflows")
+
+    @abstractmethod
+    def poll_runs(
+        self,
+        job_id: int,
+        run_ids: Set[int],
+        start_time_from: int
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Yield (run_id, status) for the given runs of one job"""
+
+    @abstractmethod
+    def get_run_status(self, run_id: int) -> Dict[str, Any]:
+        """Status of a single run"""
+
+    @abstractmethod
+    def run_output(self, run_id: int) -> Optional[str]:
+        """The `dbutils.notebook.exit` value of a finished task run"""
+
+    def run_error(self, run_id: int) -> Optional[str]:
+        """The error message of a failed task run, if known"""
+        return None
+
+    @abstractmethod
+    def cancel_run(self, run_id: int):
+        """Cancel a run"""
+
+    def query_one(self, statement: str) -> Optional[Dict[str, Any]]:
+        """Run a SQL statement and return its first row, if supported"""
+        return None
+
+    def collect_garbage(self):
+        """Release stale resources created by the executor"""
+
+
+class JobDefinitionCache:
+    """
+    Process-wide cache of reusable job definitions keyed by task spec hash.
+    Backed by the Jobs API, so definitions are found again after an app restart.
+
+    A definition is shared by every workflow and task with the same spec, so
+    it allows concurrent runs (the Jobs API default is one) and queues runs
+    beyond the workspace limit instead of skipping them.
+    """
+
+    NAME_PREFIX = "ensemble_def_"
+    HASH_TAG = "obsrv_spec_hash"
+    MAX_CONCURRENT_RUNS = 1000
+
+    def __init__(
+        self,
+        max_age: timedelta = timedelta(days=7),
+        gc_interval: timedelta = timedelta(hours=1)
+    ):
+        self.max_age = max_age
+        self.gc_interval = gc_interval
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._last_gc: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def spec_hash(spec: Dict[str, Any]) -> str:
+        """Stable hash of a job spec"""
+        return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+    @classmethod
+    def concurrency_settings(cls) -> Dict[str, Any]:
+        """Settings letting runs of a shared definition overlap"""
+        from databricks.sdk.service.jobs import QueueSettings
+
+        return {"max_concurrent_runs": cls.MAX_CONCURRENT_RUNS, "queue": QueueSettings(enabled=True)}
+
+    def get_or_create(
+        self,
+        w: Any,
+        spec: Dict[str, Any],
+        build_settings: Callable[[], Dict[str, Any]]
+    ) -> int:
+        """Return the job id for a spec, creating the job definition on first use"""
+        key = self.spec_hash(spec)
+
+        with self._lock:
+            entry = self._jobs.get(key)
+
+            if entry is None:
+                name = f"{self.NAME_PREFIX}{key[:16]}"
+                existing = next(iter(w.jobs.list(name=name)), None)
+
+                if existing:
+                    job_id = existing.job_id
+                    # Definitions deployed before concurrency was set run one at a time
+                    from databricks.sdk.service.jobs import JobSettings
+                    w.jobs.update(job_id=job_id, new_settings=JobSettings(**self.concurrency_settings()))
+                else:
+                    job_id = w.jobs.create(
+                        name=name,
+                        tags={self.HASH_TAG: key},
+                        **self.concurrency_settings(),
+                        **build_settings()
+                    ).job_id
+
+                entry = self._jobs[key] = {"job_id": job_id}
+
+            entry["last_used"] = time.time()
+            return entry["job_id"]
+
+    def collect_garbage(self, w: Any, force: bool = False) -> int:
+        """Delete job definitions that have not been used for `max_age`"""
+        now = time.time()
+
+        with self._lock:
+            if not force and self._last_gc and now - self._last_gc < self.gc_interval.total_seconds():
+                return 0
+            self._last_gc = now
+            last_used = {key: entry["last_used"] for key, entry in self._jobs.items()}
+
+        cutoff = now - self.max_age.total_seconds()
+        deleted = 0
+
+        for job in w.jobs.list():
+            key = ((job.settings.tags if job.settings else None) or {}).get(self.HASH_TAG)
+            if not key:
+                continue
+
+            if last_used.get(key, (job.created_time or 0) / 1000) >= cutoff:
+                continue
+
+            # Fall back to the latest run for definitions not used by this process
+            latest_run = next(iter(w.jobs.list_runs(job_id=job.job_id, limit=1)), None)
+            if latest_run and (latest_run.start_time or 0) / 1000 >= cutoff:
+                continue
+
+            w.jobs.delete(job_id=job.job_id)
+            with self._lock:
+                self._jobs.pop(key, None)
+            deleted += 1
+
+        return deleted
+
+
+class DatabricksExecutor(Executor):
+    """
+    Runs each microservice as a Databricks serverless job run. Job
+    definitions are reused per spec hash; per-run values are passed as
+    job parameters.
+    """
+
+    supports_compiled = True
+
+    def __init__(self, w: Any = None, job_definitions: Optional[JobDefinitionCache] = None):
+        from databricks.sdk import WorkspaceClient
+
+        self.w = w or WorkspaceClient()
+        self.job_definitions = job_definitions or JobDefinitionCache()
+
+    def _build_task(
+        self,
+        task_key: str,
+        spec: Dict[str, Any],
+        base_parameters: Optional[Dict[str, str]] = None
+    ) -> Any:
+        """Build the Databricks job task that runs one microservice notebook"""
+        from databricks.sdk.service.compute import ServerlessComputeType
+        from databricks.sdk.service.jobs import NotebookTask, Source, Task, TaskDependency
+
+        if spec['compute'] == "CLUSTER":
+            compute = {"existing_cluster_id": spec['existing_cluster_id']}
+        elif spec['compute'] == "GPU":
+            compute = {"compute": {"serverless_compute": ServerlessComputeType.GPU}}
+        else:
+            compute = {"compute": {"serverless_compute": ServerlessComputeType.NO_GPU}}
+
+        return Task(
+            task_key=task_key,
+            depends_on=[TaskDependency(task_key=dep) for dep in spec['depends_on']] or None,
+            notebook_task=NotebookTask(
+                notebook_path=spec['notebook_path'],
+                source=Source.WORKSPACE,
+                base_parameters=base_parameters
+            ),
+            timeout_seconds=spec['timeout_seconds'],
+            **compute
+        )
+
+    @staticmethod
+    def _parameter_definitions(params: Dict[str, str]) -> List[Any]:
+        from databricks.sdk.service.jobs import JobParameterDefinition
+
+        return [JobParameterDefinition(name=name, default="") for name in params]
+
+    def run_task(self, task_key: str, spec: Dict[str, Any], params: Dict[str, str]) -> Tuple[int, int]:
+        job_id = self.job_definitions.get_or_create(
+            self.w,
+            spec,
+            lambda: {
+                "tasks": [self._build_task(task_key, spec)],
+                "parameters": self._parameter_definitions(params),
+                "timeout_seconds": spec['timeout_seconds'] + 300,  # Add buffer
+            }
+        )
+
+        # Run the job immediately
+        run = self.w.jobs.run_now(job_id=job_id, job_parameters=params)
+
+        return job_id, run.run_id
+
+    def run_workflow(
+        self,
+        tasks: List[Tuple[str, Dict[str, Any], Dict[str, str]]],
+        params: Dict[str, str],
+        timeout_seconds: int
+    ) -> Tuple[int, int]:
+        job_id = self.job_definitions.get_or_create(
+            self.w,
+            {"tasks": {task_key: spec for task_key, spec, _ in tasks}, "timeout_seconds": timeout_seconds},
+            lambda: {
+                "tasks": [
+                    self._build_task(task_key, spec, base_parameters=base_parameters)
+                    for task_key, spec, base_parameters in tasks
+                ],
+                "parameters": self._parameter_definitions(params),
+                "timeout_seconds": timeout_seconds + 300,
+            }
+        )
+
+        run = self.w.jobs.run_now(job_id=job_id, job_parameters=params)
+
+        return job_id, run.run_id
+
+    def poll_runs(
+        self,
+        job_id: int,
+        run_ids: Set[int],
+        start_time_from: int
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Fetch status for all given runs of one job with a single list call"""
+        pending = set(run_ids)
+
+        for listed in self.w.jobs.list_runs(
+            job_id=job_id,
+            start_time_from=start_time_from,
+            expand_tasks=True
+        ):
+            if listed.run_id not in pending:
+                continue
+            pending.discard(listed.run_id)
+
+            yield listed.run_id, run_status(listed)
+
+            if not pending:
+                break
+
+    def get_run_status(self, run_id: int) -> Dict[str, Any]:
+        return run_status(self.w.jobs.get_run(run_id=run_id))
+
+    def run_output(self, run_id: int) -> Optional[str]:
+        output = self.w.jobs.get_run_output(run_id=run_id)
+        return output.notebook_output.result if output.notebook_output else None
+
+    def run_error(self, run_id: int) -> Optional[str]:
+        return self.w.jobs.get_run_output(run_id=run_id).error
+
+    def cancel_run(self, run_id: int):
+        self.w.jobs.cancel_run(run_id=run_id)
+
+    def query_one(self, statement: str) -> Optional[Dict[str, Any]]:
+        """Run a statement on the SQL warehouse set in DATABRICKS_WAREHOUSE_ID"""
+        warehouse_id = os.getenv("DATABRICKS_WAREHOUSE_ID")
+        if not warehouse_id:
+            return None
+
+        response = self.w.statement_execution.execute_statement(
+            warehouse_id=warehouse_id,
+            statement=statement,
+            wait_timeout="30s"
+        )
+        columns = [c.name for c in response.manifest.schema.columns]
+        return dict(zip(columns, response.result.data_array[0]))
+
+    def collect_garbage(self):
+        self.job_definitions.collect_garbage(self.w)
+
+
+# ---------------------------------------------------------------------------
+# Local backend
+# ---------------------------------------------------------------------------
+
+class NotebookExit(Exception):
+    """Raised by the `dbutils.notebook.exit` shim to end a notebook with a value"""
+
+    def __init__(self, value: Any):
+        super().__init__(value)
+        self.value = value
+
+
+class _Widgets:
+    def __init__(self, params: Dict[str, str]):
+        self._params = params
+        self._defaults: Dict[str, str] = {}
+
+    def text(self, name: str, defaultValue: str = "", label: Optional[str] = None):
+        self._defaults[name] = defaultValue
+
+    def get(self, name: str) -> str:
+        if name in self._params:
+            return self._params[name]
+        return self._defaults[name]
+
+    def removeAll(self):
+        self._defaults.clear()
+
+
+class _Notebook:
+    def exit(self, value: Any):
+        raise NotebookExit(value)
+
+
+class _TaskValues:
+    def __init__(self):
+        self._values: Dict[str, Any] = {}
+
+    def set(self, key: str, value: Any):
+        self._values[key] = value
+
+    def get(self, taskKey: str, key: str, default: Any = None, debugValue: Any = None) -> Any:
+        # Outside a multi-task job run, Databricks returns debugValue
+        return debugValue if debugValue is not None else default
+
+
+class _Jobs:
+    def __init__(self):
+        self.taskValues = _TaskValues()
+
+
+class LocalDbutils:
+    """The subset of `dbutils` used by the microservice notebooks"""
+
+    def __init__(self, params: Dict[str, str]):
+        self.widgets = _Widgets(params)
+        self.notebook = _Notebook()
+        self.jobs = _Jobs()
+
+
+def _local_spark(work_dir: str, schema: Optional[str]) -> Any:
+    """
+    Local Spark session whose tables live in a warehouse directory shared by
+    all worker processes. Uses Delta Lake when `delta-spark` is installed.
+    """
+    from pyspark.sql import SparkSession
+
+    warehouse = os.path.join(work_dir, "warehouse")
+    builder = (
+        SparkSession.builder
+        .master("local[*]")
+        .appName("obsrv-local")
+        .config("spark.sql.warehouse.dir", warehouse)
+        .config("spark.sql.legacy.allowNonEmptyLocationInCTAS", "true")
+    )
+
+    try:
+        from delta import configure_spark_with_delta_pip
+
+        builder = configure_spark_with_delta_pip(
+            builder
+            .config("spark.sql.extensions", "io.delta.sql.DeltaSparkSessionExtension")
+            .config("spark.sql.catalog.spark_catalog", "org.apache.spark.sql.delta.catalog.DeltaCatalog")
+            .config("spark.sql.sources.default", "delta")
+        )
+    except ImportError:
+        pass
+
+    spark = builder.getOrCreate()
+
+    if schema:
+        spark.sql(f"CREATE DATABASE IF NOT EXISTS {schema}")
+
+    # The catalog is in-memory per process; register tables written by other workers
+    for db_dir in glob.glob(os.path.join(warehouse, "*.db")):
+        database = os.path.basename(db_dir)[:-3]
+        spark.sql(f"CREATE DATABASE IF NOT EXISTS {database}")
+
+        for table_dir in glob.glob(os.path.join(db_dir, "*")):
+            name = f"{database}.{os.path.basename(table_dir)}"
+            if not spark.catalog.tableExists(name):
+                source = "delta" if os.path.isdir(os.path.join(table_dir, "_delta_log")) else "parquet"
+                spark.catalog.createTable(name, path=table_dir, source=source)
+
+    return spark
+
+
+class _Timeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise _Timeout()
+
+
+def run_notebook(
+    notebook_path: str,
+    params: Dict[str, str],
+    work_dir: str,
+    timeout_seconds: int
+) -> Dict[str, Any]:
+    """Run a Databricks source notebook as plain Python (in a worker process)"""
+    start_time = int(time.time() * 1000)
+
+    os.environ["MLFLOW_TRACKING_URI"] = f"file://{os.path.join(work_dir, 'mlruns')}"
+    # Snapshots and caches default to a Volume on Databricks (see snapshots.default_cache_dir)
+    os.environ["OBSRV_CACHE_DIR"] = os.path.join(work_dir, "cache")
+    dbutils = LocalDbutils(params)
+    result, error = None, None
+
+    signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.alarm(timeout_seconds)
+    try:
+        spark = _local_spark(work_dir, params.get("schema"))
+        runpy.run_path(
+            notebook_path,
+            init_globals={"dbutils": dbutils, "spark": spark, "display": print},
+            run_name="__main__"
+        )
+        result_state = "SUCCESS"
+    except NotebookExit as e:
+        result, result_state = e.value, "SUCCESS"
+    except _Timeout:
+        result_state, error = "TIMEDOUT", f"Timed out after {timeout_seconds} seconds"
+    except Exception:
+        result_state, error = "FAILED", traceback.format_exc()
+    finally:
+        signal.alarm(0)
+
+    return {
+        "result_state": result_state,
+        "result": result,
+        "error": error,
+        "start_time": start_time,
+        "end_time": int(time.time() * 1000),
+    }
+
+
+class LocalExecutor(Executor):
+    """
+    Runs the microservice notebooks from this directory in a local process
+    pool. Tables go to a local Spark warehouse (the `catalog` parameter is
+    replaced with `spark_catalog`), MLflow logs to `{work_dir}/mlruns` and
+    snapshots and caches default to `{work_dir}/cache`.
+
+    Notebooks needing Databricks-only libraries (e.g. `databricks.automl`)
+    fail locally with the import error as the task error.
+    """
+
+    JOB_ID = 0
+    LOST_ERROR = "Run lost on restart: local runs live in the orchestrator process"
+
+    def __init__(
+        self,
+        notebook_dir: Optional[str] = None,
+        work_dir: str = "obsrv_local",
+        max_workers: Optional[int] = None,
+        catalog: str = "spark_catalog"
+    ):
+        self.notebook_dir = notebook_dir or os.path.dirname(os.path.abspath(__file__))
+        self.work_dir = os.path.abspath(work_dir)
+        self.catalog = catalog
+        # Spark does not survive fork, so workers are spawned
+        self._pool = ProcessPoolExecutor(
+            max_workers=max_workers or os.cpu_count(),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        self._runs: Dict[int, Dict[str, Any]] = {}
+        # Ids of runs persisted by an earlier process are never handed out again
+        self._run_ids = itertools.count(int(time.time() * 1000))
+        self._lock = threading.Lock()
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    def run_task(self, task_key: str, spec: Dict[str, Any], params: Dict[str, str]) -> Tuple[int, int]:
+        notebook = os.path.join(self.notebook_dir, f"{os.path.basename(spec['notebook_path'])}.py")
+        params = {**params, "catalog": self.catalog}
+
+        with self._lock:
+            run_id = next(self._run_ids)
+            self._runs[run_id] = {
+                "task_key": task_key,
+                "submitted_at": int(time.time() * 1000),
+                "future": self._pool.submit(
+                    run_notebook, notebook, params, self.work_dir, spec['timeout_seconds']
+                ),
+            }
+
+        return self.JOB_ID, run_id
+
+    def _outcome(self, future: Future) -> Dict[str, Any]:
+        if future.cancelled():
+            return {"result_state": "CANCELED", "result": None, "error": "Canceled"}
+        try:
+            return future.result()
+        except Exception as e:
+            # The worker process died (e.g. out of memory)
+            return {"result_state": "FAILED", "result": None, "error": str(e)}
+
+    def get_run_status(self, run_id: int) -> Dict[str, Any]:
+        run = self._runs.get(run_id)
+        if run is None:
+            # Submitted by an earlier process (e.g. a resumed workflow): the run died with it
+            task_status = {"state": "INTERNAL_ERROR", "result_state": None, "start_time": None, "end_time": None}
+            return {**task_status, "tasks": {}}
+
+        future = run["future"]
+        if future.done():
+            outcome = self._outcome(future)
+            task_status = {
+                "state": "TERMINATED",
+                "result_state": outcome["result_state"],
+                "start_time": outcome.get("start_time", run["submitted_at"]),
+                "end_time": outcome.get("end_time"),
+            }
+        elif future.running():
+            task_status = {"state": "RUNNING", "result_state": None, "start_time": None, "end_time": None}
+        else:
+            task_status = {"state": "PENDING", "result_state": None, "start_time": None, "end_time": None}
+
+        return {**task_status, "tasks": {run["task_key"]: {"run_id": run_id, **task_status}}}
+
+    def poll_runs(
+        self,
+        job_id: int,
+        run_ids: Set[int],
+        start_time_from: int
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        # A copy: callers stop tracking runs while consuming the generator
+        for run_id in list(run_ids):
+            yield run_id, self.get_run_status(run_id)
+
+    def run_output(self, run_id: int) -> Optional[str]:
+        run = self._runs.get(run_id)
+        if run is None or not run["future"].done():
+            return None
+        return self._outcome(run["future"])["result"]
+
+    def run_error(self, run_id: int) -> Optional[str]:
+        run = self._runs.get(run_id)
+        if run is None:
+            return self.LOST_ERROR
+        return self._outcome(run["future"])["error"] if run["future"].done() else None
+
+    def cancel_run(self, run_id: int):
+        # Only queued runs can be canceled; a running worker is left to finish
+        run = self._runs.get(run_id)
+        if run is not None:
+            run["future"].cancel()
+
+
+def create_executor() -> Executor:
+    """
+    Build the executor selected by environment variables:
+
+    - OBSRV_EXECUTOR: databricks (default) or local
+    - OBSRV_LOCAL_DIR: working directory of the local backend
+    - OBSRV_LOCAL_WORKERS: process pool size of the local backend (default: CPU count)
+    """
+    backend = os.getenv("OBSRV_EXECUTOR", "databricks").lower()
+
+    if backend == "databricks":
+        return DatabricksExecutor()
+
+    if backend == "local":
+        return LocalExecutor(
+            work_dir=os.getenv("OBSRV_LOCAL_DIR", "obsrv_local"),
+            max_workers=int(os.getenv("OBSRV_LOCAL_WORKERS", "0")) or None,
+        )
+
+    raise ValueError(f"Unknown executor backend: {backend}")
@@ -14,6 +14,8 @@ dbutils.widgets.text("catalog", "")
 dbutils.widgets.text("schema", "")
 dbutils.widgets.text("table", "")
 dbutils.widgets.text("target", "")
+dbutils.widgets.text("upstream", "{}")
+dbutils.widgets.text("upstream_runs", "{}")
 
 import json
 from sklearn.cluster import KMeans, BisectingKMeans, AgglomerativeClustering
@@ -21,10 +23,19 @@ from sklearn.mixture import GaussianMixture
 import mlflow
 import pandas as pd
 
+from snapshots import load_frame
+from transforms import log_pipeline, upstream_pipeline
+
 workflow_id = dbutils.widgets.get("workflow_id")
 task_id = dbutils.widgets.get("task_id")
 config = json.loads(dbutils.widgets.get("config"))
 context = json.loads(dbutils.widgets.get("context"))
+# Results of upstream tasks: passed by the orchestrator (per-task runs, cached
+# results) or resolved from task values inside a compiled workflow job
+upstream = {
+    **json.loads(dbutils.widgets.get("upstream") or "{}"),
+    **json.loads(dbutils.widgets.get("upstream_runs") or "{}"),
+}
 
 # COMMAND ----------
 
@@ -38,9 +49,12 @@ schema = dbutils.widgets.get("schema")
 table = dbutils.widgets.get("table")
 target = dbutils.widgets.get("target")
 
-# Load data
-table_path = f"{catalog}.{schema}.{table}"
-df = spark.table(table_path).toPandas()
+# Load the workflow's sample (`context.sample`) if there is one, else the source table
+sample_tables = [r['sample_table'] for r in upstream.values() if r and r.get('sample_table')]
+table_path = sample_tables[0] if sample_tables else f"{catalog}.{schema}.{table}"
+# Memory-mapped from the workflow's snapshot when it holds this input, and transformed
+# by the fitted feature pipeline (`source.features`) if there is one
+df = load_frame(spark, table_path, upstream)
 
 # Separate features and target
 X = df.drop(columns=[target])
@@ -58,7 +72,7 @@ print(f"Loaded {len(df)} rows from {table_path}")
 # Start MLflow run
 mlflow.set_experiment(f"/Experiments/ensemble_{workflow_id}")
 
-with mlflow.start_run(run_name=f"{task_id}_clustering"):
+with mlflow.start_run(run_name=f"{task_id}_clustering") as run:
     
     # Log parameters
     mlflow.log_param("task_id", task_id)
@@ -118,6 +132,8 @@ with mlflow.start_run(run_name=f"{task_id}_clustering"):
     
     # Save cluster model
     mlflow.sklearn.log_model(clusterer, "cluster_model")
+    # The clusterer and the output table hold transformed features: keep the fitted pipeline with them
+    pipeline_uri = log_pipeline(upstream_pipeline(upstream))
     
     print(f"✅ Clustering complete. Data saved to {output_table}")
     
@@ -126,6 +142,10 @@ with mlflow.start_run(run_name=f"{task_id}_clustering"):
         "output_table": output_table,
         "n_clusters": n_clusters_actual,
         "method": method,
+        "mlflow_run_id": run.info.run_id,
+        "model_pipeline": pipeline_uri,
+        # Readers must not transform the output table again
+        "output_transformed": pipeline_uri is not None,
         "cluster_sizes": {
             f"cluster_{i}": int((cluster_labels == i).sum()) 
             for i in range(n_clusters_actual)
@@ -142,4 +162,7 @@ with mlflow.start_run(run_name=f"{task_id}_clustering"):
 
 # COMMAND ----------
 
+# Expose the result to downstream tasks of a compiled workflow job
+dbutils.jobs.taskValues.set(key="result", value=result_metadata)
+
 dbutils.notebook.exit(json.dumps(result_metadata))
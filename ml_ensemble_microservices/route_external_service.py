@@ -0,0 +1,309 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Route External Microservice
+# MAGIC Runs on Databricks Serverless, partitions data into contiguous ranges of an ordering column (`sequence`) or random parts
+
+# COMMAND ----------
+
+# Get parameters from orchestrator
+dbutils.widgets.text("workflow_id", "")
+dbutils.widgets.text("task_id", "")
+dbutils.widgets.text("config", "{}")
+dbutils.widgets.text("context", "{}")
+dbutils.widgets.text("catalog", "")
+dbutils.widgets.text("schema", "")
+dbutils.widgets.text("table", "")
+dbutils.widgets.text("target", "")
+dbutils.widgets.text("upstream", "{}")
+dbutils.widgets.text("upstream_runs", "{}")
+
+import datetime
+import decimal
+import json
+import time
+import mlflow
+from pyspark.sql import functions as F
+
+from routing import condition_sql, segment_case, segments_manifest
+from snapshots import read_table
+
+workflow_id = dbutils.widgets.get("workflow_id")
+task_id = dbutils.widgets.get("task_id")
+config = json.loads(dbutils.widgets.get("config"))
+context = json.loads(dbutils.widgets.get("context"))
+# Results of upstream tasks: passed by the orchestrator (per-task runs, cached
+# results) or resolved from task values inside a compiled workflow job
+upstream = {
+    **json.loads(dbutils.widgets.get("upstream") or "{}"),
+    **json.loads(dbutils.widgets.get("upstream_runs") or "{}"),
+}
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Configuration
+
+# COMMAND ----------
+
+catalog = dbutils.widgets.get("catalog")
+schema = dbutils.widgets.get("schema")
+table = dbutils.widgets.get("table")
+target = dbutils.widgets.get("target")
+
+partition_config = config.get('route', {}).get('partition') or {}
+if isinstance(partition_config, str):
+    partition_config = {partition_config: {}}
+mode = "random" if "random" in partition_config and "sequence" not in partition_config else "sequence"
+mode_config = partition_config.get(mode) or {}
+
+n_ranges = int(mode_config.get('n_ranges', 5))
+relative_error = float(mode_config.get('relative_error', 0.001))
+split_factor = float(mode_config.get('split_factor', 2.0))
+full_refresh = bool(mode_config.get('full_refresh', False))
+
+# Use routed data from an upstream task if there is one, else the workflow's
+# sample (`context.sample`), else the source table
+routed_tables = [r['output_table'] for r in upstream.values() if r and r.get('output_table')]
+sample_tables = [r['sample_table'] for r in upstream.values() if r and r.get('sample_table')]
+input_table = (routed_tables or sample_tables or [f"{catalog}.{schema}.{table}"])[0]
+
+# At the workflow's pinned source version if the input is the source
+source = read_table(spark, input_table, upstream)
+
+order_types = ("timestamp", "date", "tinyint", "smallint", "int", "bigint", "float", "double", "decimal")
+column = mode_config.get('column')
+if mode == "sequence" and not column:
+    # Default: the first timestamp or date column
+    temporal = [f.name for f in source.schema.fields if f.dataType.simpleString() in ("timestamp", "date")]
+    if not temporal:
+        raise ValueError("route.partition.sequence needs a `column` to order by: the data has no timestamp or date column")
+    column = temporal[0]
+if mode == "sequence" and not source.schema[column].dataType.simpleString().startswith(order_types):
+    raise ValueError(f"Ordering column {column} must be numeric, date or timestamp")
+
+# Ranges of the same source and column are reused across workflows, so new
+# rows only extend the tail instead of rebuilding every range. A sample or
+# routed input is per workflow, and so are its ranges: sharing them would
+# rebuild the table under other workflows still reading it.
+if mode == "sequence" and input_table == f"{catalog}.{schema}.{table}":
+    output_table = mode_config.get('table') or f"{catalog}.{schema}.{table}_sequence_{column}"
+elif mode == "sequence":
+    output_table = f"{catalog}.{schema}.{table}_sequence_{column}_{workflow_id}_{task_id}"
+else:
+    output_table = f"{catalog}.{schema}.{table}_partitioned_{workflow_id}_{task_id}"
+
+print(f"Partitioning {input_table} ({mode}{f' on {column}' if mode == 'sequence' else ''}) into {output_table}")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Range Helpers
+# MAGIC Boundaries are approximate quantiles from `percentile_approx`, computed
+# MAGIC together with the column's min, max and row count in one aggregation, so
+# MAGIC the table is scanned once and never sorted. Range `i` holds
+# MAGIC `boundaries[i-1] <= column < boundaries[i]`; rows with a null ordering
+# MAGIC value go to range -1.
+
+# COMMAND ----------
+
+MANIFEST_PROPERTY = "obsrv.sequence.manifest"
+
+
+def json_value(value):
+    """Boundaries are kept as JSON values: ISO strings for dates and timestamps"""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+
+def profile(df, n):
+    """Quantile boundaries splitting df into n ranges, with min, max and count: one pass"""
+    aggregates = [F.min(column).alias("min"), F.max(column).alias("max"), F.count(F.lit(1)).alias("rows")]
+    if n > 1:
+        probabilities = [i / n for i in range(1, n)]
+        aggregates.append(F.percentile_approx(column, probabilities, int(1 / relative_error)).alias("quantiles"))
+    row = df.agg(*aggregates).first()
+    # Heavy ties can repeat a quantile: repeated boundaries would leave empty ranges
+    boundaries = sorted({json_value(q) for q in (row["quantiles"] or [])}) if n > 1 else []
+    return boundaries, json_value(row["min"]), json_value(row["max"]), row["rows"]
+
+
+def range_segments(boundaries):
+    """Ranges as routing segments, first match wins: below each boundary, then at or above the last"""
+    segments = [[{"column": column, "op": "<", "value": b}] for b in boundaries]
+    segments.append([{"column": column, "op": ">=", "value": boundaries[-1]}] if boundaries else [])
+    return segments
+
+
+def range_predicate(boundaries, range_id):
+    """Self-contained predicate of one range"""
+    bounds = []
+    if range_id > 0:
+        bounds.append(condition_sql({"column": column, "op": ">=", "value": boundaries[range_id - 1]}))
+    if range_id < len(boundaries):
+        bounds.append(condition_sql({"column": column, "op": "<", "value": boundaries[range_id]}))
+    return " AND ".join(bounds) or f"`{column}` IS NOT NULL"
+
+
+def write_ranges(df, boundaries, first_range=0, replace_from=None):
+    """Assign range_id with one CASE expression and write; optionally replace ranges from an id on"""
+    segments = range_segments(boundaries)
+    ids = F.expr(segment_case(segments))
+    # The null range keeps its id whatever the number of ranges
+    df = df.withColumn("range_id", F.when(F.col(column).isNull(), F.lit(-1)).otherwise(ids + F.lit(first_range)))
+    writer = df.write.partitionBy("range_id")
+    if replace_from is None:
+        writer.mode("overwrite").option("overwriteSchema", "true").saveAsTable(output_table)
+    else:
+        writer.mode("overwrite").option("replaceWhere", f"range_id >= {replace_from}").saveAsTable(output_table)
+
+
+def range_rows():
+    """Rows per range from the table's partition, aggregated on the executors"""
+    counts = spark.table(output_table).groupBy("range_id").count().collect()
+    return {row["range_id"]: row["count"] for row in counts}
+
+
+def read_manifest():
+    """Manifest stored on the output table by an earlier run, if any"""
+    if not spark.catalog.tableExists(output_table):
+        return None
+    rows = spark.sql(f"SHOW TBLPROPERTIES {output_table} ('{MANIFEST_PROPERTY}')").collect()
+    value = rows[0]["value"] if rows else None
+    if not value or "does not have property" in value:
+        return None
+    return json.loads(value)
+
+
+def store_manifest(manifest):
+    escaped = json.dumps(manifest).replace("\\", "\\\\").replace("'", "\\'")
+    spark.sql(f"ALTER TABLE {output_table} SET TBLPROPERTIES ('{MANIFEST_PROPERTY}' = '{escaped}')")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Partition
+# MAGIC If the output table already holds ranges of this source and column, only
+# MAGIC rows past the last seen maximum are read (the predicate is pushed down)
+# MAGIC and appended to the last range. When the last range outgrows
+# MAGIC `split_factor` times the average range, it alone is re-split at its own
+# MAGIC quantiles. Anything else (late rows, deletes, a new column) rebuilds.
+
+# COMMAND ----------
+
+mlflow.set_experiment(f"/Experiments/ensemble_{workflow_id}")
+
+with mlflow.start_run(run_name=f"{task_id}_{mode}_partitioning") as run:
+    
+    # Log parameters
+    mlflow.log_param("task_id", task_id)
+    mlflow.log_param("workflow_id", workflow_id)
+    mlflow.log_param("mode", mode)
+    mlflow.log_param("input_table", input_table)
+    
+    start = time.time()
+    
+    if mode == "random":
+        (source.withColumn("range_id", F.floor(F.rand(seed=42) * n_ranges).cast("int"))
+            .write.mode("overwrite").option("overwriteSchema", "true")
+            .partitionBy("range_id").saveAsTable(output_table))
+        manifest = {"mode": mode, "n_ranges": n_ranges, "source": input_table}
+        incremental = False
+    
+    else:
+        mlflow.log_param("column", column)
+        previous = None if full_refresh else read_manifest()
+        if previous and (previous.get("source") != input_table or previous.get("column") != column):
+            previous = None
+        
+        source_rows = source.count()
+        new_rows = 0
+        incremental = False
+        
+        if previous and previous["max"] is not None:
+            # Rows are only appended past the last maximum if the rest of the source is unchanged
+            tail = source.where(F.col(column) > F.lit(previous["max"]))
+            _, _, tail_max, new_rows = profile(tail, 1)
+            incremental = previous["rows"] + new_rows == source_rows
+        
+        if incremental:
+            boundaries = previous["boundaries"]
+            last_range = len(boundaries)
+            if new_rows:
+                tail.withColumn("range_id", F.lit(last_range)).write.mode("append").saveAsTable(output_table)
+            
+            sizes = range_rows()
+            average = (source_rows - sizes.get(-1, 0)) / (last_range + 1)
+            if sizes.get(last_range, 0) > split_factor * average:
+                # Re-split only the last range, at its own quantiles
+                last = spark.table(output_table).where(F.col("range_id") == last_range).drop("range_id")
+                n_split = max(2, round(sizes[last_range] / average))
+                split_boundaries, _, _, _ = profile(last, n_split)
+                write_ranges(last, split_boundaries, first_range=last_range, replace_from=last_range)
+                boundaries = boundaries + split_boundaries
+                print(f"Last range split into {len(split_boundaries) + 1} ranges")
+            
+            value_min, value_max = previous["min"], tail_max if new_rows else previous["max"]
+            print(f"Incremental: {new_rows} new rows past {previous['max']}")
+        else:
+            boundaries, value_min, value_max, _ = profile(source, n_ranges)
+            write_ranges(source, boundaries)
+            print(f"Full build: boundaries {boundaries}")
+        
+        sizes = range_rows()
+        segments = range_segments(boundaries)
+        manifest = {
+            "mode": mode,
+            "source": input_table,
+            "column": column,
+            "boundaries": boundaries,
+            "min": value_min,
+            "max": value_max,
+            "rows": source_rows,
+            "ranges": [
+                {"range_id": idx, "predicate": range_predicate(boundaries, idx), "rows": sizes.get(idx, 0)}
+                for idx in range(len(boundaries) + 1)
+            ] + [{"range_id": -1, "predicate": f"`{column}` IS NULL", "rows": sizes.get(-1, 0)}],
+        }
+        store_manifest(manifest)
+        
+        # Segments for the inference router (routing.assign_segments); the remainder is the null range
+        mlflow.log_dict(segments_manifest(segments, mode), "segments.json")
+        mlflow.log_metric("new_rows", new_rows)
+        for entry in manifest["ranges"]:
+            mlflow.log_metric(f"range_{entry['range_id']}_size", entry["rows"])
+    
+    partition_seconds = time.time() - start
+    mlflow.log_param("incremental", incremental)
+    mlflow.log_metric("partition_seconds", partition_seconds)
+    mlflow.log_dict(manifest, "manifest.json")
+    mlflow.log_param("output_table", output_table)
+    
+    print(f"✅ Partitioning complete in {partition_seconds:.1f}s. Data saved to {output_table}")
+    
+    # Return metadata for orchestrator
+    result_metadata = {
+        "output_table": output_table,
+        "mode": mode,
+        "partition_column": "range_id",
+        "order_column": column if mode == "sequence" else None,
+        "boundaries": manifest.get("boundaries"),
+        "incremental": incremental,
+        "mlflow_run_id": run.info.run_id,
+        "range_sizes": {
+            f"range_{entry['range_id']}": entry["rows"] for entry in manifest.get("ranges", [])
+        }
+    }
+    
+    mlflow.log_dict(result_metadata, "result_metadata.json")
+
+# COMMAND ----------
+
+# Expose the result to downstream tasks of a compiled workflow job
+dbutils.jobs.taskValues.set(key="result", value=result_metadata)
+
+dbutils.notebook.exit(json.dumps(result_metadata))
@@ -0,0 +1,200 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Route Feature Microservice
+# MAGIC Runs on Databricks Serverless, splits data into feature segments from a shallow decision tree or user rules
+
+# COMMAND ----------
+
+# Get parameters from orchestrator
+dbutils.widgets.text("workflow_id", "")
+dbutils.widgets.text("task_id", "")
+dbutils.widgets.text("config", "{}")
+dbutils.widgets.text("context", "{}")
+dbutils.widgets.text("catalog", "")
+dbutils.widgets.text("schema", "")
+dbutils.widgets.text("table", "")
+dbutils.widgets.text("target", "")
+dbutils.widgets.text("upstream", "{}")
+dbutils.widgets.text("upstream_runs", "{}")
+
+import json
+import time
+import mlflow
+from pyspark.sql import functions as F
+from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
+
+from routing import parse_rules, segment_predicates, segments_manifest, tree_segments
+from snapshots import read_table
+
+workflow_id = dbutils.widgets.get("workflow_id")
+task_id = dbutils.widgets.get("task_id")
+config = json.loads(dbutils.widgets.get("config"))
+context = json.loads(dbutils.widgets.get("context"))
+# Results of upstream tasks: passed by the orchestrator (per-task runs, cached
+# results) or resolved from task values inside a compiled workflow job
+upstream = {
+    **json.loads(dbutils.widgets.get("upstream") or "{}"),
+    **json.loads(dbutils.widgets.get("upstream_runs") or "{}"),
+}
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Configuration
+
+# COMMAND ----------
+
+catalog = dbutils.widgets.get("catalog")
+schema = dbutils.widgets.get("schema")
+table = dbutils.widgets.get("table")
+target = dbutils.widgets.get("target")
+
+feature_config = config.get('route', {}).get('feature') or {}
+rules = feature_config.get('rules')
+max_depth = int(feature_config.get('max_depth', 3))
+min_leaf_fraction = float(feature_config.get('min_leaf_fraction', 0.05))
+sample_rows = int(feature_config.get('sample_rows', 100_000))
+
+metric_config = context.get('metric', {})
+task_type = "classification" if 'classification' in metric_config else "regression"
+
+# Use routed data from an upstream task if there is one, else the workflow's
+# sample (`context.sample`), else the source table
+routed_tables = [r['output_table'] for r in upstream.values() if r and r.get('output_table')]
+sample_tables = [r['sample_table'] for r in upstream.values() if r and r.get('sample_table')]
+input_table = (routed_tables or sample_tables or [f"{catalog}.{schema}.{table}"])[0]
+
+# Lazy: nothing is read until a segment is written. The source is read at the
+# workflow's pinned version
+source = read_table(spark, input_table, upstream)
+
+numeric_types = ("tinyint", "smallint", "int", "bigint", "float", "double", "decimal")
+numeric_columns = [f.name for f in source.schema.fields
+                   if f.name != target and f.dataType.simpleString().startswith(numeric_types)]
+columns = feature_config.get('columns') or numeric_columns
+if isinstance(columns, str):
+    columns = columns.split()
+
+print(f"Routing {input_table} by {'rules' if rules else f'a depth-{max_depth} tree over {columns}'}")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Segments
+# MAGIC User rules are used as given. Otherwise a shallow tree is fit on a bounded
+# MAGIC sample (`route.feature.sample_rows`) of the routing columns, so the driver
+# MAGIC never holds more than the sample whatever the table size; its leaves
+# MAGIC become the segments.
+
+# COMMAND ----------
+
+if rules:
+    segments = parse_rules([rules] if isinstance(rules, str) else rules)
+    method = "rules"
+    tree = None
+else:
+    # Sample fraction from table statistics rather than a count scan where possible
+    try:
+        n_source = int(spark.sql(f"DESCRIBE DETAIL {input_table}").first()["numRecords"] or 0)
+    except Exception:
+        n_source = 0
+    n_source = n_source or source.count()
+    fraction = min(1.0, 1.2 * sample_rows / max(n_source, 1))
+
+    sample = (source.select(*columns, target)
+              .sample(fraction=fraction, seed=42)
+              .dropna()
+              .limit(sample_rows)
+              .toPandas())
+
+    tree_class = DecisionTreeClassifier if task_type == "classification" else DecisionTreeRegressor
+    tree = tree_class(max_depth=max_depth, min_samples_leaf=min_leaf_fraction, random_state=42)
+    tree.fit(sample[columns], sample[target])
+
+    segments = tree_segments(tree, columns)
+    method = "tree"
+    print(f"Tree fit on {len(sample)} sampled rows: {len(segments)} leaves")
+
+predicates = segment_predicates(segments)
+for segment_id, predicate in enumerate(predicates):
+    print(f"  segment_{segment_id}: {predicate}")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Materialize Segments
+# MAGIC Each segment is its own filtered write, so the predicate is pushed down
+# MAGIC into the Delta scan and files whose statistics rule it out are skipped.
+# MAGIC The output table is partitioned by `segment_id`; row counts come from the
+# MAGIC write's commit metrics, not a second scan.
+
+# COMMAND ----------
+
+mlflow.set_experiment(f"/Experiments/ensemble_{workflow_id}")
+
+output_table = f"{catalog}.{schema}.{table}_segmented_{workflow_id}_{task_id}"
+
+with mlflow.start_run(run_name=f"{task_id}_feature_routing") as run:
+    
+    # Log parameters
+    mlflow.log_param("task_id", task_id)
+    mlflow.log_param("workflow_id", workflow_id)
+    mlflow.log_param("method", method)
+    mlflow.log_param("columns", ",".join(columns))
+    if tree is not None:
+        mlflow.log_param("max_depth", max_depth)
+        mlflow.log_param("min_leaf_fraction", min_leaf_fraction)
+        mlflow.log_metric("sample_rows", len(sample))
+    
+    spark.sql(f"DROP TABLE IF EXISTS {output_table}")
+    
+    segment_rows = []
+    write_start = time.time()
+    for segment_id, predicate in enumerate(predicates):
+        (source.where(predicate)
+            .withColumn("segment_id", F.lit(segment_id))
+            .write.mode("append")
+            .partitionBy("segment_id")
+            .saveAsTable(output_table))
+        
+        commit = spark.sql(f"DESCRIBE HISTORY {output_table} LIMIT 1").first()
+        rows = int(commit["operationMetrics"].get("numOutputRows", 0))
+        segment_rows.append(rows)
+        mlflow.log_metric(f"segment_{segment_id}_size", rows)
+        print(f"  segment_{segment_id}: {rows} rows")
+    
+    write_seconds = time.time() - write_start
+    mlflow.log_metric("n_segments", len(predicates))
+    mlflow.log_metric("write_seconds", write_seconds)
+    
+    # The inference router evaluates the same segments as vectorized masks
+    # (routing.assign_segments) from this manifest
+    manifest = segments_manifest(segments, method, segment_rows)
+    mlflow.log_dict(manifest, "segments.json")
+    if tree is not None:
+        mlflow.sklearn.log_model(tree, "segment_tree")
+    
+    mlflow.log_param("output_table", output_table)
+    
+    print(f"✅ Feature routing complete. Data saved to {output_table}")
+    
+    # Return metadata for orchestrator
+    result_metadata = {
+        "output_table": output_table,
+        "n_segments": len(predicates),
+        "method": method,
+        "mlflow_run_id": run.info.run_id,
+        "segments": {
+            f"segment_{segment_id}": {"predicate": predicate, "rows": rows}
+            for segment_id, (predicate, rows) in enumerate(zip(predicates, segment_rows))
+        }
+    }
+    
+    mlflow.log_dict(result_metadata, "result_metadata.json")
+
+# COMMAND ----------
+
+# Expose the result to downstream tasks of a compiled workflow job
+dbutils.jobs.taskValues.set(key="result", value=result_metadata)
+
+dbutils.notebook.exit(json.dumps(result_metadata))
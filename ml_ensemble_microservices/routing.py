@@ -0,0 +1,181 @@
+"""
+Segment routing rules shared by the route_* microservices and inference.
+
+A segment is a conjunction of conditions on feature columns. The same
+segments compile to SQL predicates, which Spark pushes down into the Delta
+scan when materializing a segment, and to vectorized NumPy masks, which
+route scoring batches without a row loop.
+
+Segments are evaluated in order and the first match wins. Rows matching no
+segment (including rows with nulls in a tested column) fall into a final
+remainder segment, so every row lands in exactly one segment.
+"""
+
+import json
+import re
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+OPERATORS = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+
+_SQL_OPERATORS = {"==": "=", "!=": "<>"}
+
+_CONDITION = re.compile(r"^\s*`?([\w.]+)`?\s*(<=|>=|==|!=|<|>)\s*(.+?)\s*$")
+
+
+def parse_condition(text: str) -> dict:
+    """Parse `column op value`, where value is a number or a quoted string"""
+    match = _CONDITION.match(text)
+    if not match:
+        raise ValueError(f"Cannot parse condition '{text}', expected `column op value`")
+    column, op, raw = match.groups()
+    if raw[0] in "'\"" and raw[-1] == raw[0]:
+        value = raw[1:-1]
+    else:
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            raise ValueError(f"Value of '{text}' must be a number or a quoted string")
+    return {"column": column, "op": op, "value": value}
+
+
+def parse_rules(rules: Sequence) -> List[List[dict]]:
+    """
+    User rules to segments: each rule is a string of conditions joined by
+    `and`, or a list of condition strings or dicts.
+    """
+    segments = []
+    for rule in rules:
+        parts = re.split(r"\s+and\s+", rule, flags=re.IGNORECASE) if isinstance(rule, str) else rule
+        segments.append([part if isinstance(part, dict) else parse_condition(part) for part in parts])
+    return segments
+
+
+def tree_segments(tree, columns: Sequence[str]) -> List[List[dict]]:
+    """
+    Leaves of a fitted sklearn decision tree as segments, left to right.
+    sklearn sends `x <= threshold` left; a leaf's conditions are its path.
+    """
+    structure = tree.tree_
+    segments = []
+
+    def walk(node, path):
+        if structure.children_left[node] == structure.children_right[node]:
+            segments.append(path)
+            return
+        column, threshold = columns[structure.feature[node]], float(structure.threshold[node])
+        walk(structure.children_left[node], path + [{"column": column, "op": "<=", "value": threshold}])
+        walk(structure.children_right[node], path + [{"column": column, "op": ">", "value": threshold}])
+
+    walk(0, [])
+    return segments
+
+
+def _sql_literal(value) -> str:
+    if isinstance(value, str):
+        return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return repr(value)
+
+
+def condition_sql(condition: dict) -> str:
+    column = "`" + condition["column"].replace("`", "``") + "`"
+    op = _SQL_OPERATORS.get(condition["op"], condition["op"])
+    return f"{column} {op} {_sql_literal(condition['value'])}"
+
+
+def segment_sql(conditions: List[dict]) -> str:
+    """One segment as a SQL predicate; null comparisons never match"""
+    if not conditions:
+        return "true"
+    return " AND ".join(condition_sql(c) for c in conditions)
+
+
+def segment_predicates(segments: List[List[dict]]) -> List[str]:
+    """
+    Mutually exclusive SQL predicates, one per segment plus the remainder.
+    Each excludes the earlier segments, so first-match order holds in SQL too.
+    """
+    matched = [f"coalesce({segment_sql(conditions)}, false)" for conditions in segments]
+    predicates = []
+    for idx, conditions in enumerate(segments):
+        # The segment's own conditions stay bare so Delta can skip files on them
+        earlier = " OR ".join(matched[:idx])
+        clause = segment_sql(conditions)
+        predicates.append(f"{clause} AND NOT ({earlier})" if earlier else clause)
+    predicates.append(f"NOT ({' OR '.join(matched)})" if matched else "true")
+    return predicates
+
+
+def segment_case(segments: List[List[dict]]) -> str:
+    """SQL expression of the segment index of a row, first match wins; the remainder is len(segments)"""
+    if not segments:
+        return "0"
+    branches = " ".join(f"WHEN {segment_sql(conditions)} THEN {idx}" for idx, conditions in enumerate(segments))
+    return f"CASE {branches} ELSE {len(segments)} END"
+
+
+def condition_mask(df: pd.DataFrame, condition: dict) -> np.ndarray:
+    """Vectorized condition; missing values never match, as in SQL"""
+    values = df[condition["column"]]
+    value = condition["value"]
+    # Timestamps are stored as ISO strings in manifests
+    if isinstance(value, str) and values.dtype.kind == "M":
+        value = np.datetime64(value)
+    present = values.notna().to_numpy()
+    mask = np.zeros(len(values), dtype=bool)
+    mask[present] = OPERATORS[condition["op"]](values.to_numpy()[present], value)
+    return mask
+
+
+def segment_masks(df: pd.DataFrame, segments: List[List[dict]]) -> List[np.ndarray]:
+    """One boolean mask per segment plus the remainder, mutually exclusive like segment_predicates"""
+    unassigned = np.ones(len(df), dtype=bool)
+    masks = []
+    for conditions in segments:
+        mask = unassigned.copy()
+        for condition in conditions:
+            mask &= condition_mask(df, condition)
+        unassigned &= ~mask
+        masks.append(mask)
+    masks.append(unassigned)
+    return masks
+
+
+def assign_segments(df: pd.DataFrame, segments: List[List[dict]]) -> np.ndarray:
+    """Segment index of every row; the remainder is len(segments)"""
+    masks = segment_masks(df, segments)
+    return np.select(masks[:-1], np.arange(len(segments)), default=len(segments)).astype(np.int32)
+
+
+def segments_manifest(segments: List[List[dict]], method: str, rows: Optional[List[int]] = None) -> dict:
+    """JSON-serializable description of the segments, as logged for the inference router"""
+    predicates = segment_predicates(segments)
+    conditions = segments + [None]
+    return {
+        "method": method,
+        "segments": [
+            {
+                "segment_id": idx,
+                "conditions": conditions[idx],
+                "predicate": predicate,
+                **({"rows": rows[idx]} if rows is not None else {}),
+            }
+            for idx, predicate in enumerate(predicates)
+        ],
+    }
+
+
+def manifest_segments(manifest: dict) -> List[List[dict]]:
+    """Segments of a logged manifest, without the remainder"""
+    return [s["conditions"] for s in manifest["segments"] if s["conditions"] is not None]
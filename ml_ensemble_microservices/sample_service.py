@@ -0,0 +1,211 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Sample Microservice
+# MAGIC Runs on Databricks Serverless as the first task of every workflow: pins the source version, draws the sample (`context.sample`), fits the feature pipeline and snapshots the data every other task trains on
+
+# COMMAND ----------
+
+# Get parameters from orchestrator
+dbutils.widgets.text("workflow_id", "")
+dbutils.widgets.text("task_id", "")
+dbutils.widgets.text("config", "{}")
+dbutils.widgets.text("context", "{}")
+dbutils.widgets.text("catalog", "")
+dbutils.widgets.text("schema", "")
+dbutils.widgets.text("table", "")
+dbutils.widgets.text("target", "")
+dbutils.widgets.text("upstream", "{}")
+dbutils.widgets.text("upstream_runs", "{}")
+
+import json
+import os
+import time
+import mlflow
+
+from sampling import random_sample, sample_method, stratified_sample, time_series_sample
+from snapshots import default_cache_dir, pinned, publish_snapshot, snapshot_complete, snapshot_name, table_version
+from transforms import FeaturePipeline, log_pipeline, parse_transforms
+
+workflow_id = dbutils.widgets.get("workflow_id")
+task_id = dbutils.widgets.get("task_id")
+config = json.loads(dbutils.widgets.get("config"))
+context = json.loads(dbutils.widgets.get("context"))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Configuration
+
+# COMMAND ----------
+
+catalog = dbutils.widgets.get("catalog")
+schema = dbutils.widgets.get("schema")
+table = dbutils.widgets.get("table")
+target = dbutils.widgets.get("target")
+
+sample_config = context.get('sample') or {}
+features_config = (context.get('source') or {}).get('features') or {}
+transforms = parse_transforms(features_config)
+snapshot = sample_config.get('snapshot', True) not in (False, "false")
+if not sample_config.get('size') and not transforms and not snapshot:
+    raise ValueError("The sample task needs context.sample.size, source.features transforms or a snapshot")
+size = int(sample_config['size']) if sample_config.get('size') else None
+method = sample_method(sample_config)
+seed = int(sample_config.get('seed', 42))
+snapshot_dir = sample_config.get('snapshot_dir') or default_cache_dir(catalog, schema, "snapshots")
+
+# Always the source table, pinned to the version the orchestrator saw at
+# submission (else the latest): every task of the workflow sees these rows
+input_table = f"{catalog}.{schema}.{table}"
+source_version = config.get('source_version')
+if source_version is None:
+    source_version = table_version(spark, input_table)
+source = pinned(spark, input_table, source_version)
+source_rows = source.count() if size else None
+
+if not size:
+    column = None
+elif method == "stratified":
+    column = sample_config.get('column') or target
+elif method == "time_series":
+    column = sample_config.get('column')
+    if not column:
+        temporal = [f.name for f in source.schema.fields if f.dataType.simpleString() in ("timestamp", "date")]
+        if not temporal:
+            raise ValueError("time_series sampling needs context.sample.column: the source has no timestamp or date column")
+        column = temporal[0]
+else:
+    column = None
+
+if size:
+    print(f"Sampling {size} of {source_rows} rows of {input_table} ({method}{f' on {column}' if column else ''})")
+if transforms:
+    print(f"Fitting feature transforms of {list(transforms)}")
+print(f"Source {input_table} pinned at version {source_version}")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Sample, Feature Pipeline and Snapshot
+# MAGIC The sample is drawn on the executors and written once as a Delta table;
+# MAGIC downstream tasks find it as `sample_table` in their upstream results.
+# MAGIC The feature pipeline is then fitted on the sample (the source without
+# MAGIC one) in one aggregation and logged as `feature_pipeline.json`.
+# MAGIC
+# MAGIC Finally, what every task trains on (the sample, else the pinned source;
+# MAGIC transformed if there is a pipeline) is written once as Parquet to a
+# MAGIC Volume. Services memory-map it with pyarrow instead of querying Spark.
+# MAGIC Snapshots of the whole source are shared by workflows on the same version.
+
+# COMMAND ----------
+
+mlflow.set_experiment(f"/Experiments/ensemble_{workflow_id}")
+
+with mlflow.start_run(run_name=f"{task_id}_sampling") as run:
+    
+    # Log parameters
+    mlflow.log_param("task_id", task_id)
+    mlflow.log_param("workflow_id", workflow_id)
+    mlflow.log_param("source_version", source_version)
+    result_metadata = {
+        "source_table": input_table,
+        "source_version": source_version,
+        "mlflow_run_id": run.info.run_id
+    }
+    training = source
+    training_table = input_table
+    
+    if size:
+        mlflow.log_param("method", method)
+        mlflow.log_param("size", size)
+        mlflow.log_param("column", column)
+        mlflow.log_param("seed", seed)
+        mlflow.log_metric("source_rows", source_rows)
+        
+        start = time.time()
+        quota = None
+        if method == "stratified":
+            sample, quota = stratified_sample(source, column, size, seed)
+        elif method == "time_series":
+            sample = time_series_sample(source, column, size, total=source_rows)
+        else:
+            sample = random_sample(source, size, seed)
+        
+        sample_table = f"{catalog}.{schema}.{table}_sample_{workflow_id}"
+        sample.write.mode("overwrite").option("overwriteSchema", "true").saveAsTable(sample_table)
+        sample_seconds = time.time() - start
+        
+        # Row count from the write's commit metrics, not a second scan
+        commit = spark.sql(f"DESCRIBE HISTORY {sample_table} LIMIT 1").first()
+        sample_rows = int(commit["operationMetrics"].get("numOutputRows", 0))
+        
+        mlflow.log_metric("sample_rows", sample_rows)
+        mlflow.log_metric("sample_seconds", sample_seconds)
+        if quota is not None:
+            mlflow.log_dict({str(k): q for k, q in quota.items()}, "strata_quotas.json")
+        mlflow.log_param("sample_table", sample_table)
+        
+        print(f"✅ Sample of {sample_rows} rows saved to {sample_table} in {sample_seconds:.1f}s")
+        
+        training = spark.table(sample_table)
+        training_table = sample_table
+        result_metadata.update({
+            "sample_table": sample_table,
+            "method": method,
+            "column": column,
+            "sample_rows": sample_rows,
+            "source_rows": source_rows,
+            **({"strata": {str(k): q for k, q in quota.items()}} if quota is not None else {})
+        })
+    
+    pipeline = None
+    if transforms:
+        start = time.time()
+        pipeline = FeaturePipeline(transforms).fit_spark(training)
+        pipeline_uri = log_pipeline(pipeline)
+        mlflow.log_metric("fit_seconds", time.time() - start)
+        
+        print(f"✅ Feature pipeline fitted on {training_table}")
+        
+        result_metadata.update({
+            "feature_pipeline": pipeline_uri,
+            "features_fingerprint": pipeline.fingerprint(),
+        })
+    
+    if snapshot:
+        snapshot_path = os.path.join(snapshot_dir, input_table, snapshot_name(
+            source_version,
+            workflow_id if size or source_version is None else None,
+            pipeline.fingerprint() if pipeline is not None else None
+        ))
+        start = time.time()
+        reused = source_version is not None and not size and snapshot_complete(snapshot_path)
+        if not reused:
+            # Written aside and renamed into place: workflows sharing the snapshot never
+            # overwrite a copy another one is reading
+            staging_path = f"{snapshot_path}_staging_{workflow_id}"
+            snapshot_data = pipeline.apply_spark(training) if pipeline is not None else training
+            snapshot_data.write.mode("overwrite").parquet(staging_path)
+            reused = not publish_snapshot(staging_path, snapshot_path)
+        snapshot_seconds = time.time() - start
+        
+        mlflow.log_param("snapshot", snapshot_path)
+        mlflow.log_metric("snapshot_seconds", snapshot_seconds)
+        mlflow.log_metric("snapshot_reused", int(reused))
+        
+        print(f"✅ Snapshot of {training_table} {'reused' if reused else 'saved'} at {snapshot_path} in {snapshot_seconds:.1f}s")
+        
+        result_metadata.update({
+            "snapshot": snapshot_path,
+            "snapshot_source": training_table,
+            "snapshot_transformed": pipeline is not None,
+        })
+    
+    mlflow.log_dict(result_metadata, "result_metadata.json")
+
+# COMMAND ----------
+
+# Expose the result to downstream tasks of a compiled workflow job
+dbutils.jobs.taskValues.set(key="result", value=result_metadata)
+
+dbutils.notebook.exit(json.dumps(result_metadata))
@@ -0,0 +1,153 @@
+"""
+Distributed sampling for `context.sample`.
+
+The sample microservice draws one sample per workflow with these functions
+and materializes it as a Delta table; every downstream task trains on that
+table instead of the full source. All sampling runs on the executors: the
+driver only sees counts and quantiles.
+
+Methods:
+- random: uniform sample of exactly `size` rows (bottom-k reservoir over
+  random keys, per partition, then merged)
+- stratified: exactly the quota of every stratum, apportioned by stratum
+  size (largest remainder), so strata keep their share of the source
+- time_series: the `size` most recent rows of an ordering column
+"""
+
+import sys
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+SAMPLE_METHODS = ["random", "stratified", "time_series"]
+
+# Bernoulli pre-filters keep this much more than needed, so an exact cut
+# rarely has to fall back to a second pass
+OVERSAMPLE = 1.1
+
+
+def sample_method(sample_config: dict) -> str:
+    """`method` may be a name, a list or a YAML flow sequence collapsed into one string"""
+    method = sample_config.get('method') or "random"
+    if isinstance(method, (list, tuple)):
+        method = method[0] if method else "random"
+    method = str(method).split()[0]
+    if method not in SAMPLE_METHODS:
+        raise ValueError(f"Unknown sample method '{method}', expected one of {SAMPLE_METHODS}")
+    return method
+
+
+def quotas(counts: Dict, size: int) -> Dict:
+    """
+    Per-stratum quotas proportional to `counts` that add up to exactly
+    `size` (largest remainder; never more than a stratum holds).
+    """
+    total = sum(counts.values())
+    if size >= total:
+        return dict(counts)
+
+    keys = list(counts)
+    exact = np.array([counts[k] for k in keys], dtype=np.float64) * size / total
+    allotted = np.floor(exact).astype(np.int64)
+    remainders = exact - allotted
+    for idx in np.argsort(-remainders, kind="stable")[:size - int(allotted.sum())]:
+        allotted[idx] += 1
+    return {k: int(min(q, counts[k])) for k, q in zip(keys, allotted)}
+
+
+def bottom_k(batches, k: int, key_column: str = "_sample_key"):
+    """
+    mapInPandas body: the k rows with the smallest random keys of a
+    partition. The union of every partition's bottom k holds the global
+    bottom k, which is a uniform sample of exactly k rows.
+    """
+    kept = None
+    for batch in batches:
+        if kept is not None and len(kept) == k:
+            # Only rows below the current k-th smallest key can enter
+            batch = batch[batch[key_column] < kept[key_column].max()]
+        kept = batch if kept is None else pd.concat([kept, batch], ignore_index=True)
+        if len(kept) > k:
+            kept = kept.nsmallest(k, key_column)
+    if kept is not None and len(kept):
+        yield kept
+
+
+def random_sample(df, size: int, seed: int = 42):
+    """Uniform sample of exactly `size` rows (all rows if there are fewer)"""
+    from pyspark.sql import functions as F
+
+    keyed = df.withColumn("_sample_key", F.rand(seed))
+    reservoirs = keyed.mapInPandas(lambda batches: bottom_k(batches, size), schema=keyed.schema)
+    return reservoirs.orderBy("_sample_key").limit(size).drop("_sample_key")
+
+
+def stratified_sample(df, column: str, size: int, seed: int = 42):
+    """
+    Exactly the quota of every stratum of `column`. Strata are pre-filtered
+    with per-stratum Bernoulli fractions (sampleBy), then cut to their quota
+    by random rank; a stratum that came up short is taken from the source.
+
+    Returns the sample and the quota of every stratum.
+    """
+    from pyspark.sql import Window
+    from pyspark.sql import functions as F
+
+    counts = {row[column]: row["count"] for row in df.groupBy(column).count().collect()}
+    quota = quotas(counts, size)
+    fractions = {k: min(1.0, OVERSAMPLE * q / counts[k] + 1e-6) if q else 0.0 for k, q in quota.items()}
+
+    # sampleBy drops strata without a fraction, including the null stratum
+    candidates = df.sampleBy(column, {k: f for k, f in fractions.items() if k is not None}, seed=seed)
+    if quota.get(None):
+        candidates = candidates.unionByName(df.where(F.col(column).isNull()).sample(fraction=fractions[None], seed=seed))
+
+    got = {row[column]: row["count"] for row in candidates.groupBy(column).count().collect()}
+    short = [k for k, q in quota.items() if got.get(k, 0) < q]
+    if short:
+        # Rare: redraw the short strata from the full source
+        pool = F.col(column).isin([k for k in short if k is not None])
+        if None in short:
+            pool = pool | F.col(column).isNull()
+        pool = F.coalesce(pool, F.lit(False))
+        candidates = candidates.where(~pool).unionByName(df.where(pool))
+
+    limits = [item for k, q in quota.items() if k is not None for item in (F.lit(k), F.lit(q))]
+    limit = F.lit(quota.get(None, 0))
+    if limits:
+        limit = F.coalesce(F.create_map(*limits)[F.col(column)], limit)
+    rank = F.row_number().over(Window.partitionBy(column).orderBy(F.rand(seed)))
+    sample = candidates.withColumn("_sample_rank", rank).where(F.col("_sample_rank") <= limit).drop("_sample_rank")
+    return sample, quota
+
+
+def time_series_sample(df, column: str, size: int, total: Optional[int] = None, accuracy: int = 10000):
+    """
+    The `size` most recent rows by `column`. An approximate quantile bounds
+    the tail (one pass, pushed down as a filter) before the exact cut.
+    """
+    from pyspark.sql import functions as F
+
+    total = total if total is not None else df.count()
+    if size >= total:
+        return df
+
+    tail_fraction = min(1.0, OVERSAMPLE * size / total + 1.0 / accuracy)
+    cutoff = df.agg(F.percentile_approx(column, 1.0 - tail_fraction, accuracy).alias("cutoff")).first()["cutoff"]
+    tail = df.where(F.col(column) >= F.lit(cutoff)) if cutoff is not None else df
+    if tail.count() < size:
+        tail = df
+    return tail.orderBy(F.col(column).desc_nulls_last()).limit(size)
+
+
+def _pickle_by_value():
+    # Executors don't have this module on their path: UDFs carry it with them
+    try:
+        from pyspark import cloudpickle
+        cloudpickle.register_pickle_by_value(sys.modules[__name__])
+    except (ImportError, AttributeError, ValueError):
+        pass
+
+
+_pickle_by_value()
@@ -0,0 +1,142 @@
+"""
+Candidate selection over the runs of an AutoML experiment.
+
+The stack_top_alg notebook (stack_top_alg and stack_top_n_alg tasks) pulls
+every run of the experiment with a single `mlflow.search_runs` call and
+selects per model family in pandas, instead of one query per family. The
+pulled selection table is cached per experiment and reused until another
+run finishes.
+"""
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+import pandas as pd
+
+# Where AutoML runs record their model family, most specific first
+FAMILY_COLUMNS = [
+    "params.model_type",
+    "tags.estimator_name",
+    "params.classifier",
+    "params.regressor",
+    "tags.mlflow.runName",
+]
+
+# Metrics where lower is better; all others are ranked descending
+_LOWER_IS_BETTER = re.compile(r"(loss|error|mse|rmse|mae|mape|deviance)", re.IGNORECASE)
+
+
+def lower_is_better(metric: str) -> bool:
+    return bool(_LOWER_IS_BETTER.search(metric))
+
+
+def model_family(value) -> Optional[str]:
+    """Family name of a param or tag value: `sklearn.ensemble.RandomForestClassifier(...)` -> `RandomForestClassifier`"""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    name = str(value).split("(", 1)[0].strip()
+    return name.rsplit(".", 1)[-1] or None
+
+
+def family_column(runs: pd.DataFrame, preferred: Optional[str] = None) -> str:
+    """The first column of FAMILY_COLUMNS (or `preferred`) that is set on any run"""
+    candidates = ([preferred] if preferred else []) + FAMILY_COLUMNS
+    for column in candidates:
+        for name in (column, f"params.{column}", f"tags.{column}"):
+            if name in runs.columns and runs[name].notna().any():
+                return name
+    raise ValueError(f"No model family column in the runs: looked for {candidates}")
+
+
+def _experiment_version(experiment_id: str) -> str:
+    """
+    Version of an experiment's finished runs: the end time and id of the
+    latest one. Every run that finishes changes it, unlike the experiment's
+    last update time, which only tracks experiment metadata.
+    """
+    import mlflow
+
+    latest = mlflow.search_runs(
+        experiment_ids=[experiment_id], filter_string="attributes.status = 'FINISHED'",
+        order_by=["attributes.end_time DESC"], max_results=1, output_format="list",
+    )
+    if not latest:
+        return "empty"
+    return f"{latest[0].info.end_time}:{latest[0].info.run_id}"
+
+
+def search_candidates(experiment_id: str, cache_dir: Optional[str] = None) -> pd.DataFrame:
+    """
+    All finished runs of an experiment, from one search_runs call.
+
+    With `cache_dir` the result is stored as `{experiment_id}.parquet` and
+    reused until another run of the experiment finishes.
+    """
+    import mlflow
+
+    version = _experiment_version(experiment_id)
+    path = os.path.join(cache_dir, f"{experiment_id}.parquet") if cache_dir else None
+
+    if path and os.path.exists(path):
+        cached = pd.read_parquet(path)
+        if len(cached) and str(cached["experiment_version"].iloc[0]) == version:
+            return cached.drop(columns=["experiment_version"])
+
+    runs = mlflow.search_runs(experiment_ids=[experiment_id], filter_string="attributes.status = 'FINISHED'")
+
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Param and tag values are strings; object columns of other types don't round-trip
+        stored = runs.assign(experiment_version=version)
+        for column in stored.columns[stored.dtypes == object]:
+            stored[column] = stored[column].astype("string")
+        stored.to_parquet(path, index=False)
+    return runs
+
+
+def select_candidates(
+    runs: pd.DataFrame,
+    metric: str,
+    per_family: int = 1,
+    max_families: Optional[int] = None,
+    family: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    The best `per_family` runs of every model family, families ordered by
+    their best run. Runs without the metric are ignored.
+
+    Returns the selected rows with a `family` column, best first.
+    """
+    metric_column = metric if metric.startswith("metrics.") else f"metrics.{metric}"
+    if metric_column not in runs.columns:
+        raise ValueError(f"No runs have the metric {metric_column}")
+
+    column = family_column(runs, family)
+    ranked = (runs.dropna(subset=[metric_column])
+                  .assign(family=lambda df: df[column].map(model_family))
+                  .dropna(subset=["family"])
+                  .sort_values(metric_column, ascending=lower_is_better(metric), kind="stable"))
+
+    selected = ranked.groupby("family", sort=False).head(per_family)
+    if max_families:
+        families = selected["family"].drop_duplicates().head(max_families)
+        selected = selected[selected["family"].isin(families)]
+    return selected.reset_index(drop=True)
+
+
+def download_models(run_ids: Sequence[str], dst_dir: str, artifact_path: str = "model") -> List[str]:
+    """Download each run's model in parallel threads; returns the local paths in order"""
+    import mlflow
+
+    if not run_ids:
+        return []
+    with ThreadPoolExecutor(max_workers=min(len(run_ids), 16)) as pool:
+        return list(pool.map(
+            lambda idx_run: mlflow.artifacts.download_artifacts(
+                artifact_uri=f"runs:/{idx_run[1]}/{artifact_path}",
+                dst_path=os.path.join(dst_dir, f"base_{idx_run[0]}")
+            ),
+            enumerate(run_ids)
+        ))
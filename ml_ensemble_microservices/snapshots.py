@@ -0,0 +1,154 @@
+"""
+Per-workflow Parquet snapshots of the training data.
+
+The sample task pins the source table to one Delta version and writes what
+every task trains on (the sample or the source at that version, transformed
+if there is a feature pipeline) once, as Parquet in a Volume. Services
+memory-map the snapshot with pyarrow instead of running a Spark query and
+`toPandas`, so an N-task workflow loads its data once and every task sees
+the same rows even if the source changes mid-workflow.
+
+Spark-side readers of the source (routing, distributed boosting) read the
+pinned version through `read_table`.
+
+Snapshots and the other caches default to a Volume; the local executor points
+them at local disk through OBSRV_CACHE_DIR.
+"""
+
+import os
+import shutil
+from typing import Optional
+
+import pandas as pd
+
+from transforms import upstream_pipeline
+
+# Root of the caches when set (the local executor sets it), else a Volume per schema
+CACHE_DIR_ENV = "OBSRV_CACHE_DIR"
+
+
+def default_cache_dir(catalog: str, schema: str, kind: str) -> str:
+    """Default directory of a cache (`snapshots`, `boost`, `selection`)"""
+    root = os.environ.get(CACHE_DIR_ENV) or f"/Volumes/{catalog}/{schema}/obsrv_cache"
+    return os.path.join(root, kind)
+
+
+def snapshot_name(version: Optional[int], workflow_id: Optional[str] = None, fingerprint: Optional[str] = None) -> str:
+    """
+    Directory name of a snapshot. Snapshots of the whole source are shared
+    by every workflow on the same version (and pipeline); samples and
+    unversioned sources are per workflow.
+    """
+    name = f"v{version}" if version is not None else "unversioned"
+    if workflow_id:
+        name += f"_sample_{workflow_id}"
+    if fingerprint:
+        name += f"_{fingerprint}"
+    return name
+
+
+def snapshot_complete(path: str) -> bool:
+    """Whether a Spark write to `path` committed"""
+    return os.path.exists(os.path.join(path, "_SUCCESS"))
+
+
+def publish_snapshot(staging: str, path: str) -> bool:
+    """
+    Move a committed snapshot write from `staging` into place. Workflows
+    sharing a snapshot stage separately; the first to publish wins and the
+    others drop their copy. Returns whether `staging` was published.
+    """
+    if os.path.exists(path) and not snapshot_complete(path):
+        # Left over by a writer that failed before committing
+        shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rename(staging, path)
+        return True
+    except OSError:
+        if not snapshot_complete(path):
+            raise
+        shutil.rmtree(staging, ignore_errors=True)
+        return False
+
+
+def table_version(spark, name: str) -> Optional[int]:
+    """Latest Delta version of a table, or None for non-Delta tables"""
+    try:
+        return int(spark.sql(f"DESCRIBE HISTORY {name} LIMIT 1").first()["version"])
+    except Exception:
+        return None
+
+
+def pinned(spark, name: str, version: Optional[int]):
+    """A table at a Delta version (the latest without one)"""
+    if version is None:
+        return spark.table(name)
+    return spark.sql(f"SELECT * FROM {name} VERSION AS OF {int(version)}")
+
+
+def source_result(input_table: str, upstream: dict) -> Optional[dict]:
+    """The sample task's result if `input_table` is the workflow's source"""
+    for result in upstream.values():
+        if result and result.get('source_table') == input_table:
+            return result
+    return None
+
+
+def input_version(spark, input_table: str, upstream: dict) -> Optional[int]:
+    """Delta version `input_table` is read at: the pinned one for the source, else the latest"""
+    result = source_result(input_table, upstream)
+    if result and result.get('source_version') is not None:
+        return int(result['source_version'])
+    return table_version(spark, input_table)
+
+
+def snapshot_result(upstream: dict) -> Optional[dict]:
+    """The upstream result carrying the workflow's snapshot (`snapshot`)"""
+    for result in upstream.values():
+        if result and result.get('snapshot'):
+            return result
+    return None
+
+
+def read_table(spark, input_table: str, upstream: dict):
+    """`input_table` as a Spark DataFrame, at the workflow's pinned version if it is the source"""
+    result = source_result(input_table, upstream)
+    if result:
+        return pinned(spark, input_table, result.get('source_version'))
+    return spark.table(input_table)
+
+
+def output_transformed(input_table: str, upstream: dict) -> bool:
+    """Whether `input_table` is a routed table whose routing task already applied the pipeline"""
+    return any(r and r.get('output_table') == input_table and r.get('output_transformed')
+               for r in upstream.values())
+
+
+def read_snapshot(path: str) -> pd.DataFrame:
+    """A snapshot directory as pandas, memory-mapped rather than read into buffers"""
+    import pyarrow.parquet as pq
+
+    return pq.read_table(path, memory_map=True).to_pandas(self_destruct=True, split_blocks=True)
+
+
+def load_frame(spark, input_table: str, upstream: dict) -> pd.DataFrame:
+    """
+    `input_table` as pandas with the workflow's feature transforms applied.
+
+    The snapshot is memory-mapped when it was built from `input_table` (the
+    sample or the source); other inputs (routed tables) are read through
+    Spark. Data the snapshot or the routing task (`output_transformed`) did
+    not already transform goes through the fitted pipeline on the driver.
+    """
+    result = snapshot_result(upstream)
+    if result and result.get('snapshot_source') == input_table:
+        frame = read_snapshot(result['snapshot'])
+        if result.get('snapshot_transformed'):
+            return frame
+    else:
+        frame = read_table(spark, input_table, upstream).toPandas()
+        if output_transformed(input_table, upstream):
+            return frame
+
+    pipeline = upstream_pipeline(upstream)
+    return pipeline.apply(frame) if pipeline is not None else frame
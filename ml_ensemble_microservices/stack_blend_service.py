@@ -0,0 +1,263 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Stack Blend Microservice
+# MAGIC Runs on Databricks Serverless, fits base models once on a train split and trains the meta-model on their holdout predictions
+
+# COMMAND ----------
+
+# Get parameters from orchestrator
+dbutils.widgets.text("workflow_id", "")
+dbutils.widgets.text("task_id", "")
+dbutils.widgets.text("config", "{}")
+dbutils.widgets.text("context", "{}")
+dbutils.widgets.text("catalog", "")
+dbutils.widgets.text("schema", "")
+dbutils.widgets.text("table", "")
+dbutils.widgets.text("target", "")
+dbutils.widgets.text("upstream", "{}")
+dbutils.widgets.text("upstream_runs", "{}")
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import mlflow
+import pandas as pd
+import numpy as np
+from databricks import automl
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.linear_model import LogisticRegression, Ridge
+
+from snapshots import load_frame
+from transforms import log_pipeline, upstream_pipeline
+
+workflow_id = dbutils.widgets.get("workflow_id")
+task_id = dbutils.widgets.get("task_id")
+config = json.loads(dbutils.widgets.get("config"))
+context = json.loads(dbutils.widgets.get("context"))
+# Results of upstream tasks: passed by the orchestrator (per-task runs, cached
+# results) or resolved from task values inside a compiled workflow job
+upstream = {
+    **json.loads(dbutils.widgets.get("upstream") or "{}"),
+    **json.loads(dbutils.widgets.get("upstream_runs") or "{}"),
+}
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Load Data
+
+# COMMAND ----------
+
+catalog = dbutils.widgets.get("catalog")
+schema = dbutils.widgets.get("schema")
+table = dbutils.widgets.get("table")
+target = dbutils.widgets.get("target")
+
+# Use routed data from an upstream task if there is one, else the workflow's
+# sample (`context.sample`), else the source table
+routed_tables = [r['output_table'] for r in upstream.values() if r and r.get('output_table')]
+sample_tables = [r['sample_table'] for r in upstream.values() if r and r.get('sample_table')]
+input_table = (routed_tables or sample_tables or [f"{catalog}.{schema}.{table}"])[0]
+
+# Memory-mapped from the workflow's snapshot when it holds this input, and transformed
+# by the fitted feature pipeline (`source.features`) if there is one
+df = load_frame(spark, input_table, upstream)
+print(f"Using data: {input_table}")
+
+X = df.drop(columns=[target])
+y = df[target]
+
+print(f"Dataset shape: {X.shape}")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Holdout Split
+
+# COMMAND ----------
+
+stack_config = config.get('stack', {})
+top_n = stack_config.get('top_n') or 3
+holdout = float(stack_config.get('holdout') or 0.2)
+levels = int(stack_config.get('levels') or 2)
+
+if levels != 2:
+    raise ValueError(f"stack_blend supports levels: 2 (base models + meta-model), got {levels}")
+
+# Determine task type from context
+metric_config = context.get('metric', {})
+if 'classification' in metric_config:
+    task_type = "classification"
+    primary_metric = metric_config['classification'][0]  # First metric
+else:
+    task_type = "regression"
+    primary_metric = metric_config['regression'][0]
+
+fold_type = context.get('fold_type', ['kfold'])[0]
+
+if fold_type == 'time_series':
+    # Hold out the most recent rows
+    X_train, X_holdout, y_train, y_holdout = train_test_split(X, y, test_size=holdout, shuffle=False)
+else:
+    X_train, X_holdout, y_train, y_holdout = train_test_split(
+        X, y, test_size=holdout, random_state=42,
+        stratify=y if task_type == "classification" and fold_type == 'stratified' else None
+    )
+
+print(f"Train rows: {len(X_train)}, holdout rows: {len(X_holdout)}")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Select Base Models via AutoML
+
+# COMMAND ----------
+
+mlflow.set_experiment(f"/Experiments/ensemble_{workflow_id}")
+
+train_df = X_train.assign(**{target: y_train})
+
+# AutoML only sees the train split, so holdout predictions stay unbiased
+automl_run = automl.classify(
+    dataset=spark.createDataFrame(train_df),
+    target_col=target,
+    primary_metric=primary_metric,
+    timeout_minutes=int(context.get('timeout', '10 minutes').split()[0]),
+    experiment_dir=f"/Experiments/automl_{workflow_id}_{task_id}"
+) if task_type == "classification" else automl.regress(
+    dataset=spark.createDataFrame(train_df),
+    target_col=target,
+    primary_metric=primary_metric,
+    timeout_minutes=int(context.get('timeout', '10 minutes').split()[0]),
+    experiment_dir=f"/Experiments/automl_{workflow_id}_{task_id}"
+)
+
+runs = mlflow.search_runs(
+    experiment_ids=[automl_run.experiment.experiment_id],
+    order_by=[f"metrics.{primary_metric} DESC"],
+    max_results=top_n
+)
+base_run_ids = runs['run_id'].tolist()
+
+print(f"Top {len(base_run_ids)} models by {primary_metric}:")
+print(runs[['run_id', f'metrics.{primary_metric}']])
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Fit Base Models and Predict the Holdout
+# MAGIC Each base model is fit exactly once, all of them in parallel.
+
+# COMMAND ----------
+
+def fit_and_predict(model):
+    """Refit a selected model on the whole train split and predict the holdout"""
+    start = time.time()
+    model = clone(model)
+    model.fit(X_train, y_train)
+
+    if task_type == "classification":
+        holdout_preds = model.predict_proba(X_holdout)[:, 1]
+    else:
+        holdout_preds = model.predict(X_holdout)
+    return model, holdout_preds, time.time() - start
+
+
+# Download the selected models in parallel threads on the driver
+with ThreadPoolExecutor(max_workers=len(base_run_ids)) as pool:
+    selected_models = list(pool.map(
+        lambda run_id: mlflow.sklearn.load_model(f"runs:/{run_id}/model"), base_run_ids
+    ))
+
+fit_start = time.time()
+fitted = Parallel(n_jobs=len(selected_models))(
+    delayed(fit_and_predict)(model) for model in selected_models
+)
+base_fit_seconds = time.time() - fit_start
+
+base_models = [model for model, _, _ in fitted]
+holdout_predictions = np.column_stack([preds for _, preds, _ in fitted])
+
+for model_idx, (_, _, seconds) in enumerate(fitted):
+    print(f"Model {model_idx + 1}/{len(fitted)}: fit and holdout prediction in {seconds:.1f}s")
+print(f"Base models fit in {base_fit_seconds:.1f}s")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Train Meta-Model (Blending)
+
+# COMMAND ----------
+
+with mlflow.start_run(run_name=f"{task_id}_blending") as run:
+    
+    # Log parameters
+    mlflow.log_param("task_id", task_id)
+    mlflow.log_param("workflow_id", workflow_id)
+    mlflow.log_param("n_base_models", len(base_models))
+    mlflow.log_param("holdout", holdout)
+    mlflow.log_param("levels", levels)
+    mlflow.log_param("fold_type", fold_type)
+    mlflow.log_metric("base_fit_seconds", base_fit_seconds)
+    
+    # Train meta-model on the holdout predictions
+    if task_type == "classification":
+        meta_learner = LogisticRegression(random_state=42)
+        scoring = "accuracy"
+    else:
+        meta_learner = Ridge(random_state=42)
+        scoring = "r2"
+    
+    # The meta-model has only seen the holdout: score it by CV on the holdout
+    meta_scores = cross_val_score(clone(meta_learner), holdout_predictions, y_holdout, cv=5, scoring=scoring)
+    meta_learner.fit(holdout_predictions, y_holdout)
+    
+    mlflow.log_metric(f"blended_{scoring}", meta_scores.mean())
+    mlflow.log_metric(f"blended_{scoring}_std", meta_scores.std())
+    print(f"Blended Ensemble {scoring}: {meta_scores.mean():.4f} ± {meta_scores.std():.4f}")
+    
+    # Log the meta-model and the base models fit on the train split
+    mlflow.sklearn.log_model(meta_learner, "meta_learner")
+    for model_idx, model in enumerate(base_models):
+        mlflow.sklearn.log_model(model, f"base_model_{model_idx}")
+    # The models take transformed features: keep the fitted pipeline with them
+    pipeline_uri = log_pipeline(upstream_pipeline(upstream))
+    
+    mlflow.log_dict({
+        "base_model_runs": base_run_ids,
+        "base_model_artifacts": [f"base_model_{i}" for i in range(len(base_models))]
+    }, "base_models.json")
+    
+    # Save holdout predictions to Unity Catalog for potential use by other tasks
+    blend_df = pd.DataFrame(holdout_predictions, columns=[f"model_{i}" for i in range(len(base_models))])
+    blend_df[target] = y_holdout.values
+    
+    output_table = f"{catalog}.{schema}.blend_predictions_{workflow_id}_{task_id}"
+    spark.createDataFrame(blend_df).write.mode("overwrite").saveAsTable(output_table)
+    
+    mlflow.log_param("blend_table", output_table)
+    
+    result_metadata = {
+        "meta_learner_run_id": run.info.run_id,
+        "mlflow_run_id": run.info.run_id,
+        "model_pipeline": pipeline_uri,
+        "n_base_models": len(base_models),
+        "blend_table": output_table,
+        "holdout_rows": len(X_holdout),
+        "base_fit_seconds": base_fit_seconds,
+        "primary_metric": primary_metric,
+        "task_type": task_type
+    }
+    
+    mlflow.log_dict(result_metadata, "result_metadata.json")
+    
+    print(f"✅ Blending complete. Meta-model saved.")
+
+# COMMAND ----------
+
+# Expose the result to downstream tasks of a compiled workflow job
+dbutils.jobs.taskValues.set(key="result", value=result_metadata)
+
+dbutils.notebook.exit(json.dumps(result_metadata))
@@ -0,0 +1,315 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Stack Classwise Microservice
+# MAGIC Runs on Databricks Serverless, stacks every class probability of the base models with one meta-learner per class
+
+# COMMAND ----------
+
+# Get parameters from orchestrator
+dbutils.widgets.text("workflow_id", "")
+dbutils.widgets.text("task_id", "")
+dbutils.widgets.text("config", "{}")
+dbutils.widgets.text("context", "{}")
+dbutils.widgets.text("catalog", "")
+dbutils.widgets.text("schema", "")
+dbutils.widgets.text("table", "")
+dbutils.widgets.text("target", "")
+dbutils.widgets.text("upstream", "{}")
+dbutils.widgets.text("upstream_runs", "{}")
+
+import json
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+import mlflow
+import pandas as pd
+import numpy as np
+from databricks import automl
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.model_selection import KFold, StratifiedKFold
+from sklearn.linear_model import LogisticRegression
+
+from snapshots import load_frame
+from transforms import log_pipeline, upstream_pipeline
+
+workflow_id = dbutils.widgets.get("workflow_id")
+task_id = dbutils.widgets.get("task_id")
+config = json.loads(dbutils.widgets.get("config"))
+context = json.loads(dbutils.widgets.get("context"))
+# Results of upstream tasks: passed by the orchestrator (per-task runs, cached
+# results) or resolved from task values inside a compiled workflow job
+upstream = {
+    **json.loads(dbutils.widgets.get("upstream") or "{}"),
+    **json.loads(dbutils.widgets.get("upstream_runs") or "{}"),
+}
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Load Data
+
+# COMMAND ----------
+
+catalog = dbutils.widgets.get("catalog")
+schema = dbutils.widgets.get("schema")
+table = dbutils.widgets.get("table")
+target = dbutils.widgets.get("target")
+
+# Use routed data from an upstream task if there is one, else the workflow's
+# sample (`context.sample`), else the source table
+routed_tables = [r['output_table'] for r in upstream.values() if r and r.get('output_table')]
+sample_tables = [r['sample_table'] for r in upstream.values() if r and r.get('sample_table')]
+input_table = (routed_tables or sample_tables or [f"{catalog}.{schema}.{table}"])[0]
+
+# Memory-mapped from the workflow's snapshot when it holds this input, and transformed
+# by the fitted feature pipeline (`source.features`) if there is one
+df = load_frame(spark, input_table, upstream)
+print(f"Using data: {input_table}")
+
+X = df.drop(columns=[target])
+y = df[target]
+
+metric_config = context.get('metric', {})
+if 'classification' not in metric_config:
+    raise ValueError("stack_classwise needs a classification metric in context.metric")
+primary_metric = metric_config['classification'][0]  # First metric
+
+classes = np.array(sorted(y.unique()))
+y_codes = np.searchsorted(classes, y.to_numpy())
+
+print(f"Dataset shape: {X.shape}, {len(classes)} classes")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Select Base Models via AutoML
+
+# COMMAND ----------
+
+mlflow.set_experiment(f"/Experiments/ensemble_{workflow_id}")
+
+stack_config = config.get('stack', {})
+classwise_config = stack_config.get('classwise') or {}
+top_n = stack_config.get('top_n') or 3
+
+automl_run = automl.classify(
+    dataset=spark.createDataFrame(df),
+    target_col=target,
+    primary_metric=primary_metric,
+    timeout_minutes=int(context.get('timeout', '10 minutes').split()[0]),
+    experiment_dir=f"/Experiments/automl_{workflow_id}_{task_id}"
+)
+
+runs = mlflow.search_runs(
+    experiment_ids=[automl_run.experiment.experiment_id],
+    order_by=[f"metrics.{primary_metric} DESC"],
+    max_results=top_n
+)
+base_run_ids = runs['run_id'].tolist()
+
+print(f"Top {len(base_run_ids)} models by {primary_metric}:")
+print(runs[['run_id', f'metrics.{primary_metric}']])
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## OOF Probability Tensor
+# MAGIC Every class probability of every base model, as one float32 tensor of shape
+# MAGIC (rows, models, classes).
+
+# COMMAND ----------
+
+fold_type = context.get('fold_type', ['kfold'])[0]
+
+if fold_type == 'stratified':
+    splits = list(StratifiedKFold(n_splits=5, shuffle=True, random_state=42).split(X, y))
+else:
+    splits = list(KFold(n_splits=5, shuffle=True, random_state=42).split(X))
+
+with ThreadPoolExecutor(max_workers=len(base_run_ids)) as pool:
+    base_models = list(pool.map(
+        lambda run_id: mlflow.sklearn.load_model(f"runs:/{run_id}/model"), base_run_ids
+    ))
+
+
+def fold_probabilities(model, train_idx, val_idx):
+    """Fit a model on a fold and predict all class probabilities of its validation rows"""
+    fold_model = clone(model)
+    fold_model.fit(X.iloc[train_idx], y.iloc[train_idx])
+
+    # A fold may miss rare classes: place columns by class, not by position
+    probabilities = np.zeros((len(val_idx), len(classes)), dtype=np.float32)
+    columns = np.searchsorted(classes, fold_model.classes_)
+    probabilities[:, columns] = fold_model.predict_proba(X.iloc[val_idx])
+    return probabilities
+
+
+oof_start = time.time()
+jobs = [(model_idx, val_idx, delayed(fold_probabilities)(model, train_idx, val_idx))
+        for model_idx, model in enumerate(base_models)
+        for train_idx, val_idx in splits]
+fold_results = Parallel(n_jobs=-1)(job for _, _, job in jobs)
+
+oof_tensor = np.zeros((len(X), len(base_models), len(classes)), dtype=np.float32)
+for (model_idx, val_idx, _), probabilities in zip(jobs, fold_results):
+    oof_tensor[val_idx, model_idx, :] = probabilities
+
+oof_seconds = time.time() - oof_start
+print(f"OOF tensor {oof_tensor.shape} ({oof_tensor.nbytes / 1e6:.1f} MB) in {oof_seconds:.1f}s")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Class-Partitioned OOF Table
+# MAGIC One row per (row, class) with the class's probability from every model,
+# MAGIC partitioned by class so each meta-learner reads only its slice.
+
+# COMMAND ----------
+
+model_columns = [f"model_{i}" for i in range(len(base_models))]
+
+n_rows, n_models, n_classes = oof_tensor.shape
+oof_long = pd.DataFrame(
+    oof_tensor.transpose(2, 0, 1).reshape(n_classes * n_rows, n_models),
+    columns=model_columns
+)
+oof_long.insert(0, "row_id", np.tile(np.arange(n_rows), n_classes))
+oof_long.insert(1, "class_index", np.repeat(np.arange(n_classes), n_rows).astype(np.int32))
+oof_long["class_label"] = np.repeat(classes.astype(str), n_rows)
+oof_long["label"] = (y_codes[None, :] == np.arange(n_classes)[:, None]).ravel().astype(np.int8)
+
+output_table = f"{catalog}.{schema}.oof_classwise_{workflow_id}_{task_id}"
+(spark.createDataFrame(oof_long)
+    .write.mode("overwrite")
+    .partitionBy("class_index")
+    .saveAsTable(output_table))
+
+print(f"OOF slices saved to {output_table}")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Train One Meta-Learner per Class
+# MAGIC Locally the classes train in parallel across cores; with
+# MAGIC `classwise.distributed: true` they train on the executors, one class per
+# MAGIC group, reading their partition of the OOF table.
+
+# COMMAND ----------
+
+class ClasswiseMetaLearner:
+    """
+    One-vs-rest meta-learners over the flattened (rows, models * classes)
+    probability matrix; class scores are normalized to sum to one.
+    """
+
+    def __init__(self, classes, learners, n_models):
+        self.classes_ = classes
+        self.learners = learners
+        self.n_models = n_models
+
+    def predict_proba(self, X):
+        tensor = np.asarray(X, dtype=np.float32).reshape(len(X), self.n_models, len(self.classes_))
+        scores = np.column_stack([
+            learner.predict_proba(tensor[:, :, class_idx])[:, 1]
+            for class_idx, learner in enumerate(self.learners)
+        ])
+        return scores / np.clip(scores.sum(axis=1, keepdims=True), 1e-12, None)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def fit_class(features, labels):
+    """Meta-learner for one class: its probability from every model -> is this class"""
+    return LogisticRegression(random_state=42).fit(features, labels)
+
+
+def train_class_group(pdf):
+    """applyInPandas: fit the meta-learner of one class partition"""
+    learner = fit_class(pdf[model_columns].to_numpy(np.float32), pdf["label"].to_numpy())
+    return pd.DataFrame({"class_index": [int(pdf["class_index"].iloc[0])], "learner": [pickle.dumps(learner)]})
+
+
+meta_start = time.time()
+distributed = bool(classwise_config.get('distributed', False))
+
+if distributed:
+    trained = (spark.table(output_table)
+               .select("class_index", "label", *model_columns)
+               .groupBy("class_index")
+               .applyInPandas(train_class_group, schema="class_index int, learner binary")
+               .collect())
+    by_class = {row["class_index"]: pickle.loads(row["learner"]) for row in trained}
+    learners = [by_class[class_idx] for class_idx in range(n_classes)]
+else:
+    learners = Parallel(n_jobs=-1)(
+        delayed(fit_class)(oof_tensor[:, :, class_idx], (y_codes == class_idx).astype(np.int8))
+        for class_idx in range(n_classes)
+    )
+
+meta_seconds = time.time() - meta_start
+meta_learner = ClasswiseMetaLearner(classes, learners, n_models)
+print(f"{n_classes} meta-learners trained in {meta_seconds:.1f}s ({'executors' if distributed else 'local cores'})")
+
+# COMMAND ----------
+
+with mlflow.start_run(run_name=f"{task_id}_classwise_stacking") as run:
+    
+    # Log parameters
+    mlflow.log_param("task_id", task_id)
+    mlflow.log_param("workflow_id", workflow_id)
+    mlflow.log_param("n_base_models", n_models)
+    mlflow.log_param("n_classes", n_classes)
+    mlflow.log_param("fold_type", fold_type)
+    mlflow.log_param("distributed", distributed)
+    mlflow.log_metric("oof_seconds", oof_seconds)
+    mlflow.log_metric("meta_seconds", meta_seconds)
+    
+    # Evaluate the stacked ensemble on the OOF tensor
+    from sklearn.metrics import accuracy_score, f1_score
+    
+    meta_preds = meta_learner.predict(oof_tensor.reshape(n_rows, -1))
+    accuracy = accuracy_score(y, meta_preds)
+    f1 = f1_score(y, meta_preds, average='weighted')
+    mlflow.log_metric("stacked_accuracy", accuracy)
+    mlflow.log_metric("stacked_f1", f1)
+    print(f"Classwise Stacked Ensemble Accuracy: {accuracy:.4f}, F1: {f1:.4f}")
+    
+    # Log meta-learner: input is the (rows, models * classes) probability matrix
+    mlflow.sklearn.log_model(meta_learner, "meta_learner")
+    # The models take transformed features: keep the fitted pipeline with them
+    pipeline_uri = log_pipeline(upstream_pipeline(upstream))
+    
+    # Log base model run IDs for later retrieval
+    mlflow.log_dict({
+        "base_model_runs": base_run_ids
+    }, "base_models.json")
+    
+    mlflow.log_param("oof_table", output_table)
+    
+    result_metadata = {
+        "meta_learner_run_id": run.info.run_id,
+        "mlflow_run_id": run.info.run_id,
+        "model_pipeline": pipeline_uri,
+        "n_base_models": n_models,
+        "n_classes": n_classes,
+        "classes": classes.astype(str).tolist(),
+        "oof_table": output_table,
+        "primary_metric": primary_metric,
+        "task_type": "classification",
+        # The meta-learner takes every class probability of every base model
+        # (rows, models * classes), not one column per model
+        "stack_layout": "classwise"
+    }
+    
+    mlflow.log_dict(result_metadata, "result_metadata.json")
+    
+    print(f"✅ Classwise stacking complete. Meta-learners saved.")
+
+# COMMAND ----------
+
+# Expose the result to downstream tasks of a compiled workflow job
+dbutils.jobs.taskValues.set(key="result", value=result_metadata)
+
+dbutils.notebook.exit(json.dumps(result_metadata))
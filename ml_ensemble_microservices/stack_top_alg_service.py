@@ -0,0 +1,289 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Stack Top-Algorithm Microservice
+# MAGIC Runs on Databricks Serverless, stacks the best AutoML models of every algorithm family:
+# MAGIC one per family, or `stack.top_n_alg` per family (stack_top_n_alg tasks run this notebook)
+
+# COMMAND ----------
+
+# Get parameters from orchestrator
+dbutils.widgets.text("workflow_id", "")
+dbutils.widgets.text("task_id", "")
+dbutils.widgets.text("config", "{}")
+dbutils.widgets.text("context", "{}")
+dbutils.widgets.text("catalog", "")
+dbutils.widgets.text("schema", "")
+dbutils.widgets.text("table", "")
+dbutils.widgets.text("target", "")
+dbutils.widgets.text("upstream", "{}")
+dbutils.widgets.text("upstream_runs", "{}")
+
+import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import mlflow
+import pandas as pd
+import numpy as np
+from databricks import automl
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.model_selection import KFold, StratifiedKFold, train_test_split
+from sklearn.linear_model import LogisticRegression, Ridge
+
+from selection import download_models, search_candidates, select_candidates
+from snapshots import default_cache_dir, load_frame
+from transforms import log_pipeline, upstream_pipeline
+
+workflow_id = dbutils.widgets.get("workflow_id")
+task_id = dbutils.widgets.get("task_id")
+config = json.loads(dbutils.widgets.get("config"))
+context = json.loads(dbutils.widgets.get("context"))
+# Results of upstream tasks: passed by the orchestrator (per-task runs, cached
+# results) or resolved from task values inside a compiled workflow job
+upstream = {
+    **json.loads(dbutils.widgets.get("upstream") or "{}"),
+    **json.loads(dbutils.widgets.get("upstream_runs") or "{}"),
+}
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Load Data
+
+# COMMAND ----------
+
+catalog = dbutils.widgets.get("catalog")
+schema = dbutils.widgets.get("schema")
+table = dbutils.widgets.get("table")
+target = dbutils.widgets.get("target")
+
+# Use routed data from an upstream task if there is one, else the workflow's
+# sample (`context.sample`), else the source table
+routed_tables = [r['output_table'] for r in upstream.values() if r and r.get('output_table')]
+sample_tables = [r['sample_table'] for r in upstream.values() if r and r.get('sample_table')]
+input_table = (routed_tables or sample_tables or [f"{catalog}.{schema}.{table}"])[0]
+
+# Memory-mapped from the workflow's snapshot when it holds this input, and transformed
+# by the fitted feature pipeline (`source.features`) if there is one
+df = load_frame(spark, input_table, upstream)
+print(f"Using data: {input_table}")
+
+X = df.drop(columns=[target])
+y = df[target]
+
+print(f"Dataset shape: {X.shape}")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Candidate Runs
+# MAGIC Candidates are the runs of `stack.experiment_id` if set (e.g. an AutoML
+# MAGIC experiment shared with other stacking tasks), else of a new AutoML run.
+
+# COMMAND ----------
+
+mlflow.set_experiment(f"/Experiments/ensemble_{workflow_id}")
+
+stack_config = config.get('stack', {})
+max_families = stack_config.get('top_n')
+per_family = int(stack_config.get('top_n_alg') or 1)
+cache_dir = stack_config.get('cache_dir') or default_cache_dir(catalog, schema, "selection")
+
+# Determine task type from context
+metric_config = context.get('metric', {})
+if 'classification' in metric_config:
+    task_type = "classification"
+    primary_metric = metric_config['classification'][0]  # First metric
+else:
+    task_type = "regression"
+    primary_metric = metric_config['regression'][0]
+
+experiment_id = stack_config.get('experiment_id')
+if not experiment_id:
+    automl_run = automl.classify(
+        dataset=spark.createDataFrame(df),
+        target_col=target,
+        primary_metric=primary_metric,
+        timeout_minutes=int(context.get('timeout', '10 minutes').split()[0]),
+        experiment_dir=f"/Experiments/automl_{workflow_id}_{task_id}"
+    ) if task_type == "classification" else automl.regress(
+        dataset=spark.createDataFrame(df),
+        target_col=target,
+        primary_metric=primary_metric,
+        timeout_minutes=int(context.get('timeout', '10 minutes').split()[0]),
+        experiment_dir=f"/Experiments/automl_{workflow_id}_{task_id}"
+    )
+    experiment_id = automl_run.experiment.experiment_id
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Select the Best Models per Family
+# MAGIC One search_runs call pulls every run of the experiment; the best
+# MAGIC `per_family` runs of each family are picked in pandas.
+
+# COMMAND ----------
+
+select_start = time.time()
+candidates = search_candidates(experiment_id, cache_dir)
+selected = select_candidates(
+    candidates, primary_metric, per_family=per_family,
+    max_families=int(max_families) if max_families else None,
+    family=stack_config.get('family_param')
+)
+select_seconds = time.time() - select_start
+
+if selected.empty:
+    raise ValueError(f"No finished runs with metrics.{primary_metric} in experiment {experiment_id}")
+
+base_run_ids = selected['run_id'].tolist()
+families = selected['family'].tolist()
+
+print(f"Top {per_family} models of {selected['family'].nunique()} families by {primary_metric} "
+      f"(from {len(candidates)} runs):")
+print(selected[['family', 'run_id', f'metrics.{primary_metric}']])
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## OOF Predictions
+
+# COMMAND ----------
+
+fold_type = context.get('fold_type', ['kfold'])[0]
+
+if fold_type == 'stratified':
+    splits = list(StratifiedKFold(n_splits=5, shuffle=True, random_state=42).split(X, y))
+elif fold_type == 'kfold':
+    splits = list(KFold(n_splits=5, shuffle=True, random_state=42).split(X))
+else:
+    # Default to simple train/test split
+    train_idx, val_idx = train_test_split(range(len(X)), test_size=0.2, random_state=42)
+    splits = [(train_idx, val_idx)]
+
+# Download the selected models in parallel threads, then load them in parallel
+download_start = time.time()
+model_paths = download_models(base_run_ids, tempfile.mkdtemp())
+with ThreadPoolExecutor(max_workers=len(model_paths)) as pool:
+    base_models = list(pool.map(mlflow.sklearn.load_model, model_paths))
+download_seconds = time.time() - download_start
+print(f"{len(base_models)} models downloaded and loaded in {download_seconds:.1f}s")
+
+
+def fold_predictions(model, train_idx, val_idx):
+    """Fit a model on a fold and predict its validation rows"""
+    fold_model = clone(model)
+    fold_model.fit(X.iloc[train_idx], y.iloc[train_idx])
+    if task_type == "classification":
+        return fold_model.predict_proba(X.iloc[val_idx])[:, 1]
+    return fold_model.predict(X.iloc[val_idx])
+
+
+oof_start = time.time()
+jobs = [(model_idx, val_idx, delayed(fold_predictions)(model, train_idx, val_idx))
+        for model_idx, model in enumerate(base_models)
+        for train_idx, val_idx in splits]
+fold_results = Parallel(n_jobs=-1)(job for _, _, job in jobs)
+
+oof_predictions = np.zeros((len(X), len(base_models)))
+for (model_idx, val_idx, _), predictions in zip(jobs, fold_results):
+    oof_predictions[val_idx, model_idx] = predictions
+
+# Rows outside every validation fold (train/test split) have no OOF prediction
+oof_rows = np.unique(np.concatenate([val_idx for _, val_idx in splits]))
+oof_seconds = time.time() - oof_start
+print(f"OOF predictions for {len(oof_rows)} rows in {oof_seconds:.1f}s")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Train Meta-Learner (Stacking)
+
+# COMMAND ----------
+
+with mlflow.start_run(run_name=f"{task_id}_top_alg_stacking") as run:
+    
+    # Log parameters
+    mlflow.log_param("task_id", task_id)
+    mlflow.log_param("workflow_id", workflow_id)
+    mlflow.log_param("n_base_models", len(base_models))
+    mlflow.log_param("families", ",".join(dict.fromkeys(families)))
+    mlflow.log_param("per_family", per_family)
+    mlflow.log_param("fold_type", fold_type)
+    mlflow.log_param("automl_experiment_id", experiment_id)
+    mlflow.log_metric("select_seconds", select_seconds)
+    mlflow.log_metric("download_seconds", download_seconds)
+    mlflow.log_metric("oof_seconds", oof_seconds)
+    
+    # Train meta-learner on OOF predictions
+    if task_type == "classification":
+        meta_learner = LogisticRegression(random_state=42)
+    else:
+        meta_learner = Ridge(random_state=42)
+    
+    meta_learner.fit(oof_predictions[oof_rows], y.iloc[oof_rows])
+    
+    # Evaluate meta-learner
+    from sklearn.metrics import accuracy_score, f1_score, mean_squared_error, r2_score
+    
+    meta_preds = meta_learner.predict(oof_predictions[oof_rows])
+    
+    if task_type == "classification":
+        accuracy = accuracy_score(y.iloc[oof_rows], meta_preds)
+        f1 = f1_score(y.iloc[oof_rows], meta_preds, average='weighted')
+        mlflow.log_metric("stacked_accuracy", accuracy)
+        mlflow.log_metric("stacked_f1", f1)
+        print(f"Stacked Ensemble Accuracy: {accuracy:.4f}, F1: {f1:.4f}")
+    else:
+        mse = mean_squared_error(y.iloc[oof_rows], meta_preds)
+        r2 = r2_score(y.iloc[oof_rows], meta_preds)
+        mlflow.log_metric("stacked_mse", mse)
+        mlflow.log_metric("stacked_r2", r2)
+        print(f"Stacked Ensemble MSE: {mse:.4f}, R2: {r2:.4f}")
+    
+    # Log meta-learner
+    mlflow.sklearn.log_model(meta_learner, "meta_learner")
+    # The models take transformed features: keep the fitted pipeline with them
+    pipeline_uri = log_pipeline(upstream_pipeline(upstream))
+    
+    # Log base model run IDs and the selection for later retrieval
+    mlflow.log_dict({
+        "base_model_runs": base_run_ids,
+        "families": families
+    }, "base_models.json")
+    mlflow.log_text(
+        selected[['family', 'run_id', f'metrics.{primary_metric}']].to_csv(index=False), "selection.csv"
+    )
+    
+    # Save OOF predictions to Unity Catalog for potential use by other tasks
+    oof_df = pd.DataFrame(oof_predictions[oof_rows], columns=[f"model_{i}" for i in range(len(base_models))])
+    oof_df[target] = y.iloc[oof_rows].values
+    
+    output_table = f"{catalog}.{schema}.oof_predictions_{workflow_id}_{task_id}"
+    spark.createDataFrame(oof_df).write.mode("overwrite").saveAsTable(output_table)
+    
+    mlflow.log_param("oof_table", output_table)
+    
+    result_metadata = {
+        "meta_learner_run_id": run.info.run_id,
+        "mlflow_run_id": run.info.run_id,
+        "model_pipeline": pipeline_uri,
+        "n_base_models": len(base_models),
+        "families": families,
+        "automl_experiment_id": experiment_id,
+        "oof_table": output_table,
+        "primary_metric": primary_metric,
+        "task_type": task_type
+    }
+    
+    mlflow.log_dict(result_metadata, "result_metadata.json")
+    
+    print(f"✅ Stacking complete. Meta-learner saved.")
+
+# COMMAND ----------
+
+# Expose the result to downstream tasks of a compiled workflow job
+dbutils.jobs.taskValues.set(key="result", value=result_metadata)
+
+dbutils.notebook.exit(json.dumps(result_metadata))
@@ -14,20 +14,40 @@ dbutils.widgets.text("catalog", "")
 dbutils.widgets.text("schema", "")
 dbutils.widgets.text("table", "")
 dbutils.widgets.text("target", "")
+dbutils.widgets.text("upstream", "{}")
+dbutils.widgets.text("upstream_runs", "{}")
 
 import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 import mlflow
 import pandas as pd
 import numpy as np
+from mlflow.models import infer_signature
 from databricks import automl
 from sklearn.model_selection import KFold, StratifiedKFold
 from sklearn.linear_model import LogisticRegression
 from sklearn.ensemble import RandomForestClassifier
 
+import transforms
+from snapshots import load_frame
+from transforms import load_pipeline, log_pipeline, upstream_pipeline
+
 workflow_id = dbutils.widgets.get("workflow_id")
 task_id = dbutils.widgets.get("task_id")
 config = json.loads(dbutils.widgets.get("config"))
 context = json.loads(dbutils.widgets.get("context"))
+# Results of upstream tasks: passed by the orchestrator (per-task runs, cached
+# results) or resolved from task values inside a compiled workflow job
+upstream = {
+    **json.loads(dbutils.widgets.get("upstream") or "{}"),
+    **json.loads(dbutils.widgets.get("upstream_runs") or "{}"),
+}
 
 # COMMAND ----------
 
@@ -41,17 +61,16 @@ schema = dbutils.widgets.get("schema")
 table = dbutils.widgets.get("table")
 target = dbutils.widgets.get("target")
 
-# Check if data was already routed/clustered
-input_table = f"{catalog}.{schema}.{table}"
+# Use routed data from an upstream task if there is one, else the workflow's
+# sample (`context.sample`), else the source table
+routed_tables = [r['output_table'] for r in upstream.values() if r and r.get('output_table')]
+sample_tables = [r['sample_table'] for r in upstream.values() if r and r.get('sample_table')]
+input_table = (routed_tables or sample_tables or [f"{catalog}.{schema}.{table}"])[0]
 
-# Look for clustered data from previous task
-try:
-    clustered_table = f"{catalog}.{schema}.{table}_clustered_{workflow_id}_route_cluster"
-    df = spark.table(clustered_table).toPandas()
-    print(f"Using clustered data: {clustered_table}")
-except:
-    df = spark.table(input_table).toPandas()
-    print(f"Using original data: {input_table}")
+# Memory-mapped from the workflow's snapshot when it holds this input, and transformed
+# by the fitted feature pipeline (`source.features`) if there is one
+df = load_frame(spark, input_table, upstream)
+print(f"Using data: {input_table}")
 
 X = df.drop(columns=[target])
 y = df[target]
@@ -140,15 +159,28 @@ print(f"Generating OOF predictions using {fold_type} with {len(splits)} folds")
 
 # COMMAND ----------
 
+# Download the selected models once, in parallel; the same copies are
+# bundled into the composite model below
+base_run_ids = runs.head(top_n)['run_id'].tolist()
+base_names = [f"base_{i}" for i in range(len(base_run_ids))]
+bundle_dir = tempfile.mkdtemp()
+
+with ThreadPoolExecutor(max_workers=len(base_run_ids)) as pool:
+    base_paths = list(pool.map(
+        lambda name_run: mlflow.artifacts.download_artifacts(
+            artifact_uri=f"runs:/{name_run[1]}/model",
+            dst_path=os.path.join(bundle_dir, name_run[0])
+        ),
+        zip(base_names, base_run_ids)
+    ))
+
 # Load each top model and generate OOF predictions
 oof_predictions = np.zeros((len(X), len(runs)))
+base_models = []
 
-for model_idx, (run_id, row) in enumerate(runs.head(top_n).iterrows()):
-    run_id = row['run_id']
-    
-    # Load model from MLflow
-    model_uri = f"runs:/{run_id}/model"
-    model = mlflow.sklearn.load_model(model_uri)
+for model_idx, model_path in enumerate(base_paths):
+    model = mlflow.sklearn.load_model(model_path)
+    base_models.append(model)
     
     # Generate OOF predictions
     oof_preds = np.zeros(len(X))
@@ -173,6 +205,269 @@ for model_idx, (run_id, row) in enumerate(runs.head(top_n).iterrows()):
 
 # COMMAND ----------
 
+# MAGIC %md
+# MAGIC ## Composite Model
+# MAGIC The base models and the meta-learner are registered as one pyfunc model, so
+# MAGIC consumers download a single artifact instead of one per member. With a feature
+# MAGIC pipeline the model takes raw rows and applies the fitted pipeline itself.
+
+# COMMAND ----------
+
+class StackedEnsembleModel(mlflow.pyfunc.PythonModel):
+    """
+    Stacked ensemble as one pyfunc. Members load lazily, in parallel threads,
+    on the first predict; each batch runs one call per member. Raw rows go
+    through the workflow's fitted pipeline (`feature_pipeline`) first.
+    """
+
+    def __init__(self, base_names, task_type):
+        self.base_names = base_names
+        self.task_type = task_type
+
+    def load_context(self, context):
+        # Only remember where the members are: loading waits for the first predict
+        self._paths = dict(context.artifacts)
+        self._pipeline = load_pipeline(self._paths["feature_pipeline"]) if "feature_pipeline" in self._paths else None
+        self._members = None
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=len(self.base_names) + 1)
+        self.cold_start_seconds = None
+
+    def _load_member(self, name):
+        # Members compiled to ONNX (and verified) run on onnxruntime
+        if f"{name}_onnx" in self._paths:
+            return OnnxMember(self._paths[f"{name}_onnx"])
+        return mlflow.sklearn.load_model(self._paths[name])
+
+    def _load_members(self):
+        with self._lock:
+            if self._members is not None:
+                return
+            start = time.time()
+            # A fused stack replaces every member with one graph
+            names = ["stack"] if "stack_onnx" in self._paths else self.base_names + ["meta_learner"]
+            self._members = dict(zip(names, self._pool.map(self._load_member, names)))
+            self.cold_start_seconds = time.time() - start
+
+    def _base_prediction(self, name, model_input):
+        model = self._members[name]
+        if self.task_type == "classification":
+            return model.predict_proba(model_input)[:, 1]
+        return model.predict(model_input)
+
+    def predict(self, context, model_input, params=None):
+        if self._members is None:
+            self._load_members()
+        if self._pipeline is not None:
+            model_input = self._pipeline.apply(model_input)
+
+        if "stack" in self._members:
+            outputs = self._members["stack"].run(model_input)
+            result = pd.DataFrame({"prediction": outputs[0].ravel()})
+            if self.task_type == "classification":
+                result["probability"] = outputs[1][:, 1]
+            return result
+
+        # Same column layout as the OOF matrix the meta-learner was trained on
+        stacked = np.column_stack(list(self._pool.map(
+            lambda name: self._base_prediction(name, model_input), self.base_names
+        )))
+
+        meta_learner = self._members["meta_learner"]
+        result = pd.DataFrame({"prediction": meta_learner.predict(stacked)})
+        if self.task_type == "classification":
+            result["probability"] = meta_learner.predict_proba(stacked)[:, 1]
+        return result
+
+
+class OnnxMember:
+    """ONNX-compiled member with the sklearn predict / predict_proba interface"""
+
+    def __init__(self, model):
+        import onnxruntime as ort
+        # `model` is a path or a serialized graph
+        self.session = ort.InferenceSession(model, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def run(self, features):
+        if isinstance(features, pd.DataFrame) and set(self.input_names) <= set(features.columns):
+            feed = onnx_feed(features[self.input_names])
+        else:
+            feed = {self.input_names[0]: np.asarray(features, dtype=np.float32)}
+        return self.session.run(None, feed)
+
+    def predict(self, features):
+        return self.run(features)[0].ravel()
+
+    def predict_proba(self, features):
+        return self.run(features)[1]
+
+
+def onnx_feed(features):
+    """One (n, 1) input per column, typed as in `onnx_input_types`"""
+    feed = {}
+    for column in features.columns:
+        values = features[[column]].to_numpy()
+        kind = features[column].dtype.kind
+        if kind == "f":
+            feed[column] = values.astype(np.float32)
+        elif kind in "iub":
+            feed[column] = values.astype(np.int64)
+        else:
+            feed[column] = values.astype(str).astype(object)
+    return feed
+
+
+def merge_requirements(requirement_files):
+    """Union of the members' pip requirements with one entry per package"""
+    merged = {}
+    for path in requirement_files:
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            for line in f.read().splitlines():
+                line = line.strip()
+                if not line or line.startswith(("#", "-")):
+                    continue
+                name = re.split(r"[\s<>=!~;\[@]", line, maxsplit=1)[0].lower().replace("_", "-")
+                if name in merged and merged[name] != line:
+                    print(f"Conflicting requirement {line!r}, keeping {merged[name]!r}")
+                    continue
+                merged[name] = line
+    return sorted(merged.values())
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## ONNX Compilation
+# MAGIC With `stack.compile: onnx` each member is converted to ONNX, with
+# MAGIC `onnx_fused` the whole stack becomes one graph. A compiled graph is kept only
+# MAGIC if it matches the original on a holdout sample; members that fail to convert
+# MAGIC or verify stay on sklearn.
+
+# COMMAND ----------
+
+def onnx_input_types(features):
+    """ONNX input declarations matching `onnx_feed`"""
+    from skl2onnx.common.data_types import FloatTensorType, Int64TensorType, StringTensorType
+
+    types = []
+    for column in features.columns:
+        kind = features[column].dtype.kind
+        tensor_type = FloatTensorType if kind == "f" else Int64TensorType if kind in "iub" else StringTensorType
+        types.append((column, tensor_type([None, 1])))
+    return types
+
+
+def scores(model, features):
+    """What the stack consumes of a model: P(class 1) or the prediction"""
+    if task_type == "classification":
+        return model.predict_proba(features)[:, 1]
+    return model.predict(features)
+
+
+def compile_to_onnx(model, features, expected, input_types, tolerance):
+    """
+    Convert a fitted model and verify it against `expected` on `features`.
+    Returns (graph, max deviation); the graph is None if conversion or
+    verification failed.
+    """
+    from skl2onnx import to_onnx
+
+    final = model.steps[-1][1] if hasattr(model, "steps") else model
+    options = {id(final): {"zipmap": False}} if task_type == "classification" else None
+    try:
+        graph = to_onnx(model, initial_types=input_types, options=options)
+        actual = scores(OnnxMember(graph.SerializeToString()), features)
+    except Exception as e:
+        print(f"  {type(model).__name__}: not convertible ({e})")
+        return None, None
+
+    deviation = float(np.max(np.abs(actual - expected))) if len(expected) else 0.0
+    if not np.allclose(actual, expected, rtol=tolerance, atol=tolerance):
+        print(f"  {type(model).__name__}: parity check failed (max deviation {deviation:.2e})")
+        return None, deviation
+    return graph, deviation
+
+
+def build_stacking_estimator(base_models, meta_learner):
+    """The fitted base models and meta-learner as one sklearn stacking estimator"""
+    from sklearn.ensemble import StackingClassifier, StackingRegressor
+    from sklearn.preprocessing import LabelEncoder
+    from sklearn.utils import Bunch
+
+    estimators = list(zip(base_names, base_models))
+    if task_type == "classification":
+        stack = StackingClassifier(estimators=estimators, final_estimator=meta_learner)
+        stack.stack_method_ = ["predict_proba"] * len(base_models)
+        stack.classes_ = meta_learner.classes_
+        stack._label_encoder = LabelEncoder().fit(meta_learner.classes_)
+    else:
+        stack = StackingRegressor(estimators=estimators, final_estimator=meta_learner)
+        stack.stack_method_ = ["predict"] * len(base_models)
+    stack.estimators_ = list(base_models)
+    stack.named_estimators_ = Bunch(**dict(estimators))
+    stack.final_estimator_ = meta_learner
+    return stack
+
+
+def compile_stack(mode, base_models, meta_learner, holdout, tolerance, out_dir):
+    """
+    Compile the stack for onnxruntime. Returns the extra composite artifacts
+    (`stack_onnx` or `{member}_onnx`) and the max deviation of every graph.
+    """
+    input_types = onnx_input_types(holdout)
+    stacked = np.column_stack([scores(model, holdout) for model in base_models])
+    expected = scores(meta_learner, stacked)
+    artifacts, deviations = {}, {}
+
+    def save(name, graph):
+        path = os.path.join(out_dir, f"{name}.onnx")
+        with open(path, "wb") as f:
+            f.write(graph.SerializeToString())
+        artifacts[f"{name}_onnx"] = path
+
+    if mode == "onnx_fused":
+        print("Compiling the fused stack")
+        graph, deviations["stack"] = compile_to_onnx(
+            build_stacking_estimator(base_models, meta_learner), holdout, expected, input_types, tolerance
+        )
+        if graph is not None:
+            save("stack", graph)
+            return artifacts, deviations
+        print("Fused stack unavailable, compiling members instead")
+
+    from skl2onnx.common.data_types import FloatTensorType
+
+    members = [(name, model, holdout, scores(model, holdout), input_types)
+               for name, model in zip(base_names, base_models)]
+    members.append(("meta_learner", meta_learner, stacked, expected,
+                    [("stacked", FloatTensorType([None, stacked.shape[1]]))]))
+
+    for name, model, features, member_expected, member_types in members:
+        print(f"Compiling {name}")
+        graph, deviations[name] = compile_to_onnx(model, features, member_expected, member_types, tolerance)
+        if graph is not None:
+            save(name, graph)
+
+    return artifacts, deviations
+
+
+def predict_latency(artifacts, features, repeats=50):
+    """Median latency in milliseconds of a composite model built from `artifacts`"""
+    model = StackedEnsembleModel(base_names, task_type)
+    model.load_context(SimpleNamespace(artifacts=artifacts))
+    model.predict(None, features)
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict(None, features)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC ## Train Meta-Learner (Stacking)
 
@@ -218,9 +513,82 @@ with mlflow.start_run(run_name=f"{task_id}_stacking") as run:
     
     # Log base model run IDs for later retrieval
     mlflow.log_dict({
-        "base_model_runs": runs.head(top_n)['run_id'].tolist()
+        "base_model_runs": base_run_ids
     }, "base_models.json")
     
+    # Register all members as one composite model with a shared environment
+    meta_path = os.path.join(bundle_dir, "meta_learner")
+    mlflow.sklearn.save_model(meta_learner, meta_path)
+    artifacts = {**dict(zip(base_names, base_paths)), "meta_learner": meta_path}
+    pip_requirements = merge_requirements(
+        [os.path.join(path, "requirements.txt") for path in artifacts.values()]
+    )
+    
+    # Optionally serve members (or the fused stack) through onnxruntime
+    compile_mode = stack_config.get('compile') or 'none'
+    mlflow.log_param("compile", compile_mode)
+    if compile_mode in ('onnx', 'onnx_fused'):
+        import onnxruntime
+        
+        holdout = X.iloc[splits[-1][1]].head(1000)
+        onnx_artifacts, deviations = compile_stack(
+            compile_mode, base_models, meta_learner, holdout,
+            float(stack_config.get('onnx_tolerance', 1e-4)), bundle_dir
+        )
+        for name, deviation in deviations.items():
+            if deviation is not None:
+                mlflow.log_metric(f"onnx_max_deviation_{name}", deviation)
+        mlflow.log_param("onnx_compiled", ",".join(sorted(k[:-len("_onnx")] for k in onnx_artifacts)) or "none")
+        
+        if onnx_artifacts:
+            for batch_size in (1, 64):
+                batch = holdout.head(batch_size)
+                sklearn_ms = predict_latency(artifacts, batch)
+                onnx_ms = predict_latency({**artifacts, **onnx_artifacts}, batch)
+                mlflow.log_metric(f"latency_ms_sklearn_batch{batch_size}", sklearn_ms)
+                mlflow.log_metric(f"latency_ms_onnx_batch{batch_size}", onnx_ms)
+                print(f"Batch {batch_size}: sklearn {sklearn_ms:.2f} ms, onnx {onnx_ms:.2f} ms")
+            artifacts.update(onnx_artifacts)
+            if not any(r.startswith("onnxruntime") for r in pip_requirements):
+                pip_requirements.append(f"onnxruntime=={onnxruntime.__version__}")
+    
+    sample_output = pd.DataFrame({"prediction": meta_preds[:100]})
+    if task_type == "classification":
+        sample_output["probability"] = meta_learner.predict_proba(oof_predictions[:100])[:, 1]
+    
+    # The members take transformed features: the composite applies the fitted
+    # pipeline, whose columns then take raw numbers
+    pipeline = upstream_pipeline(upstream)
+    pipeline_uri = log_pipeline(pipeline)
+    example = X.head(100)
+    if pipeline is not None:
+        artifacts["feature_pipeline"] = pipeline_uri
+        example = example.astype({c: "float64" for c in pipeline.columns})
+    
+    registered_model_name = stack_config.get(
+        'registered_model_name', f"{catalog}.{schema}.stack_{workflow_id}_{task_id}"
+    )
+    model_info = mlflow.pyfunc.log_model(
+        artifact_path="stacked_model",
+        python_model=StackedEnsembleModel(base_names, task_type),
+        artifacts=artifacts,
+        # StackedEnsembleModel references transforms.load_pipeline even without a pipeline
+        code_paths=[transforms.__file__],
+        pip_requirements=pip_requirements,
+        signature=infer_signature(example, sample_output),
+        # Transformed rows are no example of the raw input
+        input_example=X.head(5) if pipeline is None else None,
+        registered_model_name=registered_model_name
+    )
+    
+    # Cold start as a consumer sees it: load the composite and predict one row
+    cold_start = time.time()
+    composite = mlflow.pyfunc.load_model(model_info.model_uri)
+    composite.predict(X.head(1))
+    mlflow.log_metric("cold_start_seconds", time.time() - cold_start)
+    mlflow.log_metric("member_load_seconds", composite.unwrap_python_model().cold_start_seconds)
+    print(f"Registered composite model {registered_model_name}")
+    
     # Save OOF predictions to Unity Catalog for potential use by other tasks
     oof_df = pd.DataFrame(oof_predictions, columns=[f"model_{i}" for i in range(top_n)])
     oof_df[target] = y.values
@@ -232,8 +600,12 @@ with mlflow.start_run(run_name=f"{task_id}_stacking") as run:
     
     result_metadata = {
         "meta_learner_run_id": run.info.run_id,
+        "mlflow_run_id": run.info.run_id,
         "n_base_models": top_n,
         "oof_table": output_table,
+        "model_uri": model_info.model_uri,
+        "model_pipeline": pipeline_uri,
+        "registered_model": registered_model_name,
         "primary_metric": primary_metric,
         "task_type": task_type
     }
@@ -244,4 +616,7 @@ with mlflow.start_run(run_name=f"{task_id}_stacking") as run:
 
 # COMMAND ----------
 
+# Expose the result to downstream tasks of a compiled workflow job
+dbutils.jobs.taskValues.set(key="result", value=result_metadata)
+
 dbutils.notebook.exit(json.dumps(result_metadata))
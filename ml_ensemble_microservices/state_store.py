@@ -0,0 +1,458 @@
+"""
+Durable workflow state for the Streamlit orchestrator.
+
+Workflow and task rows are written incrementally on every state transition,
+so all users of the app see the same workflows and a restarted orchestrator
+can resume polling in-flight runs without relaunching them.
+
+Backends:
+- SQLite for local use (default)
+- Postgres / Lakebase for production
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Column definitions; new columns are added to existing databases on startup
+TABLES: Dict[str, Dict[str, str]] = {
+    "obsrv_workflows": {
+        "workflow_id": "TEXT PRIMARY KEY",
+        "name": "TEXT",
+        "owner": "TEXT",
+        "mode": "TEXT",
+        "priority": "TEXT",
+        "status": "TEXT NOT NULL",
+        "job_id": "BIGINT",
+        "run_id": "BIGINT",
+        "context_json": "TEXT",
+        "dataset_size": "BIGINT",
+        "speculation_wasted_seconds": "DOUBLE PRECISION",
+        "created_at": "DOUBLE PRECISION",
+        "updated_at": "DOUBLE PRECISION",
+    },
+    "obsrv_tasks": {
+        "workflow_id": "TEXT NOT NULL",
+        "task_id": "TEXT NOT NULL",
+        "position": "INTEGER",
+        "task_type": "TEXT NOT NULL",
+        "config_json": "TEXT",
+        "depends_on_json": "TEXT",
+        "status": "TEXT NOT NULL",
+        "job_id": "BIGINT",
+        "job_run_id": "BIGINT",
+        "speculative_run_id": "BIGINT",
+        "result_json": "TEXT",
+        "error": "TEXT",
+        "cache_key": "TEXT",
+        "estimated_seconds": "DOUBLE PRECISION",
+        "compute": "TEXT",
+        "placement_reason": "TEXT",
+        # Timeline (epoch seconds): orchestrator submit, run start/end, result fetched
+        "submitted_at": "DOUBLE PRECISION",
+        "started_at": "DOUBLE PRECISION",
+        "ended_at": "DOUBLE PRECISION",
+        "fetched_at": "DOUBLE PRECISION",
+        "fetch_seconds": "DOUBLE PRECISION",
+        "updated_at": "DOUBLE PRECISION",
+    },
+    "obsrv_task_cache": {
+        "cache_key": "TEXT PRIMARY KEY",
+        "task_type": "TEXT NOT NULL",
+        "workflow_id": "TEXT",
+        "task_id": "TEXT",
+        "result_json": "TEXT",
+        "output_table": "TEXT",
+        "mlflow_run_id": "TEXT",
+        "created_at": "DOUBLE PRECISION",
+    },
+    "obsrv_task_runtimes": {
+        "task_type": "TEXT NOT NULL",
+        "size_bucket": "INTEGER NOT NULL",
+        "compute": "TEXT",
+        "duration_seconds": "DOUBLE PRECISION NOT NULL",
+        "recorded_at": "DOUBLE PRECISION",
+    },
+}
+
+TABLE_CONSTRAINTS = {
+    "obsrv_tasks": "PRIMARY KEY (workflow_id, task_id)",
+}
+
+INDEXES = [
+    ("obsrv_workflows_status_idx", "obsrv_workflows", "status"),
+    ("obsrv_tasks_status_idx", "obsrv_tasks", "status"),
+    ("obsrv_tasks_run_idx", "obsrv_tasks", "job_run_id"),
+    ("obsrv_task_runtimes_type_idx", "obsrv_task_runtimes", "task_type, recorded_at"),
+]
+
+# Fields exposed as Python objects and stored as JSON text
+JSON_FIELDS = {"context", "config", "depends_on", "result"}
+
+
+def _encode(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Map API fields onto column values"""
+    return {
+        f"{key}_json" if key in JSON_FIELDS else key:
+        json.dumps(value) if key in JSON_FIELDS and value is not None else value
+        for key, value in fields.items()
+    }
+
+
+def _decode(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a row onto API fields"""
+    decoded = {}
+    for column, value in row.items():
+        if column.endswith("_json") and column[:-5] in JSON_FIELDS:
+            decoded[column[:-5]] = json.loads(value) if value is not None else None
+        else:
+            decoded[column] = value
+    return decoded
+
+
+class StateStore(ABC):
+    """Pluggable backend for workflow and task state"""
+
+    @abstractmethod
+    def create_workflow(self, workflow: Dict[str, Any], tasks: List[Dict[str, Any]]):
+        """Insert a workflow and its tasks atomically"""
+
+    @abstractmethod
+    def update_workflow(self, workflow_id: str, **fields: Any):
+        """Write the changed fields of a workflow"""
+
+    @abstractmethod
+    def update_task(self, workflow_id: str, task_id: str, **fields: Any):
+        """Write the changed fields of a task"""
+
+    @abstractmethod
+    def get_workflow(self, workflow_id: str) -> Optional[Dict[str, Any]]:
+        """Load a workflow with its tasks"""
+
+    @abstractmethod
+    def list_workflows(
+        self,
+        status: Optional[str] = None,
+        limit: Optional[int] = 50
+    ) -> List[Dict[str, Any]]:
+        """Load the most recent workflows with their tasks"""
+
+    @abstractmethod
+    def get_cached_result(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Load the memoized successful result for a task cache key"""
+
+    @abstractmethod
+    def put_cached_result(self, cache_key: str, entry: Dict[str, Any]):
+        """Memoize a successful task result under its cache key"""
+
+    @abstractmethod
+    def record_runtime(
+        self,
+        task_type: str,
+        size_bucket: int,
+        duration_seconds: float,
+        compute: Optional[str] = None
+    ):
+        """Append one measured task runtime"""
+
+    @abstractmethod
+    def runtime_samples(
+        self,
+        task_type: str,
+        limit: int = 50,
+        compute: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Most recent runtimes of a task type (on one compute, if given) with their size buckets"""
+
+
+class SQLStateStore(StateStore):
+    """StateStore over a DB-API connection; subclasses provide the connection"""
+
+    placeholder = "?"
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._init_schema()
+
+    @abstractmethod
+    def _connection(self) -> Any:
+        """Return an open DB-API connection"""
+
+    @abstractmethod
+    def _existing_columns(self, table: str) -> Set[str]:
+        """Return the columns currently defined on a table"""
+
+    def _transaction(self, statements: List[Tuple[str, tuple]]) -> List[Dict[str, Any]]:
+        """Run statements in one transaction, returning rows of the last one"""
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.cursor()
+            try:
+                for sql, params in statements:
+                    cursor.execute(sql.replace("?", self.placeholder), params)
+                columns = [d[0] for d in cursor.description] if cursor.description else []
+                rows = cursor.fetchall() if cursor.description else []
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+        return [dict(zip(columns, row)) for row in rows]
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        return self._transaction([(sql, params)])
+
+    def _init_schema(self):
+        for table, columns in TABLES.items():
+            definitions = [f"{name} {ddl}" for name, ddl in columns.items()]
+            if table in TABLE_CONSTRAINTS:
+                definitions.append(TABLE_CONSTRAINTS[table])
+            self._execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(definitions)})")
+
+            existing = self._existing_columns(table)
+            for name, ddl in columns.items():
+                if name not in existing:
+                    self._execute(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}")
+
+        for index, table, column in INDEXES:
+            self._execute(f"CREATE INDEX IF NOT EXISTS {index} ON {table} ({column})")
+
+    @staticmethod
+    def _insert(table: str, row: Dict[str, Any]) -> Tuple[str, tuple]:
+        columns = ", ".join(row)
+        values = ", ".join("?" for _ in row)
+        return f"INSERT INTO {table} ({columns}) VALUES ({values})", tuple(row.values())
+
+    def create_workflow(self, workflow: Dict[str, Any], tasks: List[Dict[str, Any]]):
+        now = time.time()
+        statements = [
+            self._insert("obsrv_workflows", _encode({
+                "created_at": now, **workflow, "updated_at": now
+            }))
+        ]
+        for position, task in enumerate(tasks):
+            statements.append(self._insert("obsrv_tasks", _encode({
+                "workflow_id": workflow["workflow_id"],
+                "position": position,
+                **task,
+                "updated_at": now,
+            })))
+        self._transaction(statements)
+
+    def _update(self, table: str, where: Dict[str, Any], fields: Dict[str, Any]):
+        row = _encode({**fields, "updated_at": time.time()})
+        assignments = ", ".join(f"{column} = ?" for column in row)
+        conditions = " AND ".join(f"{column} = ?" for column in where)
+        self._execute(
+            f"UPDATE {table} SET {assignments} WHERE {conditions}",
+            tuple(row.values()) + tuple(where.values())
+        )
+
+    def update_workflow(self, workflow_id: str, **fields: Any):
+        self._update("obsrv_workflows", {"workflow_id": workflow_id}, fields)
+
+    def update_task(self, workflow_id: str, task_id: str, **fields: Any):
+        self._update("obsrv_tasks", {"workflow_id": workflow_id, "task_id": task_id}, fields)
+
+    def _attach_tasks(self, workflows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not workflows:
+            return []
+
+        ids = [w["workflow_id"] for w in workflows]
+        rows = self._execute(
+            f"SELECT * FROM obsrv_tasks WHERE workflow_id IN ({', '.join('?' for _ in ids)}) "
+            f"ORDER BY position",
+            tuple(ids)
+        )
+
+        by_workflow: Dict[str, List[Dict[str, Any]]] = {workflow_id: [] for workflow_id in ids}
+        for row in rows:
+            by_workflow[row["workflow_id"]].append(_decode(row))
+
+        return [{**_decode(w), "tasks": by_workflow[w["workflow_id"]]} for w in workflows]
+
+    def get_workflow(self, workflow_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._execute("SELECT * FROM obsrv_workflows WHERE workflow_id = ?", (workflow_id,))
+        workflows = self._attach_tasks(rows)
+        return workflows[0] if workflows else None
+
+    def list_workflows(
+        self,
+        status: Optional[str] = None,
+        limit: Optional[int] = 50
+    ) -> List[Dict[str, Any]]:
+        sql = "SELECT * FROM obsrv_workflows"
+        params: tuple = ()
+        if status:
+            sql += " WHERE status = ?"
+            params = (status,)
+        sql += " ORDER BY created_at DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return self._attach_tasks(self._execute(sql, params))
+
+    def get_cached_result(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        rows = self._execute("SELECT * FROM obsrv_task_cache WHERE cache_key = ?", (cache_key,))
+        return _decode(rows[0]) if rows else None
+
+    def put_cached_result(self, cache_key: str, entry: Dict[str, Any]):
+        row = _encode({"cache_key": cache_key, **entry, "created_at": time.time()})
+        sql, params = self._insert("obsrv_task_cache", row)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in row if column != "cache_key")
+        self._execute(f"{sql} ON CONFLICT (cache_key) DO UPDATE SET {updates}", params)
+
+    def record_runtime(
+        self,
+        task_type: str,
+        size_bucket: int,
+        duration_seconds: float,
+        compute: Optional[str] = None
+    ):
+        self._execute(*self._insert("obsrv_task_runtimes", {
+            "task_type": task_type,
+            "size_bucket": size_bucket,
+            "compute": compute,
+            "duration_seconds": duration_seconds,
+            "recorded_at": time.time(),
+        }))
+
+    def runtime_samples(
+        self,
+        task_type: str,
+        limit: int = 50,
+        compute: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        sql = "SELECT size_bucket, compute, duration_seconds FROM obsrv_task_runtimes WHERE task_type = ?"
+        params: tuple = (task_type,)
+        if compute:
+            sql += " AND compute = ?"
+            params += (compute,)
+        return self._execute(f"{sql} ORDER BY recorded_at DESC LIMIT {int(limit)}", params)
+
+
+class SQLiteStateStore(SQLStateStore):
+    """Local SQLite backend"""
+
+    def __init__(self, path: str = "obsrv_state.db"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        super().__init__()
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._conn
+
+    def _existing_columns(self, table: str) -> Set[str]:
+        return {row["name"] for row in self._execute(f"PRAGMA table_info({table})")}
+
+
+class PostgresStateStore(SQLStateStore):
+    """
+    Postgres backend. When `instance_name` is set, connects to a Lakebase
+    database instance with OAuth credentials that are refreshed before expiry.
+    """
+
+    placeholder = "%s"
+    TOKEN_REFRESH_SECONDS = 50 * 60
+
+    def __init__(
+        self,
+        instance_name: Optional[str] = None,
+        database: Optional[str] = None,
+        host: Optional[str] = None,
+        port: int = 5432,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+    ):
+        self.instance_name = instance_name
+        self.database = database
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self._conn = None
+        self._connected_at = 0.0
+        super().__init__()
+
+    def _lakebase_credentials(self) -> Dict[str, Any]:
+        from databricks.sdk import WorkspaceClient
+
+        w = WorkspaceClient()
+        instance = w.database.get_database_instance(name=self.instance_name)
+        cred = w.database.generate_database_credential(
+            request_id=str(uuid.uuid4()), instance_names=[instance.name]
+        )
+        return {
+            "host": instance.read_write_dns,
+            "dbname": self.database or instance.name,
+            "user": self.user or os.getenv("DATABRICKS_CLIENT_ID") or w.current_user.me().user_name,
+            "password": cred.token,
+            "sslmode": "require",
+        }
+
+    def _connection(self) -> Any:
+        import psycopg
+
+        expired = self.instance_name and time.time() - self._connected_at > self.TOKEN_REFRESH_SECONDS
+        if self._conn is None or self._conn.closed or expired:
+            if self._conn is not None and not self._conn.closed:
+                self._conn.close()
+
+            if self.instance_name:
+                params = self._lakebase_credentials()
+            else:
+                params = {
+                    "host": self.host,
+                    "dbname": self.database,
+                    "user": self.user,
+                    "password": self.password,
+                }
+
+            self._conn = psycopg.connect(port=self.port, application_name="obsrv_orchestrator", **params)
+            self._connected_at = time.time()
+            logger.info(f"State store connected to Postgres at {params['host']}")
+
+        return self._conn
+
+    def _existing_columns(self, table: str) -> Set[str]:
+        rows = self._execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = ?",
+            (table,)
+        )
+        return {row["column_name"] for row in rows}
+
+
+def create_state_store() -> StateStore:
+    """
+    Build the state store selected by environment variables:
+
+    - OBSRV_STATE_BACKEND: sqlite (default) or postgres
+    - OBSRV_STATE_DB_PATH: SQLite file path
+    - LAKEBASE_INSTANCE_NAME / LAKEBASE_DATABASE_NAME: Lakebase instance
+    - PGHOST / PGPORT / PGDATABASE / PGUSER / PGPASSWORD: plain Postgres
+    """
+    backend = os.getenv("OBSRV_STATE_BACKEND", "sqlite").lower()
+
+    if backend == "sqlite":
+        return SQLiteStateStore(os.getenv("OBSRV_STATE_DB_PATH", "obsrv_state.db"))
+
+    if backend in ["postgres", "lakebase"]:
+        return PostgresStateStore(
+            instance_name=os.getenv("LAKEBASE_INSTANCE_NAME"),
+            database=os.getenv("LAKEBASE_DATABASE_NAME") or os.getenv("PGDATABASE"),
+            host=os.getenv("PGHOST"),
+            port=int(os.getenv("PGPORT", "5432")),
+            user=os.getenv("PGUSER"),
+            password=os.getenv("PGPASSWORD"),
+        )
+
+    raise ValueError(f"Unknown state backend: {backend}")
@@ -1,31 +1,41 @@
 """
 Streamlit Orchestrator for Databricks AutoML Ensemble
-Runs orchestrator in Streamlit app memory, spawns tasks on Databricks Serverless
+Runs orchestrator in the Streamlit app process, spawns tasks through a pluggable
+executor (Databricks Serverless by default) and keeps workflow state in a durable
+state store
 """
 
 import streamlit as st
+import altair as alt
 import yaml
 import json
-import asyncio
+import hashlib
+import heapq
+import logging
+import math
+import os
+import random
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional, Tuple
 import pandas as pd
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field, replace
 from enum import Enum
 
-# Databricks SDK imports
-from databricks.sdk import WorkspaceClient
-from databricks.sdk.service.jobs import Task, TaskDependency, NotebookTask, Source
-from databricks.sdk.service.compute import ServerlessComputeType
+from executors import Executor, TERMINAL_LIFE_CYCLE_STATES, create_executor
+from state_store import StateStore, create_state_store
+from timeline import PHASES, chrome_trace, critical_path, gantt_rows
+from transforms import parse_transforms
 
-# In-memory state management
-if 'workflow_state' not in st.session_state:
-    st.session_state.workflow_state = {}
-if 'active_jobs' not in st.session_state:
-    st.session_state.active_jobs = {}
+logger = logging.getLogger(__name__)
 
 
 class TaskType(Enum):
+    SAMPLE = "sample"
     ROUTE_CLUSTER = "route_cluster"
     ROUTE_FEATURE = "route_feature"
     ROUTE_EXTERNAL = "route_external"
@@ -40,6 +50,15 @@ class TaskType(Enum):
     VOTE_WEIGHT = "vote_weight"
 
 
+# Task types served by another type's notebook; others run `{task_type}_service`
+SERVICE_NOTEBOOKS = {
+    TaskType.STACK_TOP_N_ALG: "stack_top_alg",
+}
+
+# Models per family of stack_top_n_alg tasks without `stack.top_n_alg`
+DEFAULT_TOP_N_ALG = 2
+
+
 @dataclass
 class WorkflowContext:
     name: str
@@ -58,20 +77,736 @@ class JobTask:
     config: Dict[str, Any]
     depends_on: List[str]
     status: str = "pending"
+    job_id: Optional[int] = None
     job_run_id: Optional[int] = None
+    speculative_run_id: Optional[int] = None
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    estimated_seconds: Optional[float] = None
+    compute: Optional[str] = None
+    placement_reason: Optional[str] = None
+    # Timeline (epoch seconds)
+    submitted_at: Optional[float] = None
+    started_at: Optional[float] = None
+    ended_at: Optional[float] = None
+    fetched_at: Optional[float] = None
+    fetch_seconds: Optional[float] = None
 
 
-class StreamlitOrchestrator:
+# Runtime assumed for a task type until it has history (seconds)
+DEFAULT_RUNTIMES = {
+    TaskType.SAMPLE: 120,
+    TaskType.ROUTE_CLUSTER: 300,
+    TaskType.ROUTE_FEATURE: 180,
+    TaskType.ROUTE_EXTERNAL: 180,
+    TaskType.STACK_TOP_ANY: 1200,
+    TaskType.STACK_TOP_ALG: 1200,
+    TaskType.STACK_TOP_N_ALG: 1200,
+    TaskType.STACK_BLEND: 900,
+    TaskType.STACK_CLASSWISE: 1200,
+    TaskType.BOOST: 900,
+    TaskType.VOTE_TOP_ALG: 120,
+    TaskType.VOTE_MIX: 120,
+    TaskType.VOTE_WEIGHT: 120,
+}
+
+
+class RuntimeModel:
+    """
+    Historical runtime of every task type per compute and dataset size bucket.
+    Estimates are the median of recent runs in the nearest recorded bucket.
+    """
+    
+    HISTORY = 50
+    
+    def __init__(self, state: StateStore):
+        self.state = state
+    
+    @staticmethod
+    def size_bucket(dataset_size: Optional[int]) -> int:
+        """Half-decade bucket of a row count (-1 when unknown)"""
+        if not dataset_size:
+            return -1
+        return int(math.log10(max(dataset_size, 1)) * 2)
+    
+    def record(
+        self,
+        task_type: TaskType,
+        dataset_size: Optional[int],
+        duration_seconds: float,
+        compute: Optional[str] = None
+    ):
+        self.state.record_runtime(
+            task_type.value, self.size_bucket(dataset_size), duration_seconds, compute=compute
+        )
+    
+    def measured(
+        self,
+        task_type: TaskType,
+        dataset_size: Optional[int],
+        compute: Optional[str] = None
+    ) -> Optional[float]:
+        """Median recent runtime (on one compute, if given), or None without history"""
+        samples = self.state.runtime_samples(task_type.value, limit=self.HISTORY, compute=compute)
+        if not samples:
+            return None
+        
+        bucket = self.size_bucket(dataset_size)
+        nearest = min(abs(sample['size_bucket'] - bucket) for sample in samples)
+        return statistics.median(
+            sample['duration_seconds'] for sample in samples
+            if abs(sample['size_bucket'] - bucket) == nearest
+        )
+    
+    def estimate(self, task_type: TaskType, dataset_size: Optional[int]) -> float:
+        measured = self.measured(task_type, dataset_size)
+        return DEFAULT_RUNTIMES[task_type] if measured is None else measured
+
+
+# Compute a task can be placed on; CLUSTER is `context.compute.existing_cluster_id`
+COMPUTE_OPTIONS = ["GPU", "NO_GPU", "CLUSTER"]
+
+# Expected speedup of GPU over CPU compute per task type, until both have history.
+# Default runtimes are CPU runtimes.
+DEFAULT_GPU_SPEEDUP = {
+    TaskType.SAMPLE: 1.0,
+    TaskType.ROUTE_CLUSTER: 1.5,
+    TaskType.ROUTE_FEATURE: 1.0,
+    TaskType.ROUTE_EXTERNAL: 1.0,
+    TaskType.STACK_TOP_ANY: 2.0,
+    TaskType.STACK_TOP_ALG: 2.0,
+    TaskType.STACK_TOP_N_ALG: 2.0,
+    TaskType.STACK_BLEND: 2.0,
+    TaskType.STACK_CLASSWISE: 2.0,
+    TaskType.BOOST: 1.0,  # histogram boosting trains on CPU cores
+    TaskType.VOTE_TOP_ALG: 1.0,
+    TaskType.VOTE_MIX: 1.0,
+    TaskType.VOTE_WEIGHT: 1.0,
+}
+
+# Compute startup latency (seconds); override with `context.compute.startup_seconds`
+DEFAULT_STARTUP_SECONDS = {"GPU": 240, "NO_GPU": 60, "CLUSTER": 0}
+
+# Relative cost per hour; override with `context.compute.cost_per_hour`
+DEFAULT_COST_PER_HOUR = {"GPU": 4.0, "NO_GPU": 1.0, "CLUSTER": 1.5}
+
+
+@dataclass
+class Placement:
+    compute: str
+    estimated_seconds: float
+    cost: float
+    reason: str
+
+
+class PlacementPolicy:
+    """
+    Chooses GPU, NO_GPU or an existing cluster for every task of a workflow.
+    
+    Runtimes per compute come from the runtime model; a compute without
+    history is estimated from the other one with the task type's GPU speedup.
+    Objectives (`context.compute.objective`):
+    - makespan (default): fastest placement for every task, then cheaper
+      compute for tasks whose slack absorbs the slowdown
+    - cost: cheapest placement for every task
+    - fixed: `context.compute.serverless == ['GPU']` places every task on GPU,
+      anything else on NO_GPU
+    A task can pin its compute with a `compute` key in its YAML config.
+    """
+    
+    def __init__(self, runtime_model: RuntimeModel):
+        self.runtime_model = runtime_model
+    
+    @staticmethod
+    def options(task: JobTask, context: WorkflowContext) -> List[str]:
+        compute = context.compute
+        if task.config.get('compute'):
+            return [task.config['compute']]
+        if compute.get('objective') == "fixed":
+            return ["GPU" if compute.get('serverless') == ['GPU'] else "NO_GPU"]
+        
+        allowed = compute.get('allowed') or COMPUTE_OPTIONS
+        return [
+            option for option in allowed
+            if option != "CLUSTER" or compute.get('existing_cluster_id')
+        ]
+    
+    def runtime(self, task_type: TaskType, dataset_size: Optional[int], compute: str) -> float:
+        """Estimated runtime of a task type on one compute"""
+        measured = self.runtime_model.measured(task_type, dataset_size, compute)
+        if measured is not None:
+            return measured
+        
+        speedup = DEFAULT_GPU_SPEEDUP[task_type]
+        if compute == "GPU":
+            cpu = self.runtime_model.measured(task_type, dataset_size, "NO_GPU")
+            return (cpu if cpu is not None else DEFAULT_RUNTIMES[task_type]) / speedup
+        
+        gpu = self.runtime_model.measured(task_type, dataset_size, "GPU")
+        return gpu * speedup if gpu is not None else DEFAULT_RUNTIMES[task_type]
+    
+    def place(
+        self,
+        tasks: List[JobTask],
+        context: WorkflowContext,
+        dataset_size: Optional[int]
+    ) -> Dict[str, Placement]:
+        """Place tasks given in topological order"""
+        objective = context.compute.get('objective', "makespan")
+        startup = {**DEFAULT_STARTUP_SECONDS, **context.compute.get('startup_seconds', {})}
+        rates = {**DEFAULT_COST_PER_HOUR, **context.compute.get('cost_per_hour', {})}
+        
+        candidates: Dict[str, List[Placement]] = {}
+        for task in tasks:
+            candidates[task.task_id] = []
+            for compute in self.options(task, context):
+                runtime = self.runtime(task.task_type, dataset_size, compute)
+                candidates[task.task_id].append(
+                    Placement(compute, runtime, rates[compute] * runtime / 3600, reason="")
+                )
+        
+        def latency(placement: Placement) -> float:
+            return startup[placement.compute] + placement.estimated_seconds
+        
+        def makespan(chosen: Dict[str, Placement]) -> float:
+            finish: Dict[str, float] = {}
+            for task in tasks:
+                finish[task.task_id] = latency(chosen[task.task_id]) + max(
+                    (finish[dep] for dep in task.depends_on), default=0
+                )
+            return max(finish.values(), default=0)
+        
+        def summary(options: List[Placement]) -> str:
+            return ", ".join(
+                f"{p.compute} {latency(p) / 60:.1f} min / {p.cost:.2f}" for p in options
+            )
+        
+        if objective == "cost":
+            chosen = {tid: min(options, key=lambda p: p.cost) for tid, options in candidates.items()}
+            reasons = {tid: f"cheapest ({summary(candidates[tid])})" for tid in chosen}
+        else:
+            chosen = {tid: min(options, key=latency) for tid, options in candidates.items()}
+            reasons = {tid: f"fastest ({summary(candidates[tid])})" for tid in chosen}
+            
+            # Move tasks with slack to cheaper compute, biggest saving first
+            target = makespan(chosen)
+            for tid in sorted(
+                chosen,
+                key=lambda tid: chosen[tid].cost - min(p.cost for p in candidates[tid]),
+                reverse=True
+            ):
+                for cheaper in sorted(candidates[tid], key=lambda p: p.cost):
+                    if cheaper.cost >= chosen[tid].cost:
+                        break
+                    if makespan({**chosen, tid: cheaper}) <= target:
+                        chosen[tid] = cheaper
+                        reasons[tid] = f"cheaper, off the critical path ({summary(candidates[tid])})"
+                        break
+        
+        for task in tasks:
+            if task.config.get('compute'):
+                reasons[task.task_id] = "pinned by task config"
+            elif objective == "fixed":
+                reasons[task.task_id] = "fixed by context.compute.serverless"
+            elif len(candidates[task.task_id]) == 1:
+                reasons[task.task_id] = "only allowed compute"
+        
+        return {tid: replace(placement, reason=reasons[tid]) for tid, placement in chosen.items()}
+
+
+# Task statuses that satisfy a dependency
+DONE_STATUSES = ["completed", "cached"]
+
+
+class RunStatusStore:
     """
-    In-process orchestrator running in Streamlit app memory.
-    Spawns each microservice task on Databricks Serverless compute.
+    Latest known status of every tracked run, shared between the poller
+    thread and Streamlit sessions. Reads never call the Jobs API.
     """
     
     def __init__(self):
-        self.w = WorkspaceClient()
+        self._statuses: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def publish(self, run_id: int, status: Dict[str, Any]) -> bool:
+        """Store a run status, returning True if it changed"""
+        with self._lock:
+            changed = self._statuses.get(run_id) != status
+            self._statuses[run_id] = status
+            return changed
+    
+    def get(self, run_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._statuses.get(run_id)
+
+
+class RunStatusPoller(threading.Thread):
+    """
+    One background poller per app process.
+    
+    Tracked runs are grouped by job id and each due group is refreshed with a
+    single executor call (one `list_runs` on Databricks), so API calls stay
+    flat as active runs grow. Each run backs off exponentially (with jitter)
+    from a base interval derived from its expected duration, resetting
+    whenever its state changes. Changes found in one pass are handed to
+    `on_change` as a single batch of (run_id, status) pairs.
+    """
+    
+    MIN_INTERVAL = 5
+    MAX_INTERVAL = 120
+    TICK = 1
+    
+    def __init__(
+        self,
+        executor: Executor,
+        store: RunStatusStore,
+        on_change: Optional[Callable[[List[Tuple[int, Dict[str, Any]]]], None]] = None,
+        on_tick: Optional[Callable[[], None]] = None
+    ):
+        super().__init__(name="obsrv-run-status-poller", daemon=True)
+        self.executor = executor
+        self.store = store
+        self.on_change = on_change
+        self.on_tick = on_tick
+        self._runs: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+    
+    def track(
+        self,
+        run_id: int,
+        job_id: int,
+        expected_duration: float,
+        submitted_at: Optional[float] = None
+    ):
+        """Start polling a run (submitted now unless `submitted_at` is given)"""
+        base = min(max(expected_duration / 20, self.MIN_INTERVAL), self.MAX_INTERVAL)
+        now = time.time()
+        
+        with self._lock:
+            self._runs[run_id] = {
+                "job_id": job_id,
+                "submitted_at": submitted_at or now,
+                "base_interval": base,
+                "attempt": 0,
+                "next_poll_at": now + self.MIN_INTERVAL,
+            }
+    
+    def active_run_ids(self) -> List[int]:
+        with self._lock:
+            return list(self._runs)
+    
+    def stop(self):
+        self._stop_event.set()
+    
+    def run(self):
+        while not self._stop_event.wait(self.TICK):
+            self.poll_due_runs()
+            if self.on_tick:
+                try:
+                    self.on_tick()
+                except Exception:
+                    logger.exception("Poller tick callback failed")
+    
+    def poll_due_runs(self):
+        """Refresh every job that has at least one run due for polling"""
+        now = time.time()
+        
+        with self._lock:
+            due_jobs: Dict[int, Dict[int, Dict[str, Any]]] = {}
+            for run_id, run in self._runs.items():
+                if run["next_poll_at"] <= now:
+                    due_jobs.setdefault(run["job_id"], {})
+            for run_id, run in self._runs.items():
+                if run["job_id"] in due_jobs:
+                    due_jobs[run["job_id"]][run_id] = run
+        
+        changes: List[Tuple[int, Dict[str, Any]]] = []
+        for job_id, runs in due_jobs.items():
+            try:
+                changes.extend(self._poll_job(job_id, runs))
+            except Exception:
+                logger.exception(f"Failed to list runs for job {job_id}")
+                for run_id, run in runs.items():
+                    self._schedule(run_id, run, False, None)
+        
+        if changes and self.on_change:
+            try:
+                self.on_change(changes)
+            except Exception:
+                logger.exception(f"Failed to apply status of runs {[run_id for run_id, _ in changes]}")
+    
+    def _poll_job(
+        self,
+        job_id: int,
+        runs: Dict[int, Dict[str, Any]]
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """Fetch status for all tracked runs of one job with a single list call, returning the changes"""
+        start_time_from = int(min(run["submitted_at"] for run in runs.values()) * 1000) - 60_000
+        pending = set(runs)
+        changes = []
+        
+        for run_id, status in self.executor.poll_runs(job_id, set(pending), start_time_from):
+            pending.discard(run_id)
+            
+            changed = self.store.publish(run_id, status)
+            self._schedule(run_id, runs[run_id], changed, status)
+            
+            if changed:
+                changes.append((run_id, status))
+        
+        # Runs not listed yet (e.g. still being created) are retried later
+        for run_id in pending:
+            self._schedule(run_id, runs[run_id], False, None)
+        
+        return changes
+    
+    def _schedule(
+        self,
+        run_id: int,
+        run: Dict[str, Any],
+        changed: bool,
+        status: Optional[Dict[str, Any]]
+    ):
+        with self._lock:
+            if status and status['state'] in TERMINAL_LIFE_CYCLE_STATES:
+                self._runs.pop(run_id, None)
+                return
+            
+            run["attempt"] = 0 if changed else run["attempt"] + 1
+            delay = min(run["base_interval"] * 2 ** run["attempt"], self.MAX_INTERVAL)
+            run["next_poll_at"] = time.time() + delay * random.uniform(0.8, 1.2)
+
+
+# Priority classes of submitted workflows, highest first
+PRIORITY_CLASSES = ["high", "normal", "low"]
+
+# Admission key suffix of the speculative duplicate of a task run
+SPECULATIVE_SUFFIX = "#speculative"
+
+
+@dataclass
+class AdmissionRequest:
+    workflow_id: str
+    task_id: Optional[str]  # None for the run of a compiled workflow
+    owner: str
+    priority: str
+    slots: int
+    estimated_seconds: float
+    workflow_limit: int
+    rank: float = 0  # critical-path rank within the workflow
+    enqueued_at: float = field(default_factory=time.time)
+    
+    @property
+    def key(self) -> Tuple[str, Optional[str]]:
+        return (self.workflow_id, self.task_id)
+
+
+class AdmissionController:
+    """
+    Process-wide admission of runs to the workspace.
+    
+    Every run (a per-task run, or a compiled workflow run holding one slot per
+    task) waits in a queue until a slot under the global limit is free. The
+    next request is the one with the highest priority class, then the owner
+    with the fewest running slots, then the workflow with the fewest running
+    slots (fair share), then the oldest, then the longest critical path.
+    Requests over their owner's or workflow's quota are passed over; a request
+    that does not fit the global limit blocks the queue, so large compiled
+    workflows are not starved by smaller requests. A request never holds more
+    slots than the global or per-user limit, so every request can be admitted.
+    """
+    
+    def __init__(self, max_runs: int, max_runs_per_user: Optional[int] = None):
+        self.max_runs = max_runs
+        self.max_runs_per_user = max_runs_per_user
+        self._queue: Dict[Tuple[str, Optional[str]], AdmissionRequest] = {}
+        # key -> (request, admitted_at)
+        self._running: Dict[Tuple[str, Optional[str]], Tuple[AdmissionRequest, float]] = {}
+        self._lock = threading.Lock()
+    
+    def _cap(self, slots: int) -> int:
+        return min(slots, self.max_runs, self.max_runs_per_user or self.max_runs)
+    
+    def enqueue(self, request: AdmissionRequest):
+        """Queue a request unless it is already queued or running"""
+        request.slots = self._cap(request.slots)
+        with self._lock:
+            if request.key not in self._queue and request.key not in self._running:
+                self._queue[request.key] = request
+    
+    def release(self, workflow_id: str, task_id: Optional[str] = None):
+        """Free the slots of a finished run"""
+        with self._lock:
+            self._running.pop((workflow_id, task_id), None)
+    
+    def mark_running(self, request: AdmissionRequest, admitted_at: Optional[float] = None):
+        """Account for a run admitted by a previous process"""
+        request.slots = self._cap(request.slots)
+        with self._lock:
+            self._queue.pop(request.key, None)
+            self._running[request.key] = (request, admitted_at or time.time())
+    
+    @staticmethod
+    def _usage(requests: List[AdmissionRequest]) -> Tuple[Dict[str, int], Dict[str, int]]:
+        by_owner: Dict[str, int] = {}
+        by_workflow: Dict[str, int] = {}
+        for request in requests:
+            by_owner[request.owner] = by_owner.get(request.owner, 0) + request.slots
+            by_workflow[request.workflow_id] = by_workflow.get(request.workflow_id, 0) + request.slots
+        return by_owner, by_workflow
+    
+    @staticmethod
+    def _sort_key(
+        request: AdmissionRequest,
+        by_owner: Dict[str, int],
+        by_workflow: Dict[str, int]
+    ) -> tuple:
+        return (
+            PRIORITY_CLASSES.index(request.priority),
+            by_owner.get(request.owner, 0),
+            by_workflow.get(request.workflow_id, 0),
+            request.enqueued_at,
+            -request.rank,
+        )
+    
+    def _within_quota(
+        self,
+        request: AdmissionRequest,
+        by_owner: Dict[str, int],
+        by_workflow: Dict[str, int]
+    ) -> bool:
+        if self.max_runs_per_user and by_owner.get(request.owner, 0) + request.slots > self.max_runs_per_user:
+            return False
+        return by_workflow.get(request.workflow_id, 0) + request.slots <= max(request.workflow_limit, request.slots)
+    
+    def try_admit(self, request: AdmissionRequest) -> bool:
+        """
+        Admit a request at once if nothing is queued and it fits the global
+        and per-user limits; False otherwise. For opportunistic runs (straggler
+        speculation) that must neither wait nor jump the queue.
+        """
+        request.slots = self._cap(request.slots)
+        with self._lock:
+            if self._queue or request.key in self._running:
+                return False
+            by_owner, _ = self._usage([r for r, _ in self._running.values()])
+            if sum(by_owner.values()) + request.slots > self.max_runs:
+                return False
+            if self.max_runs_per_user and by_owner.get(request.owner, 0) + request.slots > self.max_runs_per_user:
+                return False
+            self._running[request.key] = (request, time.time())
+            return True
+    
+    def admit(self) -> List[AdmissionRequest]:
+        """Move as many queued requests to running as the limits allow"""
+        admitted = []
+        with self._lock:
+            by_owner, by_workflow = self._usage([request for request, _ in self._running.values()])
+            used = sum(by_owner.values())
+            
+            while True:
+                candidates = [
+                    request for request in self._queue.values()
+                    if self._within_quota(request, by_owner, by_workflow)
+                ]
+                if not candidates:
+                    break
+                
+                request = min(candidates, key=lambda r: self._sort_key(r, by_owner, by_workflow))
+                if used + request.slots > self.max_runs:
+                    break
+                
+                del self._queue[request.key]
+                self._running[request.key] = (request, time.time())
+                by_owner[request.owner] = by_owner.get(request.owner, 0) + request.slots
+                by_workflow[request.workflow_id] = by_workflow.get(request.workflow_id, 0) + request.slots
+                used += request.slots
+                admitted.append(request)
+        
+        return admitted
+    
+    def queued_count(self) -> int:
+        with self._lock:
+            return len(self._queue)
+    
+    def queue_status(self) -> Dict[Tuple[str, Optional[str]], Tuple[int, datetime]]:
+        """
+        Queue position (1-based) and estimated start of every queued request,
+        simulating admission in fair-share order as running requests finish
+        at their estimated times. Quotas are ignored in the estimate.
+        """
+        now = time.time()
+        with self._lock:
+            running = list(self._running.values())
+            queued = list(self._queue.values())
+        
+        # End times of busy slots; free slots are available now
+        slot_free_at = [admitted_at + request.estimated_seconds
+                        for request, admitted_at in running for _ in range(request.slots)]
+        slot_free_at += [now] * max(self.max_runs - len(slot_free_at), 0)
+        heapq.heapify(slot_free_at)
+        
+        by_owner, by_workflow = self._usage([request for request, _ in running])
+        status = {}
+        position = 0
+        
+        while queued:
+            request = min(queued, key=lambda r: self._sort_key(r, by_owner, by_workflow))
+            queued.remove(request)
+            position += 1
+            
+            start = max([heapq.heappop(slot_free_at) for _ in range(request.slots)] + [now])
+            for _ in range(request.slots):
+                heapq.heappush(slot_free_at, start + request.estimated_seconds)
+            
+            by_owner[request.owner] = by_owner.get(request.owner, 0) + request.slots
+            by_workflow[request.workflow_id] = by_workflow.get(request.workflow_id, 0) + request.slots
+            status[request.key] = (position, datetime.fromtimestamp(start))
+        
+        return status
+
+
+class StreamlitOrchestrator:
+    """
+    In-process orchestrator shared by all sessions of the Streamlit app.
+    Spawns each microservice task through an executor (Databricks Serverless
+    by default) and writes every state transition to the state store.
+    """
+    
+    # Default cap on concurrently running tasks of a per-task workflow;
+    # override with `context.compute.max_concurrent_tasks`
+    MAX_CONCURRENT_TASKS = 4
+    
+    # Process-wide cap on concurrent runs; override with OBSRV_MAX_CONCURRENT_RUNS
+    # (and cap each user with OBSRV_MAX_RUNS_PER_USER)
+    MAX_CONCURRENT_RUNS = 20
+    
+    # Concurrent `get_run_output` calls when several task runs finish in one poll
+    OUTPUT_FETCH_WORKERS = 8
+    
+    # Straggler speculation (opt-in with `context.compute.speculation`)
+    SPECULATION_CHECK_INTERVAL = 30
+    DEFAULT_SPECULATION = {"multiple": 2.0, "max_wasted_minutes": 60}
+    
+    def __init__(
+        self,
+        state_store: Optional[StateStore] = None,
+        executor: Optional[Executor] = None
+    ):
+        self.executor = executor or create_executor()
         self.notebook_base_path = "/Workspace/ml_ensemble_microservices"
+        self.state = state_store or create_state_store()
+        self.runtime_model = RuntimeModel(self.state)
+        self.placement_policy = PlacementPolicy(self.runtime_model)
+        self.admission = AdmissionController(
+            int(os.getenv("OBSRV_MAX_CONCURRENT_RUNS", self.MAX_CONCURRENT_RUNS)),
+            int(os.getenv("OBSRV_MAX_RUNS_PER_USER", "0")) or None
+        )
+        self.poller = RunStatusPoller(
+            self.executor, RunStatusStore(),
+            on_change=self.handle_run_statuses, on_tick=self.check_stragglers
+        )
+        self._output_pool = ThreadPoolExecutor(
+            max_workers=self.OUTPUT_FETCH_WORKERS, thread_name_prefix="obsrv-output-fetch"
+        )
+        
+        # run_id -> (workflow_id, task_id); task_id is None for compiled workflow runs.
+        # A straggling task can have a second, speculative run.
+        self._runs: Dict[int, Tuple[str, Optional[str]]] = {}
+        self._speculative_runs: set = set()
+        self._last_speculation_check = 0.0
+        self._lock = threading.RLock()
+    
+    def start(self):
+        """Resume in-flight workflows and start the background poller"""
+        self.resume()
+        self.poller.start()
+    
+    def resume(self):
+        """
+        Resume polling the runs of workflows left running by a previous
+        process. Runs are never relaunched; their admission slots are taken
+        again, queued runs are queued again, and tasks that became ready while
+        the app was down are launched as usual.
+        """
+        for workflow in self.state.list_workflows(status="queued", limit=None):
+            self.admission.enqueue(self._compiled_request(self._from_row(workflow)))
+        
+        for workflow in self.state.list_workflows(status="running", limit=None):
+            workflow_id = workflow['workflow_id']
+            
+            if workflow['mode'] == "compiled":
+                if workflow['run_id']:
+                    self.admission.mark_running(self._compiled_request(self._from_row(workflow)))
+                    self._track(
+                        workflow['run_id'], workflow['job_id'], workflow_id, None,
+                        sum(task['estimated_seconds'] or 0 for task in workflow['tasks']),
+                        submitted_at=workflow['created_at']
+                    )
+                continue
+            
+            loaded = self._from_row(workflow)
+            for task in loaded['tasks']:
+                if task.status == "running" and task.job_run_id:
+                    self.admission.mark_running(self._task_request(loaded, task))
+                    submitted_at = task.submitted_at or workflow['created_at']
+                    self._track(
+                        task.job_run_id, task.job_id, workflow_id, task.task_id,
+                        task.estimated_seconds or 0, submitted_at=submitted_at
+                    )
+                    if task.speculative_run_id:
+                        self.admission.mark_running(self._speculative_request(loaded, task))
+                        self._speculative_runs.add(task.speculative_run_id)
+                        self._track(
+                            task.speculative_run_id, task.job_id, workflow_id, task.task_id,
+                            task.estimated_seconds or 0, submitted_at=submitted_at
+                        )
+            
+            self._launch_ready_tasks(workflow_id)
+            logger.info(f"Resumed workflow {workflow_id}")
+        
+        self._dispatch()
+    
+    def load_workflow(self, workflow_id: str) -> Optional[Dict[str, Any]]:
+        """Load a workflow from the state store as dataclasses"""
+        workflow = self.state.get_workflow(workflow_id)
+        return self._from_row(workflow) if workflow else None
+    
+    def list_workflows(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Load the most recent workflows of all users"""
+        return [self._from_row(workflow) for workflow in self.state.list_workflows(limit=limit)]
+    
+    @staticmethod
+    def _from_row(workflow: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            **workflow,
+            "context": WorkflowContext(**workflow['context']),
+            "created_at": datetime.fromtimestamp(workflow['created_at']),
+            "tasks": [
+                JobTask(
+                    task_id=task['task_id'],
+                    task_type=TaskType(task['task_type']),
+                    config=task['config'],
+                    depends_on=task['depends_on'],
+                    status=task['status'],
+                    job_id=task['job_id'],
+                    job_run_id=task['job_run_id'],
+                    speculative_run_id=task['speculative_run_id'],
+                    result=task['result'],
+                    error=task['error'],
+                    estimated_seconds=task['estimated_seconds'],
+                    compute=task['compute'],
+                    placement_reason=task['placement_reason'],
+                    submitted_at=task['submitted_at'],
+                    started_at=task['started_at'],
+                    ended_at=task['ended_at'],
+                    fetched_at=task['fetched_at'],
+                    fetch_seconds=task['fetch_seconds'],
+                )
+                for task in workflow['tasks']
+            ],
+        }
         
     def parse_yaml_config(self, yaml_content: str) -> Dict[str, Any]:
         """Parse YAML workflow configuration"""
@@ -88,6 +823,9 @@ class StreamlitOrchestrator:
             
             # Extract task-specific config
             task_config = {k: v for k, v in task_def.items() if k not in ['task', 'depends_on']}
+            if task_type == TaskType.STACK_TOP_N_ALG:
+                stack_config = task_config.get('stack') or {}
+                task_config['stack'] = {**stack_config, 'top_n_alg': stack_config.get('top_n_alg') or DEFAULT_TOP_N_ALG}
             
             # Get dependencies
             depends_on = []
@@ -103,58 +841,136 @@ class StreamlitOrchestrator:
             )
             tasks.append(job_task)
         
-        return tasks
+        return self._add_sample_task(tasks, workflow_config['context'])
+    
+    @staticmethod
+    def _add_sample_task(tasks: List[JobTask], context: Dict[str, Any]) -> List[JobTask]:
+        """
+        Prepend a `sample` task that every other task depends on. It pins the
+        source version, draws the sample (`context.sample.size`), fits the
+        feature pipeline and snapshots the training data once per workflow;
+        the tasks read them from their upstream results (`sample_table`,
+        `feature_pipeline`, `snapshot`). Without any of the three
+        (`context.sample.snapshot: false`) there is nothing to prepend.
+        """
+        sample = context.get('sample') or {}
+        snapshot = sample.get('snapshot', True) not in (False, "false")
+        if not sample.get('size') and not snapshot and not parse_transforms((context.get('source') or {}).get('features')):
+            return tasks
+        if any(task.task_type == TaskType.SAMPLE for task in tasks):
+            return tasks
+        
+        for task in tasks:
+            task.depends_on = ["sample"] + task.depends_on
+        return [JobTask(task_id="sample", task_type=TaskType.SAMPLE, config={}, depends_on=[])] + tasks
+    
+    def _job_parameters(
+        self,
+        context: WorkflowContext,
+        workflow_id: str
+    ) -> Dict[str, str]:
+        """Build the per-run values shared by every microservice of a workflow"""
+        return {
+            "workflow_id": workflow_id,
+            "context": json.dumps(asdict(context)),
+            "catalog": context.source.get('catalog') or "",
+            "schema": context.source.get('schema') or "",
+            "table": context.source.get('table') or "",
+            "target": context.source.get('target') or "",
+        }
+    
+    def _task_spec(
+        self,
+        task: JobTask,
+        context: WorkflowContext,
+        depends_on: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Describe the parts of a job task that are fixed for a job definition"""
+        notebook = SERVICE_NOTEBOOKS.get(task.task_type, task.task_type.value)
+        spec = {
+            "notebook_path": f"{self.notebook_base_path}/{notebook}_service",
+            # Tasks persisted before placement existed use the workflow-wide rule
+            "compute": task.compute or ("GPU" if context.compute.get('serverless') == ['GPU'] else "NO_GPU"),
+            "timeout_seconds": self._parse_timeout(context.timeout),
+            "depends_on": sorted(depends_on or []),
+        }
+        if spec['compute'] == "CLUSTER":
+            spec['existing_cluster_id'] = context.compute['existing_cluster_id']
+        return spec
     
     def create_serverless_job(
         self, 
         task: JobTask, 
         context: WorkflowContext,
-        workflow_id: str
-    ) -> int:
+        workflow_id: str,
+        upstream: Optional[Dict[str, Any]] = None
+    ) -> Tuple[int, int]:
         """
-        Create and run a Databricks job on Serverless compute.
-        Each microservice runs as a separate serverless job.
+        Run a microservice through the executor.
+        On Databricks each microservice runs as a separate serverless job run.
+        The job definition is reused across workflows with the same notebook,
+        compute and timeout; per-run values are passed as job parameters.
         """
-        
-        # Determine which microservice notebook to use
-        notebook_path = f"{self.notebook_base_path}/{task.task_type.value}_service"
-        
-        # Prepare task parameters (passed to notebook)
-        task_params = {
-            "workflow_id": workflow_id,
+        spec = self._task_spec(task, context)
+        params = {
+            **self._job_parameters(context, workflow_id),
             "task_id": task.task_id,
             "config": json.dumps(task.config),
-            "context": json.dumps(asdict(context)),
-            "catalog": context.source.get('catalog'),
-            "schema": context.source.get('schema'),
-            "table": context.source.get('table'),
-            "target": context.source.get('target'),
+            "upstream": json.dumps(upstream or {}),
         }
         
-        # Create job with Databricks Serverless compute
-        job = self.w.jobs.create(
-            name=f"ensemble_{workflow_id}_{task.task_id}",
-            tasks=[
-                Task(
-                    task_key=task.task_id,
-                    notebook_task=NotebookTask(
-                        notebook_path=notebook_path,
-                        source=Source.WORKSPACE,
-                        base_parameters=task_params
-                    ),
-                    compute={"serverless_compute": ServerlessComputeType.GPU}
-                    if context.compute.get('serverless') == ['GPU']
-                    else {"serverless_compute": ServerlessComputeType.NO_GPU},
-                    timeout_seconds=self._parse_timeout(context.timeout),
+        return self.executor.run_task(task.task_type.value, spec, params)
+    
+    def create_workflow_job(
+        self,
+        tasks: List[JobTask],
+        context: WorkflowContext,
+        workflow_id: str,
+        upstream: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> Tuple[int, int]:
+        """
+        Compile the whole DAG into one multi-task Databricks job and run it.
+        Dependencies become `depends_on` edges, so Databricks schedules them
+        server-side and the app only tracks a single run id.
+        
+        `upstream` maps a task id to the known results of its upstream tasks
+        that are not part of this job (e.g. cached results). Results of
+        upstream tasks inside the job reach a task as `upstream_runs`, built
+        from the `result` task value each service sets.
+        """
+        upstream = upstream or {}
+        ordered = self._topological_sort(tasks, priorities=self._critical_path_ranks(tasks))
+        specs = {task.task_id: self._task_spec(task, context, task.depends_on) for task in ordered}
+        
+        # Job parameters are pushed down to every task, so per-task values get
+        # their own parameters and are mapped onto the task widgets by reference
+        params = self._job_parameters(context, workflow_id)
+        for task in ordered:
+            params[f"config__{task.task_id}"] = json.dumps(task.config)
+            params[f"upstream__{task.task_id}"] = json.dumps(upstream.get(task.task_id, {}))
+        
+        timeout_seconds = max(spec['timeout_seconds'] for spec in specs.values()) * len(tasks)
+        
+        # Tasks on the longest chain run back to back
+        return self.executor.run_workflow(
+            [
+                (
+                    task.task_id,
+                    specs[task.task_id],
+                    {
+                        "task_id": task.task_id,
+                        "config": f"{{{{job.parameters.config__{task.task_id}}}}}",
+                        "upstream": f"{{{{job.parameters.upstream__{task.task_id}}}}}",
+                        "upstream_runs": "{" + ", ".join(
+                            f'"{dep}": {{{{tasks.{dep}.values.result}}}}' for dep in sorted(task.depends_on)
+                        ) + "}",
+                    }
                 )
+                for task in ordered
             ],
-            timeout_seconds=self._parse_timeout(context.timeout) + 300,  # Add buffer
+            params,
+            timeout_seconds
         )
-        
-        # Run the job immediately
-        run = self.w.jobs.run_now(job_id=job.job_id)
-        
-        return run.run_id
     
     def _parse_timeout(self, timeout_str: str) -> int:
         """Convert timeout string to seconds"""
@@ -165,25 +981,163 @@ class StreamlitOrchestrator:
         return 600  # Default 10 minutes
     
     def get_job_status(self, run_id: int) -> Dict[str, Any]:
-        """Check status of a Databricks job run"""
-        run = self.w.jobs.get_run(run_id=run_id)
+        """Check status of a job run"""
+        return self.executor.get_run_status(run_id)
+    
+    def _source_version(self, context: WorkflowContext) -> Optional[int]:
+        """
+        Latest Delta version of the source table from `DESCRIBE HISTORY`.
+        Returns None (disabling memoization) if it cannot be determined.
+        """
+        table_path = self._source_table(context)
+        row = self._query_one(f"DESCRIBE HISTORY {table_path} LIMIT 1") if table_path else None
+        return int(row['version']) if row else None
+    
+    def _dataset_size(self, context: WorkflowContext) -> Optional[int]:
+        """Number of rows the tasks train on: the sample size, else the source row count"""
+        if context.sample.get('size'):
+            return int(context.sample['size'])
         
-        return {
-            "state": run.state.life_cycle_state.value,
-            "result_state": run.state.result_state.value if run.state.result_state else None,
-            "start_time": run.start_time,
-            "end_time": run.end_time,
-        }
+        table_path = self._source_table(context)
+        row = self._query_one(f"SELECT COUNT(*) AS n FROM {table_path}") if table_path else None
+        return int(row['n']) if row else None
+    
+    @staticmethod
+    def _source_table(context: WorkflowContext) -> Optional[str]:
+        source = context.source
+        if not all(source.get(k) for k in ['catalog', 'schema', 'table']):
+            return None
+        return f"{source['catalog']}.{source['schema']}.{source['table']}"
+    
+    def _query_one(self, statement: str) -> Optional[Dict[str, Any]]:
+        """Run a statement through the executor and return its first row"""
+        try:
+            return self.executor.query_one(statement)
+        except Exception as e:
+            logger.warning(f"Statement failed ({statement}): {e}")
+            return None
+    
+    def _cache_keys(
+        self,
+        tasks: List[JobTask],
+        context: WorkflowContext,
+        source_version: int
+    ) -> Dict[str, str]:
+        """
+        Content-address every task from its type, config, upstream keys, the
+        workflow context and the source table version.
+        """
+        shared_context = {k: v for k, v in asdict(context).items() if k != 'name'}
+        keys: Dict[str, str] = {}
+        
+        for task in self._topological_sort(tasks):
+            payload = {
+                "task_type": task.task_type.value,
+                "config": task.config,
+                "upstream": {dep: keys[dep] for dep in sorted(task.depends_on)},
+                "context": shared_context,
+                "source_version": source_version,
+            }
+            keys[task.task_id] = hashlib.sha256(
+                json.dumps(payload, sort_keys=True, default=str).encode()
+            ).hexdigest()
+        
+        return keys
+    
+    def _fetch_result(self, task_run_id: int) -> Optional[Dict[str, Any]]:
+        """Read the `dbutils.notebook.exit` payload of a task run"""
+        try:
+            output = self.executor.run_output(task_run_id)
+            if output:
+                return json.loads(output)
+        except Exception as e:
+            logger.warning(f"Could not fetch output of run {task_run_id}: {e}")
+        return None
+    
+    def _fetch_output(self, task_run_id: int) -> Dict[str, Any]:
+        """Fetch the result of a task run, timing the call for the task timeline"""
+        fetch_started = time.time()
+        result = self._fetch_result(task_run_id)
+        fetched_at = time.time()
+        return {"result": result, "fetched_at": fetched_at, "fetch_seconds": fetched_at - fetch_started}
+    
+    def _fetch_outputs(self, task_run_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Fetch the results of several task runs concurrently"""
+        if len(task_run_ids) <= 1:
+            return {task_run_id: self._fetch_output(task_run_id) for task_run_id in task_run_ids}
+        return dict(zip(task_run_ids, self._output_pool.map(self._fetch_output, task_run_ids)))
+    
+    def _fetch_error(self, task_run_id: int) -> Optional[str]:
+        """Read the error message of a failed task run"""
+        try:
+            return self.executor.run_error(task_run_id)
+        except Exception as e:
+            logger.warning(f"Could not fetch error of run {task_run_id}: {e}")
+            return None
+    
+    def _complete_task(
+        self,
+        workflow_id: str,
+        task_id: str,
+        task_run_id: int,
+        duration_seconds: Optional[float] = None,
+        output: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Record a successful task with its result and runtime, and memoize it.
+        `output` is the prefetched result (see `_fetch_outputs`).
+        """
+        output = output or self._fetch_output(task_run_id)
+        result = output['result']
+        self.state.update_task(
+            workflow_id, task_id, status="completed", result=result,
+            fetched_at=output['fetched_at'], fetch_seconds=output['fetch_seconds']
+        )
+        
+        workflow = self.state.get_workflow(workflow_id)
+        task = next(t for t in workflow['tasks'] if t['task_id'] == task_id)
+        
+        if duration_seconds:
+            self.runtime_model.record(
+                TaskType(task['task_type']), workflow['dataset_size'], duration_seconds,
+                compute=task['compute']
+            )
+        
+        if task['cache_key'] and result is not None:
+            self.state.put_cached_result(task['cache_key'], {
+                "task_type": task['task_type'],
+                "workflow_id": workflow_id,
+                "task_id": task_id,
+                "result": result,
+                "output_table": result.get('output_table') or result.get('oof_table') or result.get('sample_table'),
+                "mlflow_run_id": result.get('mlflow_run_id'),
+            })
     
     def execute_workflow(
         self, 
         workflow_config: Dict[str, Any],
-        workflow_id: str
+        workflow_id: str,
+        mode: str = "compiled",
+        owner: Optional[str] = None,
+        use_cache: bool = True,
+        priority: str = "normal"
     ):
         """
-        Execute workflow by spawning serverless jobs for each task.
-        Runs in Streamlit app memory, orchestrates remote execution.
+        Execute workflow through the executor.
+        
+        In "compiled" mode the DAG is submitted as one multi-task job
+        (per_task is used instead if the executor cannot run whole DAGs).
+        In "per_task" mode a serverless job is spawned for each task once its
+        dependencies have completed, as reported by the background poller.
+        
+        With `use_cache`, tasks whose cache key already has a successful result
+        are not run; they are marked `cached` and reuse that result.
+        
+        Runs wait in the process-wide admission queue (see
+        `AdmissionController`) under the workflow's `priority` class.
         """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class: {priority}")
         
         # Parse context
         context = WorkflowContext(**workflow_config['context'])
@@ -191,97 +1145,604 @@ class StreamlitOrchestrator:
         # Build DAG
         tasks = self.create_dag(workflow_config)
         
-        # Store in session state
-        st.session_state.workflow_state[workflow_id] = {
-            "context": context,
-            "tasks": tasks,
-            "status": "running",
-            "created_at": datetime.now()
-        }
+        # Reject cycles before anything is launched
+        self._topological_sort(tasks)
+        
+        self.executor.collect_garbage()
+        
+        # Executors that cannot run a whole DAG fall back to one run per task
+        if mode == "compiled" and not self.executor.supports_compiled:
+            mode = "per_task"
+        
+        # Place every task and estimate it from the runtime history of its type on that compute
+        dataset_size = self._dataset_size(context)
+        placements = self.placement_policy.place(self._topological_sort(tasks), context, dataset_size)
+        for task in tasks:
+            placement = placements[task.task_id]
+            task.compute = placement.compute
+            task.placement_reason = placement.reason
+            task.estimated_seconds = placement.estimated_seconds
+        
+        # Every task reads the source at the version seen now: the sample task
+        # pins it and snapshots the data at that version
+        source_version = self._source_version(context)
+        for task in tasks:
+            if task.task_type == TaskType.SAMPLE and source_version is not None:
+                task.config = {**task.config, "source_version": source_version}
         
-        # Topological sort for execution order
-        execution_order = self._topological_sort(tasks)
+        # Memoization: reuse results of identical tasks on the same source version
+        cache_keys = self._cache_keys(tasks, context, source_version) if use_cache and source_version is not None else {}
+        for task in tasks:
+            cached = self.state.get_cached_result(cache_keys[task.task_id]) if cache_keys else None
+            if cached:
+                task.status = "cached"
+                task.result = cached['result']
         
-        # Execute tasks respecting dependencies
-        for task in execution_order:
-            # Wait for dependencies
-            if task.depends_on:
-                self._wait_for_dependencies(workflow_id, task.depends_on)
+        # Persist the workflow before anything is launched
+        self.state.create_workflow(
+            {
+                "workflow_id": workflow_id,
+                "name": context.name,
+                "owner": owner,
+                "mode": mode,
+                "priority": priority,
+                # Compiled workflows wait for admission as a whole
+                "status": "queued" if mode == "compiled" else "running",
+                "context": asdict(context),
+                "dataset_size": dataset_size,
+            },
+            [
+                {
+                    "task_id": task.task_id,
+                    "task_type": task.task_type.value,
+                    "config": task.config,
+                    "depends_on": task.depends_on,
+                    "status": task.status,
+                    "result": task.result,
+                    "cache_key": cache_keys.get(task.task_id),
+                    "estimated_seconds": task.estimated_seconds,
+                    "compute": task.compute,
+                    "placement_reason": task.placement_reason,
+                }
+                for task in tasks
+            ]
+        )
+        
+        if mode == "compiled":
+            if all(t.status == "cached" for t in tasks):
+                self.state.update_workflow(workflow_id, status="completed")
+                return
             
-            # Spawn serverless job
-            try:
-                run_id = self.create_serverless_job(task, context, workflow_id)
-                task.job_run_id = run_id
-                task.status = "running"
+            with self._lock:
+                for task in tasks:
+                    if task.status != "cached":
+                        self.state.update_task(workflow_id, task.task_id, status="queued")
+                self.admission.enqueue(self._compiled_request(self.load_workflow(workflow_id)))
+            self._dispatch()
+            return
+        
+        self._launch_ready_tasks(workflow_id)
+    
+    def _task_request(
+        self,
+        workflow: Dict[str, Any],
+        task: JobTask,
+        rank: float = 0
+    ) -> AdmissionRequest:
+        """Admission request for one run of a per-task workflow"""
+        compute = workflow['context'].compute
+        return AdmissionRequest(
+            workflow_id=workflow['workflow_id'],
+            task_id=task.task_id,
+            owner=workflow['owner'] or "anonymous",
+            priority=workflow['priority'] or "normal",
+            slots=1,
+            estimated_seconds=task.estimated_seconds or 0,
+            workflow_limit=compute.get('max_concurrent_tasks', self.MAX_CONCURRENT_TASKS),
+            rank=rank,
+        )
+    
+    def _speculative_request(self, workflow: Dict[str, Any], task: JobTask) -> AdmissionRequest:
+        """Admission request for the speculative duplicate of a task run, charged to the owner"""
+        return replace(self._task_request(workflow, task), task_id=f"{task.task_id}{SPECULATIVE_SUFFIX}")
+    
+    def _compiled_request(self, workflow: Dict[str, Any]) -> AdmissionRequest:
+        """Admission request for the run of a compiled workflow, holding a slot per task"""
+        to_run = self._compiled_tasks(workflow['tasks'])
+        return AdmissionRequest(
+            workflow_id=workflow['workflow_id'],
+            task_id=None,
+            owner=workflow['owner'] or "anonymous",
+            priority=workflow['priority'] or "normal",
+            slots=len(to_run),
+            estimated_seconds=max(self._critical_path_ranks(to_run).values(), default=0),
+            workflow_limit=len(to_run),
+        )
+    
+    @staticmethod
+    def _compiled_tasks(tasks: List[JobTask]) -> List[JobTask]:
+        """Tasks a compiled job runs, without their edges to cached tasks"""
+        cached = {t.task_id for t in tasks if t.status == "cached"}
+        return [
+            replace(t, depends_on=[dep for dep in t.depends_on if dep not in cached])
+            for t in tasks if t.status != "cached"
+        ]
+    
+    def _dispatch(self):
+        """
+        Start every queued run the admission controller lets through.
+        
+        Admission reserves the slots; the Jobs API calls run without the
+        orchestrator lock, so a slow or throttled call blocks neither the
+        poller nor other workflows. Callers must not hold the lock.
+        """
+        for request in self.admission.admit():
+            if request.task_id is None:
+                self._start_compiled(request.workflow_id)
+            else:
+                self._start_task(request.workflow_id, request.task_id)
+    
+    def _start_compiled(self, workflow_id: str):
+        """Submit an admitted compiled workflow as one multi-task job run"""
+        with self._lock:
+            workflow = self.load_workflow(workflow_id)
+            results = {t.task_id: t.result for t in workflow['tasks'] if t.status == "cached"}
+            to_run = self._compiled_tasks(workflow['tasks'])
+            upstream = {
+                t.task_id: {dep: results[dep] for dep in t.depends_on if dep in results}
+                for t in workflow['tasks']
+            }
+        
+        submitted_at = time.time()
+        try:
+            job_id, run_id = self.create_workflow_job(
+                to_run, workflow['context'], workflow_id, upstream=upstream
+            )
+        except Exception as e:
+            with self._lock:
+                self.admission.release(workflow_id)
+                for task in to_run:
+                    self.state.update_task(workflow_id, task.task_id, status="failed", error=str(e))
+                self.state.update_workflow(workflow_id, status="failed")
+            logger.error(f"Failed to launch workflow {workflow_id}: {e}")
+            return
+        
+        with self._lock:
+            self.state.update_workflow(workflow_id, status="running", job_id=job_id, run_id=run_id)
+            for task in to_run:
+                self.state.update_task(workflow_id, task.task_id, status="running", submitted_at=submitted_at)
+            
+            self._track(
+                run_id, job_id, workflow_id, None,
+                max(self._critical_path_ranks(to_run).values()),
+                submitted_at=submitted_at
+            )
+    
+    def _start_task(self, workflow_id: str, task_id: str):
+        """Spawn the job run of an admitted task"""
+        with self._lock:
+            workflow = self.load_workflow(workflow_id)
+            tasks = {t.task_id: t for t in workflow['tasks']}
+            task = tasks[task_id]
+            upstream = {dep: tasks[dep].result for dep in task.depends_on}
+        
+        # Spawn serverless job
+        submitted_at = time.time()
+        try:
+            job_id, run_id = self.create_serverless_job(
+                task, workflow['context'], workflow_id, upstream=upstream
+            )
+        except Exception as e:
+            with self._lock:
+                self.admission.release(workflow_id, task_id)
+                self.state.update_task(workflow_id, task_id, status="failed", error=str(e))
+            logger.error(f"Failed to launch task {task_id}: {e}")
+            self._launch_ready_tasks(workflow_id)
+            return
+        
+        with self._lock:
+            self.state.update_task(
+                workflow_id, task_id,
+                status="running", job_id=job_id, job_run_id=run_id, submitted_at=submitted_at
+            )
+            self._track(run_id, job_id, workflow_id, task_id, task.estimated_seconds, submitted_at=submitted_at)
+    
+    def _launch_ready_tasks(self, workflow_id: str):
+        """
+        Queue pending tasks whose dependencies have all completed for
+        admission (longest remaining path first within the workflow), then
+        start whatever the admission controller lets through.
+        """
+        with self._lock:
+            workflow = self.load_workflow(workflow_id)
+            tasks = {t.task_id: t for t in workflow['tasks']}
+            ranks = self._critical_path_ranks(workflow['tasks'])
+            
+            for task in self._topological_sort(workflow['tasks'], priorities=ranks):
+                if task.status not in ["pending", "queued"]:
+                    continue
                 
-                st.session_state.active_jobs[run_id] = {
-                    "workflow_id": workflow_id,
-                    "task_id": task.task_id
-                }
+                dep_statuses = [tasks[dep].status for dep in task.depends_on]
+                if any(status in ["failed", "skipped"] for status in dep_statuses):
+                    task.status = "skipped"
+                    self.state.update_task(workflow_id, task.task_id, status=task.status)
+                    continue
+                if not all(status in DONE_STATUSES for status in dep_statuses):
+                    continue
                 
-            except Exception as e:
-                task.status = "failed"
-                task.error = str(e)
-                st.error(f"Failed to launch task {task.task_id}: {e}")
-    
-    def _topological_sort(self, tasks: List[JobTask]) -> List[JobTask]:
-        """Sort tasks by dependencies (simple implementation)"""
-        sorted_tasks = []
-        remaining = tasks.copy()
-        
-        while remaining:
-            # Find tasks with no unmet dependencies
-            ready = [
-                t for t in remaining 
-                if all(dep in [st.task_id for st in sorted_tasks] for dep in t.depends_on)
-            ]
+                if task.status == "pending":
+                    task.status = "queued"
+                    self.state.update_task(workflow_id, task.task_id, status=task.status)
+                self.admission.enqueue(self._task_request(workflow, task, ranks[task.task_id]))
             
-            if not ready:
-                raise ValueError("Circular dependency detected in workflow")
+            if all(t.status in DONE_STATUSES + ["failed", "skipped"] for t in tasks.values()):
+                self.state.update_workflow(
+                    workflow_id,
+                    status="completed" if all(t.status in DONE_STATUSES for t in tasks.values()) else "failed"
+                )
+        
+        self._dispatch()
+    
+    def _track(
+        self,
+        run_id: int,
+        job_id: int,
+        workflow_id: str,
+        task_id: Optional[str],
+        expected_duration: float,
+        submitted_at: Optional[float] = None
+    ):
+        """Hand a submitted run to the background poller"""
+        with self._lock:
+            self._runs[run_id] = (workflow_id, task_id)
+        self.poller.track(run_id, job_id, expected_duration, submitted_at=submitted_at)
+    
+    def has_active_runs(self) -> bool:
+        return bool(self.poller.active_run_ids()) or self.admission.queued_count() > 0
+    
+    def _topological_sort(
+        self,
+        tasks: List[JobTask],
+        priorities: Optional[Dict[str, float]] = None
+    ) -> List[JobTask]:
+        """
+        Sort tasks by dependencies (Kahn's algorithm, O(n + e)).
+        Among ready tasks the highest priority comes first, then YAML order.
+        """
+        priorities = priorities or {}
+        position = {t.task_id: i for i, t in enumerate(tasks)}
+        children: Dict[str, List[str]] = {t.task_id: [] for t in tasks}
+        unmet = {t.task_id: len(t.depends_on) for t in tasks}
+        
+        for task in tasks:
+            for dep in task.depends_on:
+                if dep not in children:
+                    raise ValueError(f"Task {task.task_id} depends on unknown task {dep}")
+                children[dep].append(task.task_id)
+        
+        ready = [(-priorities.get(tid, 0), position[tid], tid) for tid, n in unmet.items() if n == 0]
+        heapq.heapify(ready)
+        sorted_ids = []
+        
+        while ready:
+            _, _, task_id = heapq.heappop(ready)
+            sorted_ids.append(task_id)
+            for child in children[task_id]:
+                unmet[child] -= 1
+                if unmet[child] == 0:
+                    heapq.heappush(ready, (-priorities.get(child, 0), position[child], child))
+        
+        if len(sorted_ids) != len(tasks):
+            raise ValueError("Circular dependency detected in workflow")
+        
+        by_id = {t.task_id: t for t in tasks}
+        return [by_id[task_id] for task_id in sorted_ids]
+    
+    def _critical_path_ranks(self, tasks: List[JobTask]) -> Dict[str, float]:
+        """Estimated length of the longest path from each task to the end of the DAG"""
+        children: Dict[str, List[str]] = {t.task_id: [] for t in tasks}
+        for task in tasks:
+            for dep in task.depends_on:
+                children[dep].append(task.task_id)
+        
+        ranks: Dict[str, float] = {}
+        for task in reversed(self._topological_sort(tasks)):
+            ranks[task.task_id] = (task.estimated_seconds or 0) + max(
+                (ranks[child] for child in children[task.task_id]), default=0
+            )
+        return ranks
+    
+    @staticmethod
+    def _duration_seconds(status: Dict[str, Any]) -> Optional[float]:
+        if status.get('start_time') and status.get('end_time'):
+            return (status['end_time'] - status['start_time']) / 1000
+        return None
+    
+    @staticmethod
+    def _run_times(status: Dict[str, Any]) -> Dict[str, float]:
+        """Run start and end as epoch seconds, when known"""
+        return {
+            field: status[key] / 1000
+            for field, key in [("started_at", "start_time"), ("ended_at", "end_time")]
+            if status.get(key)
+        }
+    
+    def handle_run_statuses(self, changes: List[Tuple[int, Dict[str, Any]]]):
+        """
+        Apply a batch of status changes published by the background poller.
+        Results of all per-task runs that succeeded in the batch are fetched
+        concurrently before the changes are applied.
+        """
+        succeeded = []
+        with self._lock:
+            for run_id, status in changes:
+                if run_id in self._runs and self._runs[run_id][1] and status['result_state'] == 'SUCCESS':
+                    task_run = next(iter(status['tasks'].values()), None)
+                    succeeded.append(task_run['run_id'] if task_run else run_id)
+        
+        outputs = self._fetch_outputs(succeeded)
+        
+        for run_id, status in changes:
+            self.handle_run_status(run_id, status, outputs)
+    
+    def handle_run_status(
+        self,
+        run_id: int,
+        status: Dict[str, Any],
+        outputs: Optional[Dict[int, Dict[str, Any]]] = None
+    ):
+        """
+        Apply a status change published by the background poller and write
+        the resulting transitions to the state store.
+        """
+        outputs = outputs or {}
+        with self._lock:
+            if run_id not in self._runs:
+                return
+            workflow_id, task_id = self._runs[run_id]
             
-            sorted_tasks.extend(ready)
-            for t in ready:
-                remaining.remove(t)
+            if task_id is None:
+                self._apply_workflow_run_status(run_id, status, workflow_id)
+            elif not self._apply_task_run_status(run_id, status, outputs, workflow_id, task_id):
+                return
         
-        return sorted_tasks
+        # Freed slots are handed out without the lock: launching calls the Jobs API
+        if task_id is None:
+            self._dispatch()
+        else:
+            self._launch_ready_tasks(workflow_id)
     
-    def _wait_for_dependencies(self, workflow_id: str, dependencies: List[str]):
-        """Wait for dependent tasks to complete"""
-        workflow = st.session_state.workflow_state[workflow_id]
-        tasks = {t.task_id: t for t in workflow['tasks']}
+    def _apply_task_run_status(
+        self,
+        run_id: int,
+        status: Dict[str, Any],
+        outputs: Dict[int, Dict[str, Any]],
+        workflow_id: str,
+        task_id: str
+    ) -> bool:
+        """Apply the status of a per-task run; returns whether its task finished"""
+        speculative = run_id in self._speculative_runs
+        siblings = [
+            other for other, key in self._runs.items()
+            if key == (workflow_id, task_id) and other != run_id
+        ]
+        
+        task_run = next(iter(status['tasks'].values()), None)
+        run_times = self._run_times(task_run or status)
+        # Times of a speculative run are only recorded if it wins
+        if run_times and not speculative:
+            self.state.update_task(workflow_id, task_id, **run_times)
         
-        for dep_id in dependencies:
-            dep_task = tasks[dep_id]
+        if status['result_state'] == 'SUCCESS':
+            if speculative:
+                self.state.update_task(workflow_id, task_id, job_run_id=run_id, **run_times)
+            self._cancel_losing_runs(workflow_id, siblings)
             
-            while dep_task.status == "running":
-                if dep_task.job_run_id:
-                    status = self.get_job_status(dep_task.job_run_id)
-                    
-                    if status['result_state'] == 'SUCCESS':
-                        dep_task.status = "completed"
-                    elif status['result_state'] in ['FAILED', 'CANCELED']:
-                        dep_task.status = "failed"
-                        raise Exception(f"Dependency {dep_id} failed")
+            task_run_id = task_run['run_id'] if task_run else run_id
+            self._complete_task(
+                workflow_id, task_id, task_run_id,
+                self._duration_seconds(task_run or status),
+                output=outputs.get(task_run_id)
+            )
+        elif status['result_state'] in ['FAILED', 'CANCELED', 'TIMEDOUT'] \
+                or status['state'] in ['SKIPPED', 'INTERNAL_ERROR']:
+            if siblings:
+                # The other run of a speculated task may still succeed; this one's compute is lost
+                self._charge_waste(workflow_id, self._duration_seconds(task_run or status) or 0.0)
+                self._forget_run(run_id)
+                return False
+            # Skipped runs (e.g. over the job's concurrency limit) have no error of their own
+            error = self._fetch_error(task_run['run_id'] if task_run else run_id)
+            self.state.update_task(
+                workflow_id, task_id, status="failed",
+                error=error or f"Run {run_id} ended {status['state']}"
+            )
+        else:
+            return False
+        
+        self._forget_run(run_id)
+        self.admission.release(workflow_id, task_id)
+        return True
+    
+    def _forget_run(self, run_id: int):
+        workflow_id, task_id = self._runs.pop(run_id)
+        if run_id in self._speculative_runs:
+            self._speculative_runs.discard(run_id)
+            self.admission.release(workflow_id, f"{task_id}{SPECULATIVE_SUFFIX}")
+    
+    def check_stragglers(self):
+        """
+        Launch a speculative duplicate of every per-task run that has been
+        out for more than `multiple` times the historical median runtime of
+        its task type, while the workflow's wasted compute is under
+        `max_wasted_minutes`. Called on every poller tick.
+        """
+        now = time.time()
+        if now - self._last_speculation_check < self.SPECULATION_CHECK_INTERVAL:
+            return
+        self._last_speculation_check = now
+        
+        stragglers = []
+        with self._lock:
+            workflow_ids = {workflow_id for workflow_id, task_id in self._runs.values() if task_id}
+            
+            for workflow_id in workflow_ids:
+                workflow = self.load_workflow(workflow_id)
+                speculation = workflow['context'].compute.get('speculation')
+                if not speculation:
+                    continue
                 
-                asyncio.sleep(5)  # Poll every 5 seconds
+                settings = {
+                    **self.DEFAULT_SPECULATION,
+                    **(speculation if isinstance(speculation, dict) else {})
+                }
+                if (workflow['speculation_wasted_seconds'] or 0) >= settings['max_wasted_minutes'] * 60:
+                    continue
+                
+                for task in workflow['tasks']:
+                    if task.status != "running" or task.speculative_run_id or not task.submitted_at:
+                        continue
+                    
+                    p50 = self.runtime_model.measured(task.task_type, workflow['dataset_size'], task.compute)
+                    if p50 is not None and now - task.submitted_at > settings['multiple'] * p50:
+                        stragglers.append((workflow, task))
+        
+        # Launched without the lock: each launch calls the Jobs API
+        for workflow, task in stragglers:
+            self._speculate(workflow, task)
     
-    def poll_active_jobs(self):
-        """Poll all active jobs for status updates (called by Streamlit auto-rerun)"""
-        for run_id, job_info in list(st.session_state.active_jobs.items()):
-            status = self.get_job_status(run_id)
+    def _speculate(self, workflow: Dict[str, Any], task: JobTask):
+        """Launch a second run of a straggling task; the first to succeed wins"""
+        workflow_id = workflow['workflow_id']
+        tasks = {t.task_id: t for t in workflow['tasks']}
+        upstream = {dep: tasks[dep].result for dep in task.depends_on}
+        
+        # Duplicates count against the global and the owner's limits like any run
+        request = self._speculative_request(workflow, task)
+        if not self.admission.try_admit(request):
+            return
+        
+        try:
+            job_id, run_id = self.create_serverless_job(
+                task, workflow['context'], workflow_id, upstream=upstream
+            )
+        except Exception as e:
+            self.admission.release(*request.key)
+            logger.warning(f"Failed to launch speculative run of task {task.task_id}: {e}")
+            return
+        
+        with self._lock:
+            if (workflow_id, task.task_id) not in self._runs.values():
+                # The task finished while the duplicate was being launched
+                self.admission.release(*request.key)
+                self._cancel_run(run_id)
+                return
+            self.state.update_task(workflow_id, task.task_id, speculative_run_id=run_id)
+            self._speculative_runs.add(run_id)
+            self._track(run_id, job_id, workflow_id, task.task_id, task.estimated_seconds or 0)
+        logger.info(f"Launched speculative run {run_id} of straggling task {task.task_id}")
+    
+    def _cancel_losing_runs(self, workflow_id: str, run_ids: List[int]):
+        """Cancel the other runs of a task that has succeeded and charge their compute as waste"""
+        if not run_ids:
+            return
+        
+        wasted = 0.0
+        for run_id in run_ids:
+            status = self.poller.store.get(run_id)
+            if status and status.get('start_time'):
+                wasted += time.time() - status['start_time'] / 1000
             
-            workflow_id = job_info['workflow_id']
-            task_id = job_info['task_id']
+            self._cancel_run(run_id)
+            self._forget_run(run_id)
+        
+        self._charge_waste(workflow_id, wasted)
+    
+    def _cancel_run(self, run_id: int):
+        try:
+            self.executor.cancel_run(run_id)
+        except Exception as e:
+            logger.warning(f"Failed to cancel run {run_id}: {e}")
+    
+    def _charge_waste(self, workflow_id: str, seconds: float):
+        """Add the compute of a losing run of a speculated task to the workflow's waste"""
+        if not seconds:
+            return
+        workflow = self.state.get_workflow(workflow_id)
+        self.state.update_workflow(
+            workflow_id,
+            speculation_wasted_seconds=(workflow['speculation_wasted_seconds'] or 0) + seconds
+        )
+    
+    def _apply_workflow_run_status(
+        self,
+        run_id: int,
+        status: Dict[str, Any],
+        workflow_id: str
+    ):
+        """Map the task runs of a compiled workflow run onto its DAG tasks"""
+        workflow = self.load_workflow(workflow_id)
+        transitions = []
+        
+        for task in workflow['tasks']:
+            task_status = status['tasks'].get(task.task_id)
+            if not task_status:
+                continue
             
-            workflow = st.session_state.workflow_state[workflow_id]
-            task = next(t for t in workflow['tasks'] if t.task_id == task_id)
+            if task_status['result_state'] == 'SUCCESS':
+                new_status = "completed"
+            elif task_status['result_state'] in ['FAILED', 'CANCELED', 'TIMEDOUT']:
+                new_status = "failed"
+            elif task_status['result_state'] in ['UPSTREAM_FAILED', 'UPSTREAM_CANCELED', 'EXCLUDED'] \
+                    or task_status['state'] == 'SKIPPED':
+                new_status = "skipped"
+            elif task_status['state'] in ['PENDING', 'QUEUED', 'BLOCKED', 'WAITING_FOR_RETRY']:
+                new_status = "pending"
+            else:
+                new_status = "running"
             
-            if status['result_state'] == 'SUCCESS':
-                task.status = "completed"
-                del st.session_state.active_jobs[run_id]
-            elif status['result_state'] in ['FAILED', 'CANCELED']:
-                task.status = "failed"
-                del st.session_state.active_jobs[run_id]
+            if (new_status, task_status['run_id']) != (task.status, task.job_run_id):
+                transitions.append((task, task_status, new_status))
+        
+        # Tasks finishing in the same poll have their results fetched concurrently
+        outputs = self._fetch_outputs([
+            task_status['run_id'] for _, task_status, new_status in transitions if new_status == "completed"
+        ])
+        
+        for task, task_status, new_status in transitions:
+            self.state.update_task(
+                workflow_id, task.task_id,
+                job_run_id=task_status['run_id'], **self._run_times(task_status)
+            )
+            if new_status == "completed":
+                self._complete_task(
+                    workflow_id, task.task_id, task_status['run_id'],
+                    self._duration_seconds(task_status),
+                    output=outputs[task_status['run_id']]
+                )
+            elif new_status == "failed":
+                self.state.update_task(
+                    workflow_id, task.task_id, status=new_status,
+                    error=self._fetch_error(task_status['run_id'])
+                )
+            else:
+                self.state.update_task(workflow_id, task.task_id, status=new_status)
+        
+        if status['state'] in TERMINAL_LIFE_CYCLE_STATES:
+            self.state.update_workflow(
+                workflow_id,
+                status="completed" if status['result_state'] == 'SUCCESS' else "failed"
+            )
+            del self._runs[run_id]
+            self.admission.release(workflow_id)
+
+
+@st.cache_resource
+def get_orchestrator() -> StreamlitOrchestrator:
+    """Orchestrator shared by all sessions of the app process"""
+    orchestrator = StreamlitOrchestrator()
+    orchestrator.start()
+    return orchestrator
 
 
 def main():
@@ -290,7 +1751,7 @@ def main():
     st.title("🤖 Databricks AutoML Ensemble Orchestrator")
     st.caption("In-process orchestration with Serverless execution")
     
-    orchestrator = StreamlitOrchestrator()
+    orchestrator = get_orchestrator()
     
     # Sidebar - Workflow Submission
     with st.sidebar:
@@ -302,13 +1763,36 @@ def main():
             placeholder="Paste your workflow YAML here..."
         )
         
+        mode = st.radio(
+            "Execution mode",
+            options=["compiled", "per_task"],
+            format_func=lambda m: "Single multi-task job" if m == "compiled" else "One job per task",
+            help="Compiled mode lets Databricks schedule dependencies server-side"
+        )
+        
+        use_cache = st.checkbox(
+            "Reuse cached task results",
+            value=True,
+            help="Skip tasks whose type, config, upstream tasks and source table version are unchanged"
+        )
+        
+        priority = st.selectbox(
+            "Priority",
+            options=PRIORITY_CLASSES,
+            index=PRIORITY_CLASSES.index("normal"),
+            help="Queued runs of higher priority classes are admitted first"
+        )
+        
         if st.button("🚀 Launch Workflow", type="primary"):
             if yaml_input:
                 try:
                     config = orchestrator.parse_yaml_config(yaml_input)
-                    workflow_id = f"wf_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                    workflow_id = f"wf_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
                     
-                    orchestrator.execute_workflow(config, workflow_id)
+                    orchestrator.execute_workflow(
+                        config, workflow_id, mode=mode, use_cache=use_cache, priority=priority,
+                        owner=st.context.headers.get("X-Forwarded-Email")
+                    )
                     st.success(f"Workflow {workflow_id} launched!")
                     
                 except Exception as e:
@@ -326,6 +1810,7 @@ obsrv:
     name: my_ensemble
     compute:
       serverless: [GPU]
+      objective: makespan
     timeout: 10 minutes
     metric:
       classification: [accuracy, f1]
@@ -355,33 +1840,59 @@ obsrv:
     # Main area - Active Workflows
     st.header("Active Workflows")
     
-    if not st.session_state.workflow_state:
-        st.info("No active workflows. Submit a workflow from the sidebar.")
-    else:
-        # Poll active jobs
-        orchestrator.poll_active_jobs()
+    # Re-render every 5 seconds while jobs are active, without blocking the script
+    @st.fragment(run_every=5 if orchestrator.has_active_runs() else None)
+    def render_workflows():
+        # Statuses are applied by the background poller; this only reads the state store
+        workflows = orchestrator.list_workflows()
+        queue = orchestrator.admission.queue_status()
+        
+        if not workflows:
+            st.info("No active workflows. Submit a workflow from the sidebar.")
+            return
         
         # Display workflows
-        for workflow_id, workflow in st.session_state.workflow_state.items():
+        for workflow in workflows:
+            workflow_id = workflow['workflow_id']
             with st.expander(f"📊 {workflow_id} - {workflow['status']}", expanded=True):
                 
                 # Workflow metadata
-                col1, col2, col3 = st.columns(3)
+                col1, col2, col3, col4, col5 = st.columns(5)
                 col1.metric("Workflow ID", workflow_id)
                 col2.metric("Status", workflow['status'])
                 col3.metric("Created", workflow['created_at'].strftime("%Y-%m-%d %H:%M:%S"))
+                col4.metric("Workflow Run ID", workflow['run_id'] or "—")
+                col5.metric("Owner", workflow['owner'] or "—")
+                if (workflow_id, None) in queue:
+                    position, estimated_start = queue[(workflow_id, None)]
+                    st.info(
+                        f"Queued for admission: position {position}, "
+                        f"estimated start {estimated_start.strftime('%H:%M:%S')}"
+                    )
+                st.caption(
+                    f"Priority: {workflow['priority'] or 'normal'} · "
+                    f"Placement objective: {workflow['context'].compute.get('objective', 'makespan')}"
+                    + (f" · Speculation waste: {workflow['speculation_wasted_seconds'] / 60:.1f} min"
+                       if workflow['speculation_wasted_seconds'] else "")
+                )
                 
                 # Task status table
                 st.subheader("Task Status")
                 
                 task_data = []
                 for task in workflow['tasks']:
+                    queued = queue.get((workflow_id, task.task_id))
                     task_data.append({
                         "Task": task.task_id,
                         "Type": task.task_type.value,
                         "Status": task.status,
+                        "Queue": f"#{queued[0]} · ~{queued[1].strftime('%H:%M')}" if queued else "—",
+                        "Compute": task.compute or "—",
+                        "Estimate (min)": round(task.estimated_seconds / 60, 1) if task.estimated_seconds else "—",
                         "Job Run ID": task.job_run_id or "—",
+                        "Speculative Run ID": task.speculative_run_id or "—",
                         "Dependencies": ", ".join(task.depends_on) if task.depends_on else "None",
+                        "Placement": task.placement_reason or "—",
                         "Error": task.error or "—"
                     })
                 
@@ -391,8 +1902,12 @@ obsrv:
                 def color_status(val):
                     if val == "completed":
                         return 'background-color: #d4edda'
+                    elif val == "cached":
+                        return 'background-color: #d1ecf1'
                     elif val == "running":
                         return 'background-color: #fff3cd'
+                    elif val == "queued":
+                        return 'background-color: #e2e3e5'
                     elif val == "failed":
                         return 'background-color: #f8d7da'
                     return ''
@@ -402,15 +1917,53 @@ obsrv:
                     use_container_width=True
                 )
                 
+                # Timeline: where task time goes (queueing/startup vs compute vs polling)
+                timeline_rows = gantt_rows(workflow['tasks'])
+                if timeline_rows:
+                    st.subheader("Timeline")
+                    timeline_df = pd.DataFrame(timeline_rows)
+                    
+                    totals = timeline_df.groupby("Phase")["Seconds"].sum()
+                    for col, phase in zip(st.columns(len(PHASES)), PHASES):
+                        col.metric(f"{phase.capitalize()} (task-s)", round(totals.get(phase, 0), 1))
+                    
+                    order = [t.task_id for t in workflow['tasks']]
+                    bars = alt.Chart(timeline_df).mark_bar().encode(
+                        x=alt.X("Start:T", title=None),
+                        x2="End:T",
+                        y=alt.Y("Task:N", sort=order, title=None),
+                        color=alt.Color("Phase:N", scale=alt.Scale(domain=PHASES)),
+                        tooltip=["Task", "Phase", "Seconds"]
+                    )
+                    
+                    # Outline the full span of every task on the critical path
+                    critical_spans = timeline_df[timeline_df["Critical"]].groupby("Task", as_index=False).agg(
+                        Start=("Start", "min"), End=("End", "max")
+                    )
+                    overlay = alt.Chart(critical_spans).mark_bar(
+                        filled=False, stroke="#d62728", strokeWidth=2
+                    ).encode(
+                        x="Start:T",
+                        x2="End:T",
+                        y=alt.Y("Task:N", sort=order)
+                    )
+                    
+                    st.altair_chart(bars + overlay, use_container_width=True)
+                    st.caption("Critical path: " + " → ".join(critical_path(workflow['tasks'])))
+                    
+                    st.download_button(
+                        "⬇️ Chrome trace",
+                        data=json.dumps(chrome_trace(workflow_id, workflow['tasks'])),
+                        file_name=f"{workflow_id}_trace.json",
+                        mime="application/json",
+                        key=f"trace_{workflow_id}"
+                    )
+                
                 # Refresh button
                 if st.button(f"🔄 Refresh {workflow_id}"):
-                    st.rerun()
+                    st.rerun(scope="fragment")
     
-    # Auto-refresh every 10 seconds if there are active jobs
-    if st.session_state.active_jobs:
-        import time
-        time.sleep(10)
-        st.rerun()
+    render_workflows()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,126 @@
+"""
+Task timelines of orchestrated workflows.
+
+Every task records when the orchestrator submitted it, when its run started
+and ended (the run's `start_time` / `end_time`) and when its result was
+fetched. This module splits those timestamps into phases, finds the realized
+critical path, and exports the timeline as Gantt rows or a Chrome trace
+(chrome://tracing, Perfetto).
+
+Phases:
+- wait: submitted, but upstream tasks still running (compiled mode)
+- queue: ready until the run started (job queueing and compute startup)
+- execute: run start to run end
+- detect: run end until the orchestrator noticed (polling latency)
+- fetch: reading the run's exit payload
+"""
+
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+PHASES = ["wait", "queue", "execute", "detect", "fetch"]
+
+
+def _finished_at(task: Any) -> Optional[float]:
+    return task.fetched_at or task.ended_at
+
+
+def task_phases(tasks: List[Any], now: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Phases of every submitted task as dicts with task_id, phase, start and
+    end (epoch seconds). Phases still in progress end at `now`.
+    """
+    now = now or time.time()
+    by_id = {task.task_id: task for task in tasks}
+    phases = []
+
+    for task in tasks:
+        if not task.submitted_at:
+            continue
+
+        # A task is ready once it is submitted and all upstream runs have ended
+        ready_at = max(
+            [task.submitted_at] + [by_id[dep].ended_at or now for dep in task.depends_on
+                                   if by_id[dep].submitted_at]
+        )
+        fetch_start = task.fetched_at - (task.fetch_seconds or 0) if task.fetched_at else None
+
+        bounds = [
+            ("wait", task.submitted_at, min(ready_at, task.started_at or now)),
+            ("queue", ready_at, task.started_at or (None if task.ended_at else now)),
+            ("execute", task.started_at, task.ended_at or (now if task.status == "running" else None)),
+            ("detect", task.ended_at, fetch_start),
+            ("fetch", fetch_start, task.fetched_at),
+        ]
+
+        for phase, start, end in bounds:
+            if start and end and end > start:
+                phases.append({"task_id": task.task_id, "phase": phase, "start": start, "end": end})
+
+    return phases
+
+
+def critical_path(tasks: List[Any]) -> List[str]:
+    """
+    Realized critical path: from the last task to finish, repeatedly step
+    to the upstream task that finished last.
+    """
+    by_id = {task.task_id: task for task in tasks}
+    finished = [task for task in tasks if _finished_at(task)]
+    if not finished:
+        return []
+
+    path = [max(finished, key=_finished_at)]
+    while True:
+        upstream = [by_id[dep] for dep in path[-1].depends_on if _finished_at(by_id[dep])]
+        if not upstream:
+            break
+        path.append(max(upstream, key=_finished_at))
+
+    return [task.task_id for task in reversed(path)]
+
+
+def gantt_rows(tasks: List[Any], now: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Phases as Gantt chart rows with datetimes, durations and critical-path flags"""
+    critical = set(critical_path(tasks))
+    return [
+        {
+            "Task": phase["task_id"],
+            "Phase": phase["phase"],
+            "Start": datetime.fromtimestamp(phase["start"]),
+            "End": datetime.fromtimestamp(phase["end"]),
+            "Seconds": round(phase["end"] - phase["start"], 1),
+            "Critical": phase["task_id"] in critical,
+        }
+        for phase in task_phases(tasks, now)
+    ]
+
+
+def chrome_trace(workflow_id: str, tasks: List[Any], now: Optional[float] = None) -> Dict[str, Any]:
+    """Timeline in the Chrome trace event format, one thread per task"""
+    critical = set(critical_path(tasks))
+    thread_ids = {task.task_id: tid for tid, task in enumerate(tasks, start=1)}
+
+    events: List[Dict[str, Any]] = [
+        {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": workflow_id}}
+    ]
+    for task in tasks:
+        events.append({
+            "name": "thread_name", "ph": "M", "pid": 1, "tid": thread_ids[task.task_id],
+            "args": {"name": task.task_id},
+        })
+
+    for phase in task_phases(tasks, now):
+        events.append({
+            "name": phase["phase"],
+            "cat": "critical" if phase["task_id"] in critical else "task",
+            "ph": "X",
+            "pid": 1,
+            "tid": thread_ids[phase["task_id"]],
+            "ts": int(phase["start"] * 1_000_000),
+            "dur": int((phase["end"] - phase["start"]) * 1_000_000),
+            "args": {"task_id": phase["task_id"]},
+        })
+
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
@@ -0,0 +1,316 @@
+"""
+Feature transforms from `source.features.include[].transform`.
+
+Every included feature may declare up to three stages:
+
+    features:
+      include:
+        - income:
+          transform:
+            - pre_scale: log1p
+              scale: robust
+              post_scale: clip 5
+
+The stages of all features compile into one FeaturePipeline. Its scale
+statistics are fitted once per workflow by the sample task (on the sample,
+in one aggregation on the executors) and it is applied as one fused pass over
+a float32 matrix: NumPy on the driver, a pandas UDF on the executors.
+Services load the fitted pipeline from the sample task's result instead of
+fitting their own scalers.
+
+Stages:
+- pre_scale: log1p, sqrt (both sign-preserving), abs
+- scale: standard, minmax, robust (median and IQR), maxabs
+- post_scale: clip [bound, default 5], tanh
+"""
+
+import hashlib
+import json
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+PRE_SCALE = {
+    "log1p": lambda x: np.sign(x) * np.log1p(np.abs(x)),
+    "sqrt": lambda x: np.sign(x) * np.sqrt(np.abs(x)),
+    "abs": np.abs,
+}
+
+SCALE_METHODS = ["standard", "minmax", "robust", "maxabs"]
+
+POST_SCALE = {
+    "clip": lambda x, bound: np.clip(x, -bound, bound),
+    "tanh": lambda x, _: np.tanh(x),
+}
+
+DEFAULT_CLIP = 5.0
+
+STAGES = ["pre_scale", "scale", "post_scale"]
+
+# Run artifact of a fitted pipeline: logged by the sample task and next to every
+# model trained on transformed data, so the model can be served on raw rows
+PIPELINE_ARTIFACT = "feature_pipeline.json"
+
+
+def _stage(stage: str, value) -> Optional[Tuple[str, Optional[float]]]:
+    """`name` or `name arg` of a stage, validated"""
+    if value is None or value == "":
+        return None
+    parts = str(value).split()
+    name, arg = parts[0], (float(parts[1]) if len(parts) > 1 else None)
+    known = {"pre_scale": PRE_SCALE, "scale": SCALE_METHODS, "post_scale": POST_SCALE}[stage]
+    if name not in known:
+        raise ValueError(f"Unknown {stage} '{name}', expected one of {list(known)}")
+    return name, arg
+
+
+def parse_transforms(features: Optional[dict]) -> Dict[str, Dict[str, Tuple[str, Optional[float]]]]:
+    """
+    The stages of every feature with a transform, from `source.features`.
+
+    Returns {column: {stage: (name, arg)}}; features without stages (and the
+    placeholder entries of the config template) are left out.
+    """
+    specs = {}
+    for entry in (features or {}).get('include') or []:
+        if not isinstance(entry, dict):
+            continue
+        steps = entry.get('transform') or []
+        if isinstance(steps, dict):
+            steps = [steps]
+        stages = {}
+        for step in steps:
+            stages.update({k: v for k, v in (step or {}).items() if v not in (None, "")})
+        stages = {stage: _stage(stage, stages.get(stage)) for stage in STAGES if stages.get(stage) not in (None, "")}
+        if not stages:
+            continue
+        for column in entry:
+            if column != 'transform':
+                specs[column] = stages
+    return specs
+
+
+def _center_scale(method: str, stats: Dict[str, float]) -> Tuple[float, float]:
+    """Offset and divisor of a scale method from its fitted statistics"""
+    if method == "standard":
+        return stats["mean"], stats["std"]
+    if method == "minmax":
+        return stats["min"], stats["max"] - stats["min"]
+    if method == "robust":
+        return stats["q50"], stats["q75"] - stats["q25"]
+    return 0.0, stats["maxabs"]
+
+
+# Statistics every scale method is fitted from
+SCALE_STATS = {
+    "standard": ["mean", "std"],
+    "minmax": ["min", "max"],
+    "robust": ["q25", "q50", "q75"],
+    "maxabs": ["maxabs"],
+}
+
+_NUMPY_STATS = {
+    "mean": np.nanmean,
+    "std": np.nanstd,
+    "min": np.nanmin,
+    "max": np.nanmax,
+    "q25": lambda x: np.nanpercentile(x, 25),
+    "q50": lambda x: np.nanpercentile(x, 50),
+    "q75": lambda x: np.nanpercentile(x, 75),
+    "maxabs": lambda x: np.nanmax(np.abs(x)),
+}
+
+
+class FeaturePipeline:
+    """
+    The fused transform of every configured feature.
+
+    Pre-scale functions run once per group of columns that share them, the
+    scales of all columns are one broadcast affine step (unscaled columns
+    have offset 0 and factor 1), then post-scale functions run per group.
+    """
+
+    def __init__(self, specs: Dict[str, dict], center: Optional[List[float]] = None,
+                 scale: Optional[List[float]] = None):
+        self.specs = {c: {stage: tuple(s) for stage, s in stages.items() if s} for c, stages in specs.items()}
+        self.columns = list(self.specs)
+        self.center = np.asarray(center if center is not None else [0.0] * len(self.columns), dtype=np.float32)
+        scale = np.asarray(scale if scale is not None else [1.0] * len(self.columns), dtype=np.float64)
+        # Constant columns keep their offset but are not stretched
+        self.scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0).astype(np.float32)
+        self._inv_scale = (1.0 / self.scale).astype(np.float32)
+        self._pre = self._groups("pre_scale")
+        self._post = self._groups("post_scale")
+
+    def _groups(self, stage: str) -> List[Tuple[Tuple[str, Optional[float]], np.ndarray]]:
+        groups: Dict[Tuple[str, Optional[float]], List[int]] = {}
+        for idx, column in enumerate(self.columns):
+            if stage in self.specs[column]:
+                groups.setdefault(self.specs[column][stage], []).append(idx)
+        return [(step, np.asarray(idx)) for step, idx in groups.items()]
+
+    def pre_scaled(self, values: np.ndarray) -> np.ndarray:
+        for (name, _), idx in self._pre:
+            values[:, idx] = PRE_SCALE[name](values[:, idx])
+        return values
+
+    def transform_matrix(self, values: np.ndarray) -> np.ndarray:
+        """Transform an (n_rows, n_columns) matrix in `columns` order; returns float32"""
+        out = self.pre_scaled(np.array(values, dtype=np.float32))
+        out -= self.center
+        out *= self._inv_scale
+        for (name, arg), idx in self._post:
+            out[:, idx] = POST_SCALE[name](out[:, idx], arg if arg is not None else DEFAULT_CLIP)
+        return out
+
+    def apply(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """The frame with the pipeline's columns transformed to float32, other columns untouched"""
+        missing = [c for c in self.columns if c not in frame.columns]
+        if missing:
+            raise ValueError(f"Feature transform columns not in the data: {missing}")
+        values = self.transform_matrix(frame[self.columns].to_numpy(dtype=np.float32, na_value=np.nan))
+        return frame.assign(**{c: values[:, idx] for idx, c in enumerate(self.columns)})
+
+    def fit(self, frame: pd.DataFrame) -> "FeaturePipeline":
+        """Fit the scale statistics on a pandas frame (driver)"""
+        values = self.pre_scaled(frame[self.columns].to_numpy(dtype=np.float64, na_value=np.nan))
+        stats = [
+            {stat: float(_NUMPY_STATS[stat](values[:, idx])) for stat in SCALE_STATS.get(self._scale_method(c), [])}
+            for idx, c in enumerate(self.columns)
+        ]
+        return self._with_stats(stats)
+
+    def fit_spark(self, df) -> "FeaturePipeline":
+        """Fit the scale statistics on a Spark DataFrame in one aggregation (executors)"""
+        from pyspark.sql import functions as F
+
+        pre = {
+            "log1p": lambda c: F.signum(c) * F.log1p(F.abs(c)),
+            "sqrt": lambda c: F.signum(c) * F.sqrt(F.abs(c)),
+            "abs": F.abs,
+        }
+        stat_exprs = {
+            "mean": F.avg,
+            "std": F.stddev_pop,
+            "min": F.min,
+            "max": F.max,
+            "q25": lambda c: F.percentile_approx(c, 0.25, 10000),
+            "q50": lambda c: F.percentile_approx(c, 0.5, 10000),
+            "q75": lambda c: F.percentile_approx(c, 0.75, 10000),
+            "maxabs": lambda c: F.max(F.abs(c)),
+        }
+
+        aggregates = []
+        for idx, column in enumerate(self.columns):
+            value = F.col(column).cast("double")
+            if "pre_scale" in self.specs[column]:
+                value = pre[self.specs[column]["pre_scale"][0]](value)
+            # NaN would poison every aggregate; Spark skips nulls
+            value = F.when(~F.isnan(value), value)
+            aggregates += [stat_exprs[stat](value).alias(f"{stat}_{idx}")
+                           for stat in SCALE_STATS.get(self._scale_method(column), [])]
+
+        row = df.agg(*aggregates).first().asDict() if aggregates else {}
+        stats = [
+            {stat: float(row[f"{stat}_{idx}"]) if row[f"{stat}_{idx}"] is not None else float("nan")
+             for stat in SCALE_STATS.get(self._scale_method(c), [])}
+            for idx, c in enumerate(self.columns)
+        ]
+        return self._with_stats(stats)
+
+    def _scale_method(self, column: str) -> Optional[str]:
+        return self.specs[column].get("scale", (None,))[0]
+
+    def _with_stats(self, stats: List[Dict[str, float]]) -> "FeaturePipeline":
+        center, scale = [], []
+        for column, column_stats in zip(self.columns, stats):
+            method = self._scale_method(column)
+            offset, divisor = _center_scale(method, column_stats) if method else (0.0, 1.0)
+            center.append(offset if np.isfinite(offset) else 0.0)
+            scale.append(divisor)
+        return FeaturePipeline(self.specs, center, scale)
+
+    def apply_spark(self, df):
+        """The Spark DataFrame with the pipeline's columns transformed to float32 by a pandas UDF"""
+        from pyspark.sql import functions as F
+        from pyspark.sql.functions import pandas_udf
+
+        columns = self.columns
+        pipeline = self
+
+        @pandas_udf(", ".join(f"`{c}` float" for c in columns))
+        def transform_udf(batch: pd.DataFrame) -> pd.DataFrame:
+            values = pipeline.transform_matrix(batch.to_numpy(dtype=np.float32, na_value=np.nan))
+            return pd.DataFrame(values, columns=columns)
+
+        transformed = df.withColumn("_features", transform_udf(F.struct(*[F.col(f"`{c}`").cast("float") for c in columns])))
+        return transformed.select(*[
+            F.col("_features").getField(c).alias(c) if c in self.specs else F.col(f"`{c}`")
+            for c in df.columns
+        ])
+
+    def to_dict(self) -> dict:
+        return {
+            "columns": self.columns,
+            "specs": {c: {stage: list(s) for stage, s in stages.items()} for c, stages in self.specs.items()},
+            "center": [float(v) for v in self.center],
+            "scale": [float(v) for v in self.scale],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FeaturePipeline":
+        specs = {c: data["specs"][c] for c in data["columns"]}
+        return cls(specs, data["center"], data["scale"])
+
+    def fingerprint(self) -> str:
+        return hashlib.sha256(json.dumps(self.to_dict(), sort_keys=True).encode()).hexdigest()[:16]
+
+
+def pipeline_result(upstream: dict) -> Optional[dict]:
+    """The upstream result carrying the workflow's fitted pipeline (`feature_pipeline`)"""
+    for result in upstream.values():
+        if result and result.get('feature_pipeline'):
+            return result
+    return None
+
+
+def upstream_pipeline(upstream: dict) -> Optional[FeaturePipeline]:
+    """The workflow's fitted pipeline, loaded from the sample task's MLflow artifact"""
+    import mlflow
+
+    result = pipeline_result(upstream)
+    if result is None:
+        return None
+    return FeaturePipeline.from_dict(mlflow.artifacts.load_dict(result['feature_pipeline']))
+
+
+def log_pipeline(pipeline: Optional[FeaturePipeline]) -> Optional[str]:
+    """Log a fitted pipeline and this module to the active MLflow run; returns the pipeline's artifact URI"""
+    import mlflow
+
+    if pipeline is None:
+        return None
+    mlflow.log_dict(pipeline.to_dict(), PIPELINE_ARTIFACT)
+    # Servers outside the workflow import the logged module to apply the pipeline
+    mlflow.log_artifact(__file__)
+    return f"runs:/{mlflow.active_run().info.run_id}/{PIPELINE_ARTIFACT}"
+
+
+def load_pipeline(path: str) -> FeaturePipeline:
+    """A pipeline saved as JSON, e.g. a pyfunc model's `feature_pipeline` artifact"""
+    with open(path) as f:
+        return FeaturePipeline.from_dict(json.load(f))
+
+
+def _pickle_by_value():
+    # Executors don't have this module on their path: UDFs carry it with them
+    try:
+        from pyspark import cloudpickle
+        cloudpickle.register_pickle_by_value(sys.modules[__name__])
+    except (ImportError, AttributeError, ValueError):
+        pass
+
+
+_pickle_by_value()
@@ -0,0 +1,111 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Vote Mix Microservice
+# MAGIC Runs on Databricks Serverless, averages a mix of members' predictions (soft vote)
+
+# COMMAND ----------
+
+# Get parameters from orchestrator
+dbutils.widgets.text("workflow_id", "")
+dbutils.widgets.text("task_id", "")
+dbutils.widgets.text("config", "{}")
+dbutils.widgets.text("context", "{}")
+dbutils.widgets.text("catalog", "")
+dbutils.widgets.text("schema", "")
+dbutils.widgets.text("table", "")
+dbutils.widgets.text("target", "")
+dbutils.widgets.text("upstream", "{}")
+dbutils.widgets.text("upstream_runs", "{}")
+
+import json
+import mlflow
+from voting import member_columns, prediction_table, vote, vote_metrics
+
+workflow_id = dbutils.widgets.get("workflow_id")
+task_id = dbutils.widgets.get("task_id")
+config = json.loads(dbutils.widgets.get("config"))
+context = json.loads(dbutils.widgets.get("context"))
+# Results of upstream tasks: passed by the orchestrator (per-task runs, cached
+# results) or resolved from task values inside a compiled workflow job
+upstream = {
+    **json.loads(dbutils.widgets.get("upstream") or "{}"),
+    **json.loads(dbutils.widgets.get("upstream_runs") or "{}"),
+}
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Load Member Predictions
+# MAGIC Members are aligned columns of one table: `vote.table`, or the predictions /
+# MAGIC OOF / blend table of the first upstream task that has one.
+
+# COMMAND ----------
+
+catalog = dbutils.widgets.get("catalog")
+schema = dbutils.widgets.get("schema")
+table = dbutils.widgets.get("table")
+target = dbutils.widgets.get("target")
+
+vote_config = config.get('vote', {})
+method = vote_config.get('method', 'soft')
+input_table = prediction_table(upstream, vote_config)
+predictions = spark.table(input_table)
+members = member_columns(predictions, vote_config.get('columns'), vote_config.get('prefix', 'model_'))
+
+classification = 'classification' in context.get('metric', {})
+
+print(f"Voting over {len(members)} members of {input_table}: {members}")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Vote
+# MAGIC Soft vote by default: the mean of the members' probabilities or predictions.
+
+# COMMAND ----------
+
+mlflow.set_experiment(f"/Experiments/ensemble_{workflow_id}")
+
+with mlflow.start_run(run_name=f"{task_id}_voting") as run:
+    
+    # Log parameters
+    mlflow.log_param("task_id", task_id)
+    mlflow.log_param("workflow_id", workflow_id)
+    mlflow.log_param("input_table", input_table)
+    mlflow.log_param("members", ",".join(members))
+    mlflow.log_param("method", method)
+    
+    voted = vote(
+        predictions,
+        members,
+        method,
+        classification=classification,
+        threshold=float(vote_config.get('threshold', 0.5))
+    )
+    
+    # Written by the executors; nothing is collected to the driver
+    output_table = f"{catalog}.{schema}.votes_{workflow_id}_{task_id}"
+    voted.write.mode("overwrite").saveAsTable(output_table)
+    
+    metrics = vote_metrics(spark.table(output_table), target, classification)
+    mlflow.log_metrics({k: v for k, v in metrics.items() if v is not None})
+    mlflow.log_param("output_table", output_table)
+    
+    print(f"✅ Voting complete. {metrics}")
+    
+    result_metadata = {
+        "predictions_table": output_table,
+        "method": method,
+        "n_members": len(members),
+        "mlflow_run_id": run.info.run_id,
+        **metrics
+    }
+    
+    mlflow.log_dict(result_metadata, "result_metadata.json")
+
+# COMMAND ----------
+
+# Expose the result to downstream tasks of a compiled workflow job
+dbutils.jobs.taskValues.set(key="result", value=result_metadata)
+
+dbutils.notebook.exit(json.dumps(result_metadata))
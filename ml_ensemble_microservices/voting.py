@@ -0,0 +1,230 @@
+"""
+Vectorized voting over member prediction columns.
+
+The vote_* microservices read member predictions as aligned columns of one
+table (OOF tables, blend tables or scoring outputs) and vote with pandas UDFs
+over Arrow batches, so no row ever reaches the driver.
+
+Methods:
+- hard: majority of the members' labels (probabilities are thresholded first;
+  the median of the members for regression)
+- soft: mean of the members' probabilities or predictions
+- weighted: weighted mean, with per-member weights or a per-row weight column
+  holding one weight per member
+"""
+
+import sys
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+VOTE_METHODS = ["hard", "soft", "weighted"]
+
+# Result keys of upstream tasks that point at member prediction tables
+PREDICTION_TABLE_KEYS = ["predictions_table", "oof_table", "blend_table"]
+
+
+def hard_vote(labels: np.ndarray, present: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Majority label of every row of an (n_rows, n_members) label matrix.
+    Ties go to the smallest label. Returns the labels and their vote share.
+
+    Missing members (`present` False, default: null labels) are left out of
+    the count and the share; a row without any member has a NaN share.
+    """
+    if present is None:
+        present = ~pd.isna(labels)
+    classes = np.unique(labels[present])
+    if not len(classes):
+        return np.zeros(len(labels), dtype=labels.dtype), np.full(len(labels), np.nan)
+    counts = ((labels[:, :, None] == classes[None, None, :]) & present[:, :, None]).sum(axis=1)
+    winners = counts.argmax(axis=1)
+    n_present = present.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        share = np.where(n_present > 0, counts[np.arange(len(labels)), winners] / n_present, np.nan)
+    return classes[winners], share
+
+
+def weighted_mean(values: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Row-wise weighted mean of an (n_rows, n_members) matrix; missing members get no weight"""
+    weights = np.where(np.isnan(values), 0.0, np.broadcast_to(weights, values.shape))
+    totals = weights.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(totals > 0, (np.nan_to_num(values) * weights).sum(axis=1) / totals, np.nan)
+
+
+def vote_batch(
+    members: np.ndarray,
+    method: str,
+    classification: bool,
+    is_label: bool,
+    weights: Optional[np.ndarray] = None,
+    threshold: float = 0.5,
+    label_dtype: Optional[str] = None
+) -> pd.DataFrame:
+    """
+    Vote one batch of member predictions.
+
+    Args:
+        members: (n_rows, n_members) labels, probabilities or predictions
+        method: One of VOTE_METHODS
+        classification: Whether members predict classes
+        is_label: Whether members hold labels rather than probabilities
+        weights: (n_members,) or (n_rows, n_members) weights for `weighted`
+        threshold: Probability threshold of the positive class
+        label_dtype: dtype of the member labels; integer labels with nulls
+            arrive as floats and are cast back
+
+    Returns:
+        DataFrame with `vote` and `vote_score` (vote share for hard votes,
+        the combined probability or prediction otherwise)
+    """
+    if is_label:
+        vote, score = hard_vote(members)
+        if label_dtype is not None:
+            vote = vote.astype(label_dtype)
+        return pd.DataFrame({"vote": vote, "vote_score": score})
+
+    values = members.astype(np.float64)
+    if method == "hard" and classification:
+        vote, score = hard_vote((values >= threshold).astype(np.int32), present=~np.isnan(values))
+        return pd.DataFrame({"vote": vote, "vote_score": score})
+    if method == "hard":
+        score = np.nanmedian(values, axis=1)
+    elif method == "weighted":
+        score = weighted_mean(values, weights)
+    else:
+        score = np.nanmean(values, axis=1)
+
+    if classification:
+        return pd.DataFrame({"vote": (score >= threshold).astype(np.int32), "vote_score": score})
+    return pd.DataFrame({"vote": score, "vote_score": score})
+
+
+def member_columns(df, columns: Optional[Sequence[str]] = None, prefix: str = "model_") -> List[str]:
+    """Member prediction columns: the configured ones, else every column starting with `prefix`"""
+    if columns:
+        missing = [c for c in columns if c not in df.columns]
+        if missing:
+            raise ValueError(f"Member columns not found: {missing}")
+        return list(columns)
+
+    found = [c for c in df.columns if c.startswith(prefix)]
+    if not found:
+        raise ValueError(f"No member columns starting with '{prefix}' in {df.columns}")
+    return found
+
+
+def prediction_table(upstream: dict, vote_config: dict) -> str:
+    """The table holding the member predictions: configured or the first upstream result's"""
+    if vote_config.get('table'):
+        return vote_config['table']
+    for result in upstream.values():
+        for key in PREDICTION_TABLE_KEYS:
+            if result and result.get(key):
+                return result[key]
+    raise ValueError("No member predictions: set vote.table or depend on a task that outputs predictions")
+
+
+def vote(
+    df,
+    members: List[str],
+    method: str,
+    classification: bool = True,
+    weight_col: Optional[str] = None,
+    weights: Optional[Sequence[float]] = None,
+    threshold: float = 0.5
+):
+    """
+    Add `vote` and `vote_score` columns to a Spark DataFrame of member predictions.
+
+    Args:
+        df: Spark DataFrame with one column per member
+        members: Member prediction columns
+        method: One of VOTE_METHODS
+        classification: Whether members predict classes
+        weight_col: Array column with one weight per member for every row (`weighted`)
+        weights: Static per-member weights (`weighted`, when there is no weight_col)
+        threshold: Probability threshold of the positive class
+
+    Returns:
+        The DataFrame with the vote columns, evaluated lazily on the executors
+    """
+    from pyspark.sql import functions as F
+    from pyspark.sql.functions import pandas_udf
+    from pyspark.sql.types import BooleanType, DoubleType, FloatType, IntegralType
+
+    if method not in VOTE_METHODS:
+        raise ValueError(f"Unknown vote method '{method}', expected one of {VOTE_METHODS}")
+
+    types = {field.name: field.dataType for field in df.schema.fields}
+    is_label = not all(isinstance(types[c], (DoubleType, FloatType)) for c in members)
+    if is_label and method != "hard":
+        raise ValueError(f"A {method} vote needs probability columns, got labels in {members}")
+
+    # Integer and boolean members with nulls reach the UDF as floats: the
+    # winning labels are cast back to the declared vote type
+    label_dtype = None
+    if is_label:
+        vote_type = types[members[0]].simpleString()
+        if isinstance(types[members[0]], IntegralType):
+            label_dtype = "int64"
+        elif isinstance(types[members[0]], BooleanType):
+            label_dtype = "bool"
+    else:
+        vote_type = "int" if classification else "double"
+    schema = f"vote {vote_type}, vote_score double"
+
+    member_weights = np.asarray(weights if weights is not None else [1.0] * len(members), dtype=np.float64)
+    if len(member_weights) != len(members):
+        raise ValueError(f"{len(member_weights)} weights for {len(members)} members")
+
+    if method == "weighted" and weight_col:
+        @pandas_udf(schema)
+        def vote_udf(batch: pd.DataFrame, row_weights: pd.Series) -> pd.DataFrame:
+            return vote_batch(batch.to_numpy(), method, classification, is_label,
+                              np.stack(row_weights.to_numpy()).astype(np.float64), threshold, label_dtype)
+
+        voted = vote_udf(F.struct(*members), F.col(weight_col))
+    else:
+        @pandas_udf(schema)
+        def vote_udf(batch: pd.DataFrame) -> pd.DataFrame:
+            return vote_batch(batch.to_numpy(), method, classification, is_label, member_weights, threshold,
+                              label_dtype)
+
+        voted = vote_udf(F.struct(*members))
+
+    return (df.withColumn("_vote", voted)
+              .withColumn("vote", F.col("_vote.vote"))
+              .withColumn("vote_score", F.col("_vote.vote_score"))
+              .drop("_vote"))
+
+
+def vote_metrics(voted, target: Optional[str], classification: bool = True) -> dict:
+    """Row count and, with a target column, vote quality; aggregated on the executors"""
+    from pyspark.sql import functions as F
+
+    aggregates = [F.count(F.lit(1)).alias("rows")]
+    if target and target in voted.columns:
+        if classification:
+            aggregates.append(F.avg((F.col("vote") == F.col(target)).cast("double")).alias("vote_accuracy"))
+        else:
+            error = F.col("vote") - F.col(target)
+            aggregates.append(F.sqrt(F.avg(error * error)).alias("vote_rmse"))
+            aggregates.append(F.avg(F.abs(error)).alias("vote_mae"))
+
+    row = voted.agg(*aggregates).first()
+    return {key: (float(value) if value is not None else None) for key, value in row.asDict().items()}
+
+
+def _pickle_by_value():
+    # Executors don't have this module on their path: UDFs carry it with them
+    try:
+        from pyspark import cloudpickle
+        cloudpickle.register_pickle_by_value(sys.modules[__name__])
+    except (ImportError, AttributeError, ValueError):
+        pass
+
+
+_pickle_by_value()